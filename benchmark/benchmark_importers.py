@@ -0,0 +1,225 @@
+import argparse
+import csv
+import gc
+import importlib
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+# the progress bars would dominate the output, tqdm reads its defaults when imported
+os.environ.setdefault("TQDM_DISABLE", "1")
+
+from util.fake_driver import FakeDriver
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] %(levelname)s - %(message)s',
+    datefmt='%H:%M:%S'
+)
+
+ROOT = Path(__file__).resolve().parent.parent
+for module_dir in ["md02/importer", "md03/importer", "md04/importer"]:
+    sys.path.insert(0, str(ROOT / module_dir))
+
+FIRST_NAMES = ["JOHN", "MARY", "ROBERT", "PATRICIA", "MICHAEL", "LINDA", "DAVID", "SUSAN", "JAMES", "KAREN"]
+LAST_NAMES = ["SMITH", "JOHNSON", "WILLIAMS", "BROWN", "JONES", "GARCIA", "MILLER", "DAVIS", "LOPEZ", "WILSON"]
+STREETS = ["N CLARK ST", "W MADISON ST", "S STATE ST", "N HALSTED ST", "W DIVISION ST", "E 63RD ST"]
+COMPANY_WORDS = ["ACME", "WINDY", "CITY", "LAKE", "SHORE", "PRAIRIE", "LOOP", "NORTH", "BUILDERS", "FOODS"]
+SUFFIXES = ["INC", "LLC", "CORP", "CO", "LTD"]
+
+# answers to the read queries of the importers, so that every stage has rows to process offline
+RESPONDERS = [
+    (r"RETURN n\.pk as pk", lambda p: [{"pk": 3000000 + i} for i in range(p.get("size", 0))]),
+    (r"RETURN n\.id as id", lambda p: [{"id": i} for i in range(p.get("size", 0))]),
+    (r"RETURN DISTINCT n\.clusterId as id", lambda p: [{"id": i} for i in range(p.get("size", 0) // 3)]),
+    (r"RETURN COUNT\(DISTINCT n\.clusterId\) as rows", lambda p: [{"rows": p.get("size", 0) // 3}]),
+    (r"RETURN COUNT \(\*\) as rows", lambda p: [{"rows": p.get("size", 0)}]),
+    (r"RETURN count\(distinct rel\) AS n_rels", lambda p: [{"n_rels": 0}]),
+    (r"SHOW PROCEDURES", lambda p: [{"name": "n10s.graphconfig.init"}]),
+    (r"CALL db\.cdc\.(current|earliest)", lambda p: [{"id": "cursor"}]),
+]
+
+# module, class, stage method, input
+STAGES = [
+    ("import_chi_people", "ChicagoPeopleImporter", "import_people_records", "owners"),
+    ("import_chi_licenses", "ChicagoLicensesImporter", "import_license_records", "licenses"),
+    ("import_chi_licenses", "ChicagoLicensesImporter", "import_license_type", "licenses"),
+    ("import_chi_licenses", "ChicagoLicensesImporter", "connect_license_to_type", "licenses"),
+    ("import_chi_licenses", "ChicagoLicensesImporter", "import_address", "licenses"),
+    ("import_chi_licenses", "ChicagoLicensesImporter", "import_organization", "licenses"),
+    ("import_chi_licenses", "ChicagoLicensesImporter", "connect_org_to_license", "licenses"),
+    ("import_chi_licenses", "ChicagoLicensesImporter", "connect_people_to_org", "licenses"),
+    ("import_chi_licenses", "ChicagoLicensesImporter", "import_licenses", "licenses"),
+    ("import_chi_contracts", "ChicagoContractsImporter", "import_contract_records", "contracts"),
+    ("import_chi_contracts", "ChicagoContractsImporter", "merge_vendors_and_orders", "contracts"),
+    ("import_chi_contracts", "ChicagoContractsImporter", "merge_vendor_addresses", "contracts"),
+    ("import_chi_contracts", "ChicagoContractsImporter", "merge_vendors", "contracts"),
+    ("import_chi_contracts", "ChicagoContractsImporter", "merge_procurement_types", "contracts"),
+    ("import_chi_contracts", "ChicagoContractsImporter", "merge_departments_contract_types", "contracts"),
+    ("import_chi_contracts", "ChicagoContractsImporter", "import_contracts", "contracts"),
+    ("import_chi_people_cluster", "ChicagoPeopleSimilarity", "create_people_similarity", None),
+    ("import_chi_people_cluster", "ChicagoPeopleSimilarity", "create_connections_to_clusters", None),
+    ("import_chi_people_cluster", "ChicagoPeopleSimilarity", "create_final_names_of_clusters", None),
+    ("import_chi_orgs_cluster", "ChicagoOrgsSimilarity", "create_org_similarity_by_address", None),
+    ("import_chi_orgs_cluster", "ChicagoOrgsSimilarity", "create_connections_to_clusters", None),
+    ("import_chi_orgs_cluster", "ChicagoOrgsSimilarity", "create_final_names_of_clusters", None),
+    ("import_rac_diaries", "RacDiariesImporter", "import_diaries", "diaries"),
+    ("import_rac_gpt", "RacFullKG", "store_to_neo4j", "gpt"),
+    ("import_rac_gpt", "RacFullKG", "normalize_entities", None),
+    ("import_rac_gpt", "RacFullKG", "resolve_entities", None),
+    ("import_rac_gpt", "RacFullKG", "create_kg", None),
+    ("import_rac_gds", "RacGds", "run_gds", None),
+    ("import_hpo", "HPOImporter", "set_constraints", None),
+    ("import_hpo", "HPOImporter", "label_HPO_entities", None),
+    ("import_hpo", "HPOImporter", "create_disease_entities", None),
+    ("import_hpo", "HPOImporter", "create_rels_features_diseases", None),
+    ("import_hpo", "HPOImporter", "add_base_properties_to_rels", None),
+    ("import_hpo", "HPOImporter", "enrich_with_descriptive_properties", None),
+    ("import_hpo", "HPOImporter", "remove_unused_node", None),
+]
+
+
+def company_name(rnd):
+    return " ".join(rnd.sample(COMPANY_WORDS, rnd.randint(1, 3))) + " " + rnd.choice(SUFFIXES)
+
+
+def write_csv(path, header, rows):
+    with path.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return path
+
+
+def generate_inputs(folder: Path, size: int, seed: int = 42):
+    rnd = random.Random(seed)
+    accounts = max(1, size // 4)
+    owners = write_csv(folder / f"owners_{size}.csv",
+                       ["Account Number", "Legal Name", "Owner First Name", "Owner Middle Initial",
+                        "Owner Last Name", "Suffix", "Legal Entity Owner", "Title"],
+                       [[rnd.randrange(accounts), company_name(rnd), rnd.choice(FIRST_NAMES),
+                         rnd.choice(["", "A", "B", "J"]), rnd.choice(LAST_NAMES), "", "",
+                         rnd.choice(["PRESIDENT", "SECRETARY", "OTHER"])] for _ in range(size)])
+    licenses = write_csv(folder / f"licenses_{size}.csv",
+                         ["LICENSE ID", "ACCOUNT NUMBER", "SITE NUMBER", "LEGAL NAME", "DOING BUSINESS AS NAME",
+                          "ADDRESS", "CITY", "STATE", "ZIP CODE", "LICENSE CODE", "LICENSE DESCRIPTION",
+                          "LICENSE NUMBER", "APPLICATION TYPE", "LICENSE TERM START DATE",
+                          "LICENSE TERM EXPIRATION DATE", "LICENSE STATUS", "LATITUDE", "LONGITUDE"],
+                         [[i, rnd.randrange(accounts), rnd.randint(1, 3), company_name(rnd),
+                           rnd.choice(["", company_name(rnd)]),
+                           f"{rnd.randint(1, 9999)} {rnd.choice(STREETS)}", "CHICAGO", "IL",
+                           rnd.choice(["60601", "60602", "60614", ""]), code, f"LICENSE {code}",
+                           rnd.randrange(10 ** 7), "RENEW", "01/01/2023", "12/31/2024", "AAI",
+                           41.8 + rnd.random() / 10, -87.6 - rnd.random() / 10]
+                          for i, code in ((i, rnd.randint(1000, 1300)) for i in range(size))])
+    contracts = write_csv(folder / f"contracts_{size}.csv",
+                          ["Purchase Order Description", "Purchase Order (Contract) Number", "Revision Number",
+                           "Specification Number", "Contract Type", "Start Date", "End Date", "Approval Date",
+                           "Department", "Vendor Name", "Vendor ID", "Address 1", "Address 2", "City", "State",
+                           "Zip", "Award Amount", "Procurement Type", "Contract PDF"],
+                          [[f"SERVICES {rnd.randrange(500)}", rnd.randrange(max(1, size // 2)), 0,
+                            rnd.randrange(10 ** 6), rnd.choice(["DELEGATE AGENCY", "COMMODITIES", ""]),
+                            "01/01/2023", "12/31/2024", "12/01/2022",
+                            rnd.choice(["DEPT OF FINANCE", "DEPT OF AVIATION", "CHICAGO PUBLIC LIBRARY"]),
+                            company_name(rnd), rnd.randrange(accounts), f"{rnd.randint(1, 9999)} {rnd.choice(STREETS)}",
+                            "", "CHICAGO", "IL", rnd.choice(["60601", "60602"]), rnd.randint(1000, 10 ** 6),
+                            rnd.choice(["BID", "RFP", ""]), ""] for _ in range(size)])
+
+    pages = json.load((ROOT / "dataset/rac/ww_1939.json").open())
+    diaries = folder / f"diaries_{size}.json"
+    with diaries.open("w", encoding="utf-8") as f:
+        json.dump([{**pages[i % len(pages)], "id": f"Warren Weaver_Diary_{i // len(pages)}_{i}"}
+                   for i in range(size)], f)
+    return {"owners": owners, "licenses": licenses, "contracts": contracts, "diaries": diaries}
+
+
+def gpt_arguments(importer):
+    output = (ROOT / "dataset/rac/gpt_prompt_example_output.txt").read_text()
+    parsed = importer.parse_gpt_output(output)
+    return [0, parsed['entities'], parsed['relations'], "run 1"]
+
+
+def make_importer(module, class_name, driver):
+    importer_class = getattr(importlib.import_module(module), class_name)
+    # swap the driver before __init__ runs, some importers use it in their constructor
+    offline_class = type(class_name, (importer_class,), {"create_driver": lambda self, *args: driver})
+    return offline_class(argv=[])
+
+
+def run_stage(stage, inputs, size, driver, with_memory):
+    module, class_name, method, input_name = stage
+    importer = make_importer(module, class_name, driver)
+    if input_name == "gpt":
+        arguments = gpt_arguments(importer)
+    elif input_name:
+        arguments = [inputs[input_name]]
+    else:
+        arguments = []
+
+    gc.collect()
+    driver.reset_stats()
+    if with_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    getattr(importer, method)(*arguments)
+    elapsed = time.perf_counter() - start
+    peak = 0
+    if with_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    rows = driver.total_rows()
+    importer.close()
+    return {"module": module, "stage": method, "size": size, "rows": rows, "queries": sum(
+        stats["runs"] for stats in driver.queries.values()), "seconds": elapsed,
+            "rows_per_second": rows / elapsed if elapsed > 0 else 0.0, "peak_mib": peak / 2 ** 20}
+
+
+def make_driver(size, replay_file=None):
+    return FakeDriver(replay_file=replay_file,
+                      responders=[(pattern, lambda p, answer=answer: answer({**p, "size": size}))
+                                  for pattern, answer in RESPONDERS])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the client side of the importers on a fake driver.")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma separated number of input rows")
+    parser.add_argument("--stages", default="", help="optional comma separated stage (method) names to run")
+    parser.add_argument("--replay", default=None, help="optional query log recorded with --record-queries")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak memory pass")
+    parser.add_argument("--output", default=None, help="optional JSON file for the results")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    selected = set(filter(None, args.stages.split(",")))
+    stages = [stage for stage in STAGES if not selected or stage[2] in selected]
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            inputs = generate_inputs(Path(folder), size)
+            for stage in stages:
+                driver = make_driver(size, args.replay)
+                try:
+                    result = run_stage(stage, inputs, size, driver, with_memory=False)
+                    if not args.no_memory:
+                        result["peak_mib"] = run_stage(stage, inputs, size, driver, with_memory=True)["peak_mib"]
+                except ImportError as e:
+                    logging.warning(f"Skipping {stage[0]}.{stage[2]}: {e}")
+                    continue
+                results.append(result)
+                print(f"{result['module']:<28} {result['stage']:<36} {size:>8} {result['rows']:>9} "
+                      f"{result['seconds']:>8.2f}s {result['rows_per_second']:>12.0f} rows/s "
+                      f"{result['peak_mib']:>8.1f} MiB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
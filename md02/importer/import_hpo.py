@@ -1,9 +1,8 @@
 import sys
 import logging
 
-from neo4j.exceptions import ClientError as Neo4jClientError
-
 from util.base_importer import BaseImporter
+from util.schema_manager import range_index, unique
 
 logging.basicConfig(
     level=logging.INFO,
@@ -11,6 +10,13 @@ logging.basicConfig(
     datefmt='%H:%M:%S'
 )
 
+# n10s requires the n10s_unique_uri constraint on Resource.uri
+SCHEMA = [unique("Resource", "uri", name="n10s_unique_uri"),
+          unique("Resource", "id"),
+          range_index("Disease", "id", name="disease_id"),
+          range_index("Hpo", "id", name="hpo_id")]
+
+
 class HPOImporter(BaseImporter):
 
     def __init__(self, argv):
@@ -19,18 +25,7 @@ class HPOImporter(BaseImporter):
             session.run(f"CREATE DATABASE {self.database} IF NOT EXISTS")
 
     def set_constraints(self):
-        queries = ["CREATE CONSTRAINT n10s_unique_uri FOR (r:Resource) REQUIRE r.uri IS UNIQUE;",
-                   "CREATE CONSTRAINT IF NOT EXISTS FOR (n:Resource) REQUIRE (n.id) IS UNIQUE;",
-                   "CREATE INDEX disease_id FOR (n:Disease) ON (n.id);",
-                   "CREATE INDEX hpo_id FOR (n:Hpo) ON (n.id);"]
-        with self._driver.session(database=self.database) as session:
-            for q in queries:
-                try:
-                    session.run(q)
-                except Neo4jClientError as e:
-                    # ignore if we already have the rule in place
-                    if e.code != "Neo.ClientError.Schema.EquivalentSchemaRuleAlreadyExists":
-                        raise e
+        self.apply_schema(SCHEMA)
 
     def check_neo_semantics(self):
         query = 'SHOW PROCEDURES YIELD name WHERE name ="n10s.graphconfig.init"'
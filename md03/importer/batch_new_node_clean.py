@@ -17,6 +17,16 @@ class BatchProcessCleaner(BaseImporter):
             # Remove new nodes
             session.run("""MATCH (n:PersonRecord) WHERE n.newNode is NOT NULL DETACH DELETE n""")
 
+            # Give back their cluster to the records moved by an incremental merge
+            session.run("""
+                        MATCH (r:PersonRecord)-[rel:RECORD_RESOLVED_TO]->(p:Person)
+                        WHERE r.oldComponentId IS NOT NULL AND r.oldComponentId <> p.clusterId
+                        MERGE (old:Person {clusterId: r.oldComponentId})
+                        SET old.newCluster = true
+                        MERGE (r)-[:RECORD_RESOLVED_TO]->(old)
+                        DELETE rel
+                        """)
+
             # Restore original information of record connected to the new cluster
             session.run("""
                         MATCH (p:Person)<-[:RECORD_RESOLVED_TO]-(r:PersonRecord)
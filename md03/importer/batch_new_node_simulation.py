@@ -2,11 +2,11 @@ import logging
 import sys
 import time
 from pathlib import Path
-from datetime import datetime
 
 from util.base_importer import BaseImporter
 from import_chi_people import ChicagoPeopleImporter
 from import_chi_people_cluster import ChicagoPeopleSimilarity
+from import_chi_people_incremental import ChicagoIncrementalPeopleResolver
 from cdc_service import CDCService
 
 logging.basicConfig(
@@ -17,18 +17,30 @@ logging.basicConfig(
 
 class BatchProcessSimulator(BaseImporter):
     """
-    This currently works with updates that affect a single cluster.
+    Simulate the resolution of a batch of new person records caught by CDC
+      resolve_incrementally merges the batch into the existing clusters, however many clusters it connects.
+      The former steps (mark_affected_nodes, remove_resolved_nodes, resolve_new_records) recompute WCC on every
+      record of the affected clusters and only work with updates that affect a single cluster.
     """
     def __init__(self, argv):
         super().__init__(command=__file__, argv=argv)
-        self.cpi = ChicagoPeopleImporter(argv=sys.argv[1:])
-        self.cps = ChicagoPeopleSimilarity(argv=sys.argv[1:])
+        self.argv = argv
+        self.cpi = ChicagoPeopleImporter(argv=self.argv)
+        self.cps = ChicagoPeopleSimilarity(argv=self.argv)
+        self.resolver = ChicagoIncrementalPeopleResolver(argv=self.argv)
         self.record_ids = []
+        self.cdc = None
     
     def enable_cdc(self):
         enable_cdc_query = """ALTER DATABASE {db} SET OPTION txLogEnrichment 'FULL'""".format(db=self.database)
         with self._driver.session(database=self.database) as session:
             session.run(enable_cdc_query)
+        # The records created and the similarities found are filtered by the server
+        selectors = [
+            {'select': 'n', 'operation': 'c', 'labels': ['PersonRecord']},
+            {'select': 'r', 'operation': 'c', 'type': 'IS_SIMILAR_TO'}
+        ]
+        self.cdc = CDCService(self.argv, selectors)
 
     def disable_cdc(self):
         disable_cdc_query = """ALTER DATABASE {db} SET OPTION txLogEnrichment 'OFF'""".format(db=self.database)
@@ -36,7 +48,7 @@ class BatchProcessSimulator(BaseImporter):
             session.run(disable_cdc_query)
     
     def import_batch(self):
-        cpi = ChicagoPeopleImporter(argv=sys.argv[1:])
+        cpi = ChicagoPeopleImporter(argv=self.argv)
         base_path = cpi.source_dataset_path
         if not base_path:
             print("source path directory is mandatory. Setting it to default.")
@@ -57,10 +69,8 @@ class BatchProcessSimulator(BaseImporter):
         cpi.import_people_records(owners_dat)
         cpi.close()
     
-    def catch_update(self, current_time):
-        selectors = []
-        cdc = CDCService(selectors)
-        return cdc.detect_change(current_time)
+    def catch_update(self):
+        return self.cdc.read_changes()
     
     def apply_changes(self, updated=None, operation=None):
         if operation is None:
@@ -73,12 +83,21 @@ class BatchProcessSimulator(BaseImporter):
             self.remove_resolved_nodes(updated)
         elif operation == "APPLY_NEW_RESOLUTION":
             self.resolve_new_records()
+        elif operation == "RESOLVE_INCREMENTALLY":
+            self.resolve_incrementally(updated)
     
     def process_new_nodes(self, updated):
         events = [i['event'] for i in updated]
         new_nodes = [i["elementId"] for i in events]
-        
+        with self._driver.session(database=self.database) as session:
+            # Flag the batch so that clean_updates can remove it
+            session.run("MATCH (n:PersonRecord) WHERE elementId(n) in $new_nodes SET n.newNode = True",
+                        {"new_nodes": new_nodes})
+
         self.cps.create_people_similarity(new_nodes)
+
+    def resolve_incrementally(self, updated):
+        self.resolver.resolve(updated)
     
     def mark_affected_nodes(self, updated):
         events = [i['event'] for i in updated]
@@ -118,23 +137,29 @@ class BatchProcessSimulator(BaseImporter):
             session.run('MATCH (n:PersonRecord)-[:RECORD_RESOLVED_TO]->(p:Person) WHERE elementId(n) in $affected DETACH DELETE p', {"affected": affected})
 
     def resolve_new_records(self):
-        self.cps.project_wcc_graph(node_label='Affected')
-        
+        project_query = """
+        CALL gds.graph.project(
+            $graph_name,
+            ['Affected'],
+            ['IS_SIMILAR_TO']
+        ) 
+        YIELD graphName, nodeCount, relationshipCount
+        RETURN graphName, nodeCount, relationshipCount
+        """
+
         # Run new WCC
         new_wcc_query = """
         WITH apoc.date.currentTimestamp() as timestamp
-        CALL gds.wcc.stream('personWcc', {})
+        CALL gds.wcc.stream($graph_name, {})
         YIELD nodeId, componentId
 
         WITH gds.util.asNode(nodeId) as n, componentId AS componentId, timestamp
         WITH n, apoc.text.join([toString(componentId), toString(timestamp)], "_") as component
         SET n.componentId = component
         """
-        with self._driver.session(database=self.database) as session:
-            session.run(new_wcc_query)
-        
-        # Delete projection
-        self.cps.delete_wcc_projection()
+        with self.gds_projection('personWcc', project_query) as graph:
+            with self._driver.session(database=self.database) as session:
+                session.run(new_wcc_query, {"graph_name": graph.graph_name}).consume()
         
         # Create Person nodes, create connections, remove affected
         resolved_query = """
@@ -169,6 +194,16 @@ class BatchProcessSimulator(BaseImporter):
             # Remove new nodes
             session.run("""MATCH (n:PersonRecord) WHERE n.newNode is NOT NULL DETACH DELETE n""")
 
+            # Give back their cluster to the records moved by an incremental merge
+            session.run("""
+                        MATCH (r:PersonRecord)-[rel:RECORD_RESOLVED_TO]->(p:Person)
+                        WHERE r.oldComponentId IS NOT NULL AND r.oldComponentId <> p.clusterId
+                        MERGE (old:Person {clusterId: r.oldComponentId})
+                        SET old.newCluster = true
+                        MERGE (r)-[:RECORD_RESOLVED_TO]->(old)
+                        DELETE rel
+                        """)
+
             # Restore original information of record connected to the new cluster
             session.run("""
                         MATCH (p:Person)<-[:RECORD_RESOLVED_TO]-(r:PersonRecord)
@@ -196,33 +231,19 @@ if __name__ == '__main__':
     simulator.enable_cdc()
     time.sleep(1)
 
-    current_time = datetime.utcnow().isoformat()
-
     # Step 1 - Import
     logging.info("Step 1 - Importing records...")
     simulator.import_batch()
 
     # Step 2 - Create similarities
     logging.info("Step 2 - Detecting similarity between records...")
-    catched_nodes = simulator.catch_update(current_time)
-    current_time = datetime.utcnow().isoformat()
+    catched_nodes = simulator.catch_update()
     simulator.apply_changes(catched_nodes, "PROCESS_NEW_NODES")
 
-    # Step 3 - Mark affected nodes
-    logging.info("Step 3 - Marking affected records...")
-    catched_affected_nodes = simulator.catch_update(current_time)
-    current_time = datetime.utcnow().isoformat()
-    simulator.apply_changes(catched_affected_nodes, "MARK_AFFECTED_NODES")
-    
-    # Step 4 - Remove resolved entities
-    logging.info("Step 4 - Removing resolved nodes touched by the affected ones...")
-    catched_labeled_nodes = simulator.catch_update(current_time)
-    current_time = datetime.utcnow().isoformat()
-    simulator.apply_changes(catched_labeled_nodes, "REMOVE_RESOLVED_NODES")
-
-    # Step 5 - Resolve new entities
-    logging.info("Step 5 - Resolving new Person nodes...")
-    simulator.apply_changes(operation="APPLY_NEW_RESOLUTION")
+    # Step 3 - Resolve the new records and the clusters they connect
+    logging.info("Step 3 - Resolving new records into the existing Person nodes...")
+    catched_similarities = simulator.catch_update()
+    simulator.apply_changes(catched_nodes + catched_similarities, "RESOLVE_INCREMENTALLY")
 
     time.sleep(1)
     logging.info("Disabling CDC...")
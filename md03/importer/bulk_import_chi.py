@@ -0,0 +1,103 @@
+import sys
+import logging
+import subprocess
+from pathlib import Path
+
+from util.base_importer import BaseImporter
+from util.bulk_export import BulkExport
+from util.row_source import CsvRowSource
+from chi_schema import SCHEMA
+from import_chi_people import ChicagoPeopleImporter
+from import_chi_licenses import ChicagoLicensesImporter
+from import_chi_contracts import ChicagoContractsImporter
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] %(levelname)s - %(message)s',
+    datefmt='%H:%M:%S'
+)
+
+BULK_OPTIONS = ['bulk-dir=', 'bulk-step=', 'neo4j-admin=']
+
+
+class ChicagoBulkImporter(BaseImporter):
+    """
+    Rebuild the Chicago graph from scratch with neo4j-admin instead of transactional MERGEs
+      - export: write the nodes and relationships of the people, licenses and contracts importers as csv files
+      - import: run `neo4j-admin database import full` on them, the database must be stopped
+      - constraints: create the importers' constraints and indexes once the database is started again
+      - connect: connect the people to their organizations, once the person clusters are computed
+    """
+
+    def __init__(self, argv):
+        super().__init__(command=__file__, argv=argv, extended_long_options=BULK_OPTIONS)
+        self.bulk_dir = Path(self.get_option(['--bulk-dir'], 'bulk'))
+        self.steps = self.get_option(['--bulk-step'], 'export,import').split(',')
+        self.neo4j_admin = self.get_option(['--neo4j-admin'], 'neo4j-admin')
+        importer_argv = self.strip_options(argv, BULK_OPTIONS)
+        self.importers = [ChicagoPeopleImporter(argv=importer_argv),
+                          ChicagoLicensesImporter(argv=importer_argv),
+                          ChicagoContractsImporter(argv=importer_argv)]
+
+    def export(self, owners_file, licenses_file, contracts_file):
+        people, licenses, contracts = self.importers
+        bulk = BulkExport(self.bulk_dir)
+        logging.info("Exporting people records...")
+        people.export_people_records(owners_file, bulk)
+        logging.info("Exporting licenses...")
+        licenses.export_licenses(licenses_file, bulk)
+        logging.info("Exporting contracts...")
+        contracts.export_contracts(contracts_file, bulk)
+        args = bulk.close()
+        logging.info(f"Wrote {len(args) - 2} node and relationship groups to {self.bulk_dir}")
+
+    def bulk_import(self):
+        command = [self.neo4j_admin, "database", "import", "full", self.database, "--overwrite-destination",
+                   f"@{(self.bulk_dir / 'import.args').resolve()}"]
+        logging.info(" ".join(command))
+        subprocess.run(command, check=True)
+
+    def set_constraints(self):
+        self.apply_schema(SCHEMA)
+
+    def close(self):
+        for importer in self.importers:
+            importer.close()
+        super().close()
+
+
+if __name__ == '__main__':
+    importing = ChicagoBulkImporter(argv=sys.argv[1:])
+    base_path = importing.source_dataset_path
+
+    if not base_path:
+        print("source path directory is mandatory. Setting it to default.")
+        base_path = "../dataset/chicago/"
+
+    base_path = Path(base_path)
+
+    if not base_path.is_dir():
+        print(base_path, "isn't a directory")
+        sys.exit(1)
+
+    owners_dat = CsvRowSource.resolve(base_path / "Business_Owners_20240103.csv")
+    licenses_dat = CsvRowSource.resolve(base_path / "Business_Licenses_20240103.csv")
+    contracts_dat = CsvRowSource.resolve(base_path / "Contracts_20240103.csv")
+
+    for dat in [owners_dat, licenses_dat, contracts_dat]:
+        if not dat.is_file():
+            print(dat, "doesn't exist in ", base_path)
+            sys.exit(1)
+
+    if "export" in importing.steps:
+        importing.export(owners_dat, licenses_dat, contracts_dat)
+    if "import" in importing.steps:
+        logging.info("Importing the bulk files...")
+        importing.bulk_import()
+    if "constraints" in importing.steps:
+        logging.info("Setting constraints...")
+        importing.set_constraints()
+    if "connect" in importing.steps:
+        logging.info("Connecting people to organizations...")
+        importing.importers[1].connect_people_to_org(licenses_dat)
+    importing.close()
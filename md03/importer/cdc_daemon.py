@@ -0,0 +1,116 @@
+import sys
+import signal
+import logging
+from threading import Event
+
+from util.base_importer import BaseImporter
+from util.cdc_dispatcher import ChangeDispatcher
+from cdc_service import CDCService, CDC_OPTIONS
+from batch_new_node_simulation import BatchProcessSimulator
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] %(levelname)s - %(message)s',
+    datefmt='%H:%M:%S'
+)
+
+DAEMON_OPTIONS = ['batch-size=', 'batch-window=', 'max-pending=', 'resolution=']
+# the daemon writes the metrics of all the handlers, not the importers it drives
+IMPORTER_OPTIONS = ['metrics-json=', 'metrics-prom=']
+
+
+def created_records(change):
+    event = change["event"]
+    return event.get("eventType") == "n" and event.get("operation") == "c" and \
+        "PersonRecord" in (event.get("labels") or [])
+
+
+def created_similarities(change):
+    event = change["event"]
+    return event.get("eventType") == "r" and event.get("operation") == "c" and event.get("type") == "IS_SIMILAR_TO"
+
+
+def affected_records(change):
+    event = change["event"]
+    if event.get("eventType") != "n" or event.get("operation") != "u":
+        return False
+    state = event.get("state") or {}
+    before = (state.get("before") or {}).get("labels") or []
+    after = (state.get("after") or {}).get("labels") or []
+    return "Affected" in after and "Affected" not in before
+
+
+class ChicagoCdcDaemon(BaseImporter):
+    """
+    Resolve the person records as they are created, driven by CDC
+      The changes are grouped in micro-batches (--batch-size changes or --batch-window seconds) and dispatched to
+      the handlers of the simulation, each one on its own thread. With --resolution=incremental (default) the new
+      records get their similarities (process_new_nodes) and are merged into the existing clusters as the
+      IS_SIMILAR_TO relationships show up (resolve_incrementally). The records without any similar one get
+      their own cluster right after their similarity pass, so a record is never made a singleton Person before
+      its relationships are resolved. With --resolution=affected the clusters touched are recomputed instead:
+      mark_affected_nodes, then remove_resolved_nodes and resolve_new_records.
+      At most --max-pending batches are in flight, the cursor is saved with --cdc-checkpoint and the metrics
+      (lag_seconds per handler) are exported after every batch.
+    """
+
+    def __init__(self, argv):
+        super().__init__(command=__file__, argv=argv, extended_long_options=DAEMON_OPTIONS + CDC_OPTIONS)
+        self.resolution = self.get_option(['--resolution'], 'incremental')
+        if self.resolution not in ('incremental', 'affected'):
+            raise ValueError(f"Unknown resolution {self.resolution}")
+        selectors = [
+            {'select': 'n', 'operation': 'c', 'labels': ['PersonRecord']},
+            {'select': 'r', 'operation': 'c', 'type': 'IS_SIMILAR_TO'}
+        ]
+        if self.resolution == 'affected':
+            selectors.append({'select': 'n', 'operation': 'u', 'labels': ['Affected']})
+        cdc_argv = self.strip_options(argv, DAEMON_OPTIONS + IMPORTER_OPTIONS)
+        importer_argv = self.strip_options(cdc_argv, CDC_OPTIONS)
+        self.cdc = CDCService(cdc_argv, selectors)
+        self.simulator = BatchProcessSimulator(argv=importer_argv)
+        self.dispatcher = ChangeDispatcher(self.cdc, self.metrics,
+                                           batch_size=int(self.get_option(['--batch-size'], 500)),
+                                           batch_window=float(self.get_option(['--batch-window'], 1.0)),
+                                           max_pending=int(self.get_option(['--max-pending'], 4)),
+                                           on_commit=lambda cursor: self.export_metrics())
+        if self.resolution == 'incremental':
+            self.dispatcher.register("process_new_nodes", self.process_new_records, accept=created_records)
+            self.dispatcher.register("resolve_incrementally", self.simulator.resolve_incrementally,
+                                     accept=created_similarities)
+        else:
+            self.dispatcher.register("process_new_nodes", self.simulator.process_new_nodes, accept=created_records)
+            self.dispatcher.register("mark_affected_nodes", self.simulator.mark_affected_nodes,
+                                     accept=created_similarities)
+            self.dispatcher.register("remove_resolved_nodes", self.resolve_affected_nodes, accept=affected_records)
+
+    def process_new_records(self, created):
+        self.simulator.process_new_nodes(created)
+        unmatched = self.simulator.resolver.unmatched_changes(created)
+        if unmatched:
+            self.simulator.resolve_incrementally(unmatched)
+
+    def resolve_affected_nodes(self, updated):
+        self.simulator.remove_resolved_nodes(updated)
+        self.simulator.resolve_new_records()
+
+    def run(self, stop=None):
+        self.dispatcher.run(stop)
+
+    def close(self):
+        self.simulator.close()
+        self.cdc.close()
+        super().close()
+
+
+if __name__ == '__main__':
+    daemon = ChicagoCdcDaemon(argv=sys.argv[1:])
+    stop = Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    logging.info("Waiting for changes...")
+    try:
+        daemon.run(stop)
+    except KeyboardInterrupt:
+        stop.set()
+    finally:
+        daemon.close()
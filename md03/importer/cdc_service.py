@@ -1,9 +1,11 @@
+import sys
 import logging
 import json
 import time
 from threading import Thread
 
 from util.base_importer import BaseImporter
+from util.checkpoint import CursorCheckpoint
 
 logging.basicConfig(
     level=logging.INFO,
@@ -11,11 +13,36 @@ logging.basicConfig(
     datefmt='%H:%M:%S'
 )
 
+CDC_OPTIONS = ['cdc-checkpoint=', 'cdc-page-size=', 'cdc-from=']
+
+
 class CDCService(BaseImporter):
-    def __init__(self, argv):
-        super().__init__(command=__file__, argv=argv)
-        self.cursor = self.current_change_id()
-        self.selectors = []
+    """
+    Tail the CDC change log from a cursor
+      Every query starts from the id of the last change processed, so its cost follows the new changes, not the
+      size of the log. The selectors are evaluated by the server and the changes are read in pages of at most
+      --cdc-page-size. The cursor only moves past a page once it has been processed, and with --cdc-checkpoint
+      it is saved to a file, so a restarted service resumes where it stopped instead of replaying the log.
+      Without a saved cursor it starts from the current change (--cdc-from=current) or the earliest one
+      (--cdc-from=earliest).
+    """
+
+    def __init__(self, argv, selectors=None):
+        """
+        :param argv: the command line options
+        :param selectors: optional CDC selectors, see https://neo4j.com/docs/cdc/current/procedures/selectors/
+        """
+        super().__init__(command=__file__, argv=argv, extended_long_options=CDC_OPTIONS)
+        self.selectors = selectors or []
+        self.page_size = int(self.get_option(['--cdc-page-size'], 1000))
+        checkpoint_file = self.get_option(['--cdc-checkpoint'])
+        self.cursor_checkpoint = CursorCheckpoint(checkpoint_file) if checkpoint_file else None
+        self.cursor = self.cursor_checkpoint.load(self.database) if self.cursor_checkpoint else None
+        if self.cursor is None:
+            if self.get_option(['--cdc-from'], 'current') == 'earliest':
+                self.cursor = self.earliest_change_id()
+            else:
+                self.cursor = self.current_change_id()
 
     def apply_change(self, record):
         record_dict = {
@@ -23,7 +50,7 @@ class CDCService(BaseImporter):
             for k in ('id', 'txId', 'seq', 'event', 'metadata')
         }
         return record_dict
-    
+
     def apply_change_test(self, record):
         record_dict = {
             k: record.get(k)
@@ -32,13 +59,54 @@ class CDCService(BaseImporter):
         print(json.dumps(record_dict, indent=2, default=repr))
         return record_dict
 
-    def query_changes(self):
+    def fetch_page(self, cursor=None):
+        """
+        :param cursor: optional change id to read from, the cursor by default
+        :return: at most page_size changes following it, the cursor doesn't move
+        """
+        page_query = """
+        CALL db.cdc.query($cursor, $selectors)
+        YIELD id, txId, seq, event, metadata
+        RETURN id, txId, seq, event, metadata
+        LIMIT $page_size
+        """
         with self._driver.session(database=self.database) as session:
-            res = session.run('CALL db.cdc.query($cursor, $selectors)',
-                              cursor=self.cursor, selectors=self.selectors)
-            for record in res:
+            res = session.run(page_query, cursor=cursor or self.cursor, selectors=self.selectors,
+                              page_size=self.page_size)
+            return [self.apply_change(record) for record in res]
+
+    def commit(self, cursor):
+        """
+        Move the cursor after a processed change and save it
+        :param cursor: the id of the last change processed
+        """
+        self.cursor = cursor
+        if self.cursor_checkpoint:
+            self.cursor_checkpoint.save(self.database, cursor)
+
+    def pages(self):
+        """
+        Read the changes following the cursor until the end of the log, a page at a time
+          The cursor moves past a page when the next one is requested, i.e. once the caller processed it.
+        """
+        while True:
+            page = self.fetch_page()
+            if page:
+                yield page
+                self.commit(page[-1]["id"])
+            if len(page) < self.page_size:
+                return
+
+    def read_changes(self):
+        """
+        :return: all the changes following the cursor, which moves to the last one
+        """
+        return [change for page in self.pages() for change in page]
+
+    def query_changes(self):
+        for page in self.pages():
+            for record in page:
                 self.apply_change_test(record)
-            self.cursor = self.current_change_id()
 
     def earliest_change_id(self):
         with self._driver.session(database=self.database) as session:
@@ -50,20 +118,6 @@ class CDCService(BaseImporter):
             record = session.run('CALL db.cdc.current')
             return record.single()["id"]
 
-    def detect_change(self, current_time):
-        change_query = """
-        CALL db.cdc.earliest() YIELD id AS earliestId
-        CALL db.cdc.query(earliestId) YIELD txId, event, metadata
-        WHERE datetime($current_time) < datetime(metadata.txCommitTime)
-        RETURN txId, event, metadata ORDER BY metadata.txCommitTime DESC
-        """
-        with self._driver.session(database=self.database) as session:
-            res = session.run(change_query, {"current_time": current_time})
-            results = []
-            for record in res:
-                results.append(self.apply_change(record))
-            return results
-    
     def run(self):
         # Useful to test a CDC daemon
         while True:
@@ -75,9 +129,8 @@ if __name__ == '__main__':
     selectors = [
         # {'select': 'n'}
     ]
-    cdc = CDCService(selectors)
+    cdc = CDCService(sys.argv[1:], selectors)
     logging.info("Waiting for changes...")
     cdc_thread = Thread(target=cdc.run, daemon=True)
     cdc_thread.start()
     cdc_thread.join()
-    
\ No newline at end of file
@@ -0,0 +1,21 @@
+from util.schema_manager import fulltext_index, range_index, unique
+
+# constraints and indexes of the Chicago people, licenses and contracts graph
+SCHEMA = [unique("Person", "clusterId", name="person_id"),
+          unique("PersonRecord", "pk", name="person_record_pk"),
+          range_index("PersonRecord", "componentId", name="person_record_component_id"),
+          range_index("PersonRecord", "employerId", name="person_record_employer_id"),
+          fulltext_index("PersonRecord", "fullName", name="person_record_fullName"),
+          unique("LicenseRecord", "pk", name="license_record_pk"),
+          unique("LicenseType", "id", name="license_type_id"),
+          unique("Organization", "id", name="organization_id"),
+          unique("Address", "id", name="address_id"),
+          fulltext_index("Organization", "name", name="organization_name"),
+          range_index("Organization", "componentId", name="organization_component_id"),
+          range_index("OrganizationGroup", "clusterId", name="organization_group_cluster_id"),
+          unique("ContractRecord", "pk", name="contract_record_pk"),
+          range_index("ContractRecord", "contractId", name="contract_record_contract_id"),
+          unique("Contract", "id", name="contract_id"),
+          unique("ProcurementType", "id", name="procurement_type_id"),
+          unique("Department", "id", name="department_id"),
+          unique("ContractType", "id", name="contract_type")]
@@ -2,10 +2,12 @@ import sys
 import logging
 from pathlib import Path
 
-import numpy as np
 import pandas as pd
 
 from util.base_importer import BaseImporter
+from util.bulk_export import BulkExport
+from util.row_source import CsvRowSource, Distinct, Group, RowSource
+from chi_schema import SCHEMA
 
 logging.basicConfig(
     level=logging.INFO,
@@ -14,104 +16,271 @@ logging.basicConfig(
 )
 
 class ChicagoContractsImporter(BaseImporter):
-    def __init__(self, argv):
-        super().__init__(command=__file__, argv=argv)    
+    IMPORT_CONTRACT_RECORDS_QUERY = """
+    UNWIND $batch as item
+    MERGE (n:ContractRecord {pk: item.RECORD_ID})
+    SET n.name = item.`Purchase Order Description`
+    SET n.amount = item.`Award Amount`
+    SET n.startDate = item.`Start Date`
+    SET n.endDate = item.`End Date`
+    SET n.approvalDate = item.`Approval Date`
+    SET n.pdfFile = item.`Contract PDF`
+    SET n.vendorId = item.`Vendor ID`
+    SET n.contractId = item.`Purchase Order (Contract) Number`
+    SET n.specificationId = item.`Specification Number`
+    SET n.source = item.DATA_SOURCE
+    """
+
+    MERGE_VENDORS_AND_ORDERS_QUERY = """
+    UNWIND $batch as item
+    MERGE (n:ContractRecord {contractId: item.`Purchase Order (Contract) Number`})
     
-    @staticmethod
-    def get_csv_size(contracts_file, encoding="utf-8"):
-        return sum(1 for row in ChicagoContractsImporter.get_rows(contracts_file))
+    MERGE (m:Contract {id: item.`Purchase Order (Contract) Number`})
+    SET m.names = apoc.coll.toSet(coalesce(m.names, [])  + coalesce(item.`Purchase Order Description`, []))
+    
+    MERGE (o:Organization {id: item.`Vendor ID`})
+    
+    MERGE (n)-[:INCLUDED_IN_CONTRACT]->(m)
+    MERGE (n)-[:HAS_VENDOR]->(o)
+    """
+
+    # One row per vendor, with the lists computed by VENDOR_SETS
+    MERGE_VENDORS_QUERY = """
+    UNWIND $batch as item
+    MERGE (o:Organization {id: item.`Vendor ID`})
+    SET o.names = apoc.coll.toSet(coalesce(o.names, [])  + item.names)
+    SET o.source = item.DATA_SOURCE
+    SET o.addresses = apoc.coll.toSet(coalesce(o.addresses, [])  + item.addresses)
+    SET o.addressPostalCodes = apoc.coll.toSet(coalesce(o.addressPostalCodes, [])  + item.addressPostalCodes)
+    SET o.addressStates = apoc.coll.toSet(coalesce(o.addressStates, [])  + item.addressStates)
+    SET o.addressCities = apoc.coll.toSet(coalesce(o.addressCities, [])  + item.addressCities)
+    SET o.name = trim(apoc.text.capitalize(reduce(shortest = head(o.names), name IN o.names | CASE WHEN size(name) < size(shortest) THEN name ELSE shortest END)))
+    
+    WITH o, item
+    UNWIND item.addressIds as address
+    MERGE (a:Address {id: address})
+    MERGE (o)-[r:HAS_ADDRESS]->(a)
+    SET r.source = item.DATA_SOURCE
+    """
+
+    MERGE_VENDOR_ADDRESSES_QUERY = """
+    UNWIND $batch as item
+    MERGE (a:Address {id: coalesce(item.`Address 1`, "Unknown)")})
+    SET a.addressPostalCode = item.Zip
+    SET a.addressState = item.State
+    SET a.addressCity = item.City
+    """
+
+    MERGE_DEPARTMENTS_CONTRACT_TYPES_QUERY = """
+    UNWIND $batch as item
+    MERGE (n:Contract {id: item.`Purchase Order (Contract) Number`})
+    SET n.name = apoc.text.join(n.names, " + ")
+    
+    MERGE (m:Department {id: coalesce(item.Department, "Unknown")})
+    MERGE (o:ContractType {id: coalesce(item.`Contract Type`, "Unknown")})
+
+    MERGE (m)-[:ASSIGNS_CONTRACT]->(n)
+    MERGE (n)-[:HAS_CONTRACT_TYPE]->(o)
+    """
+
+    MERGE_PROCUREMENT_TYPES_QUERY = """
+    UNWIND $batch as item
+    MERGE (n:ContractRecord {contractId: item.`Purchase Order (Contract) Number`})
+    MERGE (t:ProcurementType {id: coalesce(item.`Procurement Type`, "Unknown")})
+    MERGE (n)-[:HAS_PROCUREMENT_TYPE]->(t)
+    """
+
+    # The per row stages in dependency order, used to import the file in a single pass. The vendors and orders
+    # connect all the records of a contract number, they run once all the records are written, along with the
+    # vendors, addresses, procurement types, departments and contract types which only need the distinct keys.
+    STAGES = [("import_contract_records", IMPORT_CONTRACT_RECORDS_QUERY)]
+
+    # The Organization list properties, collected from all the contracts of a vendor
+    VENDOR_SETS = {"names": "Vendor Name",
+                   "addresses": ["Address 1", "Address 2"],
+                   "addressIds": lambda contracts: contracts['Address 1'].fillna("Unknown)"),
+                   "addressPostalCodes": "Zip",
+                   "addressStates": "State",
+                   "addressCities": "City"}
+
+    # Declared column types, e.g. postal codes must be strings and not floats
+    DTYPES = {"Zip": str}
+
+    def __init__(self, argv):
+        super().__init__(command=__file__, argv=argv)
     
+    def get_csv_size(self, contracts_file, encoding="utf-8"):
+        return len(self.get_source(contracts_file))
+
     @staticmethod
-    def get_rows(contracts_file):
-        contracts = pd.read_csv(contracts_file)
+    def prepare_contracts(contracts, first_row=0):
         contracts['DATA_SOURCE'] = "CONTRACTS"
         contracts['RECORD_TYPE'] = "CONTRACT"
-        contracts.insert(0, 'RECORD_ID', range(0, 0 + len(contracts)))
+        contracts.insert(0, 'RECORD_ID', range(first_row, first_row + len(contracts)))
         if 'RECORD_ID' not in contracts:
-            contracts.insert(0, 'RECORD_ID', range(0, 0 + len(contracts)))
-        contracts.replace({np.nan: None}, inplace=True)
-        for _, row in contracts.iterrows():
-            yield row.to_dict()
+            contracts.insert(0, 'RECORD_ID', range(first_row, first_row + len(contracts)))
+        return contracts
+
+    def get_source(self, contracts_file):
+        return CsvRowSource(contracts_file, self.DTYPES, self.prepare_contracts, self.chunk_rows)
+
+    def get_rows(self, contracts_file):
+        yield from self.get_source(contracts_file)
     
     def set_constraints(self):
-        queries = ["CREATE CONSTRAINT contract_record_pk IF NOT EXISTS FOR (node:ContractRecord) REQUIRE node.pk IS UNIQUE",
-                   "CREATE INDEX contract_record_contract_id IF NOT EXISTS FOR (node:ContractRecord) ON (node.contractId)",
-                   "CREATE CONSTRAINT contract_id IF NOT EXISTS FOR (node:Contract) REQUIRE node.id IS UNIQUE",
-                   "CREATE CONSTRAINT procurement_type_id IF NOT EXISTS FOR (node:ProcurementType) REQUIRE node.id IS UNIQUE",
-                   "CREATE CONSTRAINT department_id IF NOT EXISTS FOR (node:Department) REQUIRE node.id IS UNIQUE",
-                   "CREATE CONSTRAINT contract_type IF NOT EXISTS FOR (node:ContractType) REQUIRE node.id IS UNIQUE",
-                   "CREATE CONSTRAINT organization_id IF NOT EXISTS FOR (node:Organization) REQUIRE node.id IS UNIQUE",
-                   "CREATE CONSTRAINT address_id IF NOT EXISTS FOR (node:Address) REQUIRE node.id IS UNIQUE",
-                   "CREATE FULLTEXT INDEX organization_name IF NOT EXISTS FOR (node:Organization) ON EACH [node.name]"]
-        for q in queries:
-            with self._driver.session(database=self.database) as session:
-                session.run(q)
+        self.apply_schema(SCHEMA)
     
     def import_contract_records(self, contracts_file):
-        contract_records_query = """
-        UNWIND $batch as item
-        MERGE (n:ContractRecord {pk: item.RECORD_ID})
-        SET n.name = item.`Purchase Order Description`
-        SET n.amount = item.`Award Amount`
-        SET n.startDate = item.`Start Date`
-        SET n.endDate = item.`End Date`
-        SET n.approvalDate = item.`Approval Date`
-        SET n.pdfFile = item.`Contract PDF`
-        SET n.vendorId = item.`Vendor ID`
-        SET n.contractId = item.`Purchase Order (Contract) Number`
-        SET n.specificationId = item.`Specification Number`
-        SET n.source = item.DATA_SOURCE
-        """
         size = self.get_csv_size(contracts_file)
-        self.batch_store(contract_records_query, self.get_rows(contracts_file), size=size)
+        self.batch_store(self.IMPORT_CONTRACT_RECORDS_QUERY, self.get_rows(contracts_file), size=size,
+                         source=contracts_file, strategy="parallel", desc="import_contract_records")
     
-    def merge_vendors_and_orders(self, contracts_file):
-        vendors_and_orders_query = """
-        UNWIND $batch as item
-        MERGE (n:ContractRecord {contractId: item.`Purchase Order (Contract) Number`})
-        
-        MERGE (m:Contract {id: item.`Purchase Order (Contract) Number`})
-        SET m.names = apoc.coll.toSet(coalesce(m.names, [])  + coalesce(item.`Purchase Order Description`, []))
-        
-        MERGE (o:Organization {id: item.`Vendor ID`})
-        SET o.names = apoc.coll.toSet(coalesce(o.names, [])  + coalesce(item.`Vendor Name`, []))
-        SET o.source = item.DATA_SOURCE
-        SET o.addresses = apoc.coll.toSet(coalesce(o.addresses, [])  + coalesce(item.`Address 1`, []) + coalesce(item.`Address 2`, []))
-        SET o.addressPostalCodes = apoc.coll.toSet(coalesce(o.addressPostalCodes, [])  + coalesce(toString(item.Zip), []))
-        SET o.addressStates = apoc.coll.toSet(coalesce(o.addressStates, [])  + coalesce(item.State, []))
-        SET o.addressCities = apoc.coll.toSet(coalesce(o.addressCities, [])  + coalesce(item.City, []))
-        SET o.name = trim(apoc.text.capitalize(reduce(shortest = head(o.names), name IN o.names | CASE WHEN size(name) < size(shortest) THEN name ELSE shortest END)))
-        
-        MERGE (a:Address {id: coalesce(item.`Address 1`, "Unknown)")})
-        SET a.addressPostalCode = toString(item.Zip)
-        SET a.addressState = item.State
-        SET a.addressCity = item.City
-        
-        MERGE (t:ProcurementType {id: coalesce(item.`Procurement Type`, "Unknown")})
-        
-        MERGE (n)-[:INCLUDED_IN_CONTRACT]->(m)
-        MERGE (n)-[:HAS_VENDOR]->(o)
-        MERGE (n)-[:HAS_PROCUREMENT_TYPE]->(t)
-        MERGE (o)-[r:HAS_ADDRESS]->(a)
-        SET r.source = item.DATA_SOURCE
+    def merge_vendors_and_orders(self, contracts_file, orders: RowSource = None):
         """
-        size = self.get_csv_size(contracts_file)
-        self.batch_store(vendors_and_orders_query, self.get_rows(contracts_file), size=size)
+        :param orders: optional distinct contract numbers, vendors and descriptions, in order of appearance: they
+          create the same contracts and names as all the rows
+        """
+        if orders is None:
+            orders = self.get_source(contracts_file).aggregate(self.orders_fold())
+        self.batch_store(self.MERGE_VENDORS_AND_ORDERS_QUERY, iter(orders), size=len(orders),
+                         source=contracts_file, strategy="pipelined", desc="merge_vendors_and_orders")
     
-    def merge_departments_contract_types(self, contracts_file):
-        departments_contract_types_query = """
-        UNWIND $batch as item
-        MERGE (n:Contract {id: item.`Purchase Order (Contract) Number`})
-        SET n.name = apoc.text.join(n.names, " + ")
-        
-        MERGE (m:Department {id: coalesce(item.Department, "Unknown")})
-        MERGE (o:ContractType {id: coalesce(item.`Contract Type`, "Unknown")})
-
-        MERGE (m)-[:ASSIGNS_CONTRACT]->(n)
-        MERGE (n)-[:HAS_CONTRACT_TYPE]->(o)
+    def merge_vendors(self, contracts_file, vendors: RowSource = None):
+        if vendors is None:
+            vendors = self.get_source(contracts_file).aggregate(self.vendors_fold())
+        self.batch_store(self.MERGE_VENDORS_QUERY, iter(vendors), size=len(vendors), source=contracts_file,
+                         desc="merge_vendors")
+
+    def merge_vendor_addresses(self, contracts_file, addresses: RowSource = None):
+        if addresses is None:
+            addresses = self.get_source(contracts_file).aggregate(self.addresses_fold())
+        self.batch_store(self.MERGE_VENDOR_ADDRESSES_QUERY, iter(addresses), size=len(addresses),
+                         source=contracts_file, desc="merge_vendor_addresses")
+
+    def merge_procurement_types(self, contracts_file, procurement_types: RowSource = None):
+        if procurement_types is None:
+            procurement_types = self.get_source(contracts_file).aggregate(self.procurement_types_fold())
+        self.batch_store(self.MERGE_PROCUREMENT_TYPES_QUERY, iter(procurement_types), size=len(procurement_types),
+                         source=contracts_file, desc="merge_procurement_types")
+
+    def merge_departments_contract_types(self, contracts_file, contract_types: RowSource = None):
+        if contract_types is None:
+            contract_types = self.get_source(contracts_file).aggregate(self.contract_types_fold())
+        self.batch_store(self.MERGE_DEPARTMENTS_CONTRACT_TYPES_QUERY, iter(contract_types), size=len(contract_types),
+                         source=contracts_file, desc="merge_departments_contract_types")
+
+    @staticmethod
+    def orders_fold():
+        return Distinct(["Purchase Order (Contract) Number", "Vendor ID", "Purchase Order Description"],
+                        keep="first")
+
+    def vendors_fold(self):
+        return Group(["Vendor ID"], self.VENDOR_SETS, ["DATA_SOURCE"])
+
+    @staticmethod
+    def addresses_fold():
+        return Distinct(["Address 1"], ["Zip", "State", "City"])
+
+    @staticmethod
+    def procurement_types_fold():
+        return Distinct(["Purchase Order (Contract) Number", "Procurement Type"])
+
+    @staticmethod
+    def contract_types_fold():
+        return Distinct(["Purchase Order (Contract) Number", "Department", "Contract Type"])
+
+    def import_contracts(self, contracts_file):
         """
-        size = self.get_csv_size(contracts_file)
-        self.batch_store(departments_contract_types_query, self.get_rows(contracts_file), size=size)
+        Run all the STAGES parsing contracts_file only once, then the stages needing all the records
+          Their orders, vendors, addresses, procurement types and contract types are aggregated from the frames
+          read by the same pass.
+        """
+        contracts = self.get_source(contracts_file)
+        orders, vendors, addresses = self.orders_fold(), self.vendors_fold(), self.addresses_fold()
+        procurement_types, contract_types = self.procurement_types_fold(), self.contract_types_fold()
+        rows = contracts.rows([orders, vendors, addresses, procurement_types, contract_types])
+        self.fanout_batch_store(self.STAGES, rows, size=contracts.size_hint(), desc="import_contracts",
+                                source=contracts_file)
+        rows.finish()
+        self.merge_vendors_and_orders(contracts_file, orders.result())
+        self.merge_vendor_addresses(contracts_file, addresses.result())
+        self.merge_vendors(contracts_file, vendors.result())
+        self.merge_procurement_types(contracts_file, procurement_types.result())
+        self.merge_departments_contract_types(contracts_file, contract_types.result())
+
+    def export_contracts(self, contracts_file, bulk: BulkExport):
+        """
+        Add the nodes and relationships created by import_contracts to a neo4j-admin bulk export
+        """
+        contracts = self.get_source(contracts_file)
+        contract_id = "Purchase Order (Contract) Number"
+        # every row connects all the records of its contract number, as MERGE (n:ContractRecord {contractId: ...}),
+        # so these two are read in a first pass and the other aggregates along the records
+        vendors, procurement_types = Distinct([contract_id, "Vendor ID"]), self.procurement_types_fold()
+        contracts.rows([vendors, procurement_types]).finish()
+        vendors = vendors.result().frame
+        procurement_types = procurement_types.result().frame
+        procurement_types["Procurement Type"] = procurement_types["Procurement Type"].fillna("Unknown")
+        contract_names = Group([contract_id], {"names": "Purchase Order Description"})
+        organizations, addresses = self.vendors_fold(), self.addresses_fold()
+        contract_types = self.contract_types_fold()
+        for frame in contracts.frames([contract_names, organizations, addresses, contract_types]):
+            bulk.add_nodes("ContractRecord", "pk", BulkExport.select(frame, {
+                "pk": "RECORD_ID",
+                "name": "Purchase Order Description",
+                "amount": "Award Amount",
+                "startDate": "Start Date",
+                "endDate": "End Date",
+                "approvalDate": "Approval Date",
+                "pdfFile": "Contract PDF",
+                "vendorId": "Vendor ID",
+                "contractId": contract_id,
+                "specificationId": "Specification Number",
+                "source": "DATA_SOURCE"}))
+            records = frame[["RECORD_ID", contract_id]].dropna(subset=[contract_id])
+            bulk.add_relationships("INCLUDED_IN_CONTRACT", "ContractRecord", "Contract",
+                                   BulkExport.select(records, {"start": "RECORD_ID", "end": contract_id}))
+            bulk.add_relationships("HAS_VENDOR", "ContractRecord", "Organization",
+                                   BulkExport.select(records.merge(vendors, on=contract_id),
+                                                     {"start": "RECORD_ID", "end": "Vendor ID"}))
+            bulk.add_relationships("HAS_PROCUREMENT_TYPE", "ContractRecord", "ProcurementType",
+                                   BulkExport.select(records.merge(procurement_types, on=contract_id),
+                                                     {"start": "RECORD_ID", "end": "Procurement Type"}))
+
+        contract_names = contract_names.result().frame
+        bulk.add_nodes("Contract", "id", contract_names.rename(columns={contract_id: "id"}), merge=True,
+                       finalize=lambda nodes: nodes.assign(name=nodes["names"].map(" + ".join)))
+
+        organizations = organizations.result().frame
+        bulk.add_nodes("Organization", "id",
+                       organizations.drop(columns=["addressIds"])
+                       .rename(columns={"Vendor ID": "id", "DATA_SOURCE": "source"}),
+                       merge=True, finalize=lambda nodes: nodes.assign(name=BulkExport.shortest(nodes["names"])))
+        has_address = organizations.explode("addressIds").dropna(subset=["addressIds"])
+        bulk.add_relationships("HAS_ADDRESS", "Organization", "Address",
+                               BulkExport.select(has_address, {"start": "Vendor ID", "end": "addressIds",
+                                                               "source": "DATA_SOURCE"}), merge=True)
+        addresses = addresses.result().frame
+        bulk.add_nodes("Address", "id", BulkExport.select(addresses, {
+            "id": lambda f: f['Address 1'].fillna("Unknown)"),
+            "addressPostalCode": "Zip",
+            "addressState": "State",
+            "addressCity": "City"}), merge=True)
+
+        bulk.add_nodes("ProcurementType", "id", pd.DataFrame({"id": procurement_types["Procurement Type"].unique()}),
+                       merge=True)
+        contract_types = contract_types.result().frame.assign(
+            Department=lambda f: f["Department"].fillna("Unknown"),
+            ContractType=lambda f: f["Contract Type"].fillna("Unknown"))
+        bulk.add_nodes("Department", "id", pd.DataFrame({"id": contract_types["Department"].unique()}), merge=True)
+        bulk.add_nodes("ContractType", "id", pd.DataFrame({"id": contract_types["ContractType"].unique()}),
+                       merge=True)
+        bulk.add_relationships("ASSIGNS_CONTRACT", "Department", "Contract",
+                               BulkExport.select(contract_types, {"start": "Department", "end": contract_id}),
+                               merge=True)
+        bulk.add_relationships("HAS_CONTRACT_TYPE", "Contract", "ContractType",
+                               BulkExport.select(contract_types, {"start": contract_id, "end": "ContractType"}),
+                               merge=True)
 
 if __name__ == '__main__':
     importing = ChicagoContractsImporter(argv=sys.argv[1:])
@@ -127,7 +296,7 @@ if __name__ == '__main__':
         print(base_path, "isn't a directory")
         sys.exit(1)
 
-    contracts_dat = base_path / "Contracts_20240103.csv"
+    contracts_dat = CsvRowSource.resolve(base_path / "Contracts_20240103.csv")
 
     if not contracts_dat.is_file():
         print(contracts_dat, "doesn't exist in ", base_path)
@@ -135,10 +304,6 @@ if __name__ == '__main__':
 
     logging.info("Setting constraints...")
     importing.set_constraints()
-    logging.info("Importing contract records...")
-    importing.import_contract_records(contracts_dat)
-    logging.info("Merging vendors and orders...")
-    importing.merge_vendors_and_orders(contracts_dat)
-    logging.info("Merging departments and contract types...")
-    importing.merge_departments_contract_types(contracts_dat)
+    logging.info("Importing contract records, vendors, orders, departments and contract types...")
+    importing.import_contracts(contracts_dat)
     importing.close()
@@ -2,10 +2,10 @@ import sys
 import logging
 from pathlib import Path
 
-import numpy as np
-import pandas as pd
-
 from util.base_importer import BaseImporter
+from util.bulk_export import BulkExport
+from util.row_source import CsvRowSource, Distinct, Group, RowSource
+from chi_schema import SCHEMA
 
 logging.basicConfig(
     level=logging.INFO,
@@ -14,129 +14,270 @@ logging.basicConfig(
 )
 
 class ChicagoLicensesImporter(BaseImporter):
+    IMPORT_LICENSES_QUERY = """
+    UNWIND $batch as item
+    MERGE (n:LicenseRecord {pk: item.RECORD_ID})
+    SET n.id = item.`LICENSE ID`
+    SET n.name = coalesce(item.`LEGAL NAME`, item.`DOING BUSINESS AS NAME`)
+    SET n.businessName = coalesce(item.`DOING BUSINESS AS NAME`, '-')
+    SET n.businessId = item.`ACCOUNT NUMBER`
+    SET n.address = item.ADDRESS
+    SET n.addressPostalCode = item.`ZIP CODE`
+    SET n.addressState = item.STATE
+    SET n.addressCity = item.CITY
+    SET n.source = item.DATA_SOURCE
+    SET n.amount = item.`Award Amount`
+    SET n.date = item.`Approval Date`
+    SET n.startDate = item.`LICENSE TERM START DATE`
+    SET n.endDate = item.`LICENSE TERM EXPIRATION DATE`
+    SET n.status = item.`LICENSE STATUS`
+    SET n.code = item.`LICENSE CODE`
+    SET n.number = item.`LICENSE NUMBER`
+    SET n.siteNumber = item.`SITE NUMBER`
+    SET n.latitude = item.LATITUDE
+    SET n.longitude = item.LONGITUDE
+    """
+
+    IMPORT_LICENSE_TYPE_QUERY = """
+    UNWIND $batch as item
+    MERGE (n:LicenseType {id: item.`LICENSE CODE`})
+    SET n.description = item.`LICENSE DESCRIPTION`
+    """
+
+    CONNECT_LICENSE_TO_TYPE_QUERY = """
+    UNWIND $batch as item
+    MERGE (n:LicenseType {id: item.`LICENSE CODE`})
+    MERGE (m:LicenseRecord {pk: item.RECORD_ID})
+    MERGE (m)-[:HAS_LICENSE_TYPE]->(n)
+    """
+
+    # One row per account, with the lists computed by ORGANIZATION_SETS
+    IMPORT_ORGANIZATION_QUERY = """
+    UNWIND $batch as item
+    MERGE (o:Organization {id: item.`ACCOUNT NUMBER`})
+    SET o.names = apoc.coll.toSet(coalesce(o.names, []) + item.names)
+    SET o.otherNames = apoc.coll.toSet(coalesce(o.otherNames, []) + item.otherNames)
+    SET o.source = item.DATA_SOURCE
+    SET o.addresses = apoc.coll.toSet(coalesce(o.addresses, []) + item.addresses)
+    SET o.addressPostalCodes = apoc.coll.toSet(coalesce(o.addressPostalCodes, []) + item.addressPostalCodes)
+    SET o.addressStates = apoc.coll.toSet(coalesce(o.addressStates, []) + item.addressStates)
+    SET o.addressCities = apoc.coll.toSet(coalesce(o.addressCities, []) + item.addressCities)
+    SET o.name = trim(apoc.text.capitalize(reduce(shortest = head(o.names), name IN o.names | CASE WHEN size(name) < size(shortest) THEN name ELSE shortest END)))
+
+    WITH o, item
+    UNWIND item.addresses as address
+    MERGE (a:Address {id: address})
+    MERGE (o)-[r:HAS_ADDRESS]->(a)
+    SET r.source = item.DATA_SOURCE
+    """
+
+    IMPORT_ADDRESS_QUERY = """
+    UNWIND $batch as item
+    MERGE (a:Address {id: item.ADDRESS})
+    SET a.addressPostalCode = item.`ZIP CODE`
+    SET a.addressState = item.STATE
+    SET a.addressCity = item.CITY
+    SET a.latitude = item.LATITUDE
+    SET a.longitude = item.LONGITUDE
+    """
+
+    CONNECT_LICENSE_TO_ORG_QUERY = """
+    UNWIND $batch as item
+    MERGE (n:Organization {id: item.`ACCOUNT NUMBER`})
+    MERGE (m:LicenseRecord {pk: item.RECORD_ID})
+    MERGE (n)-[:ORG_HAS_LICENSE]->(m)
+    """
+
+    CONNECT_PEOPLE_TO_ORG_QUERY = """
+    UNWIND $batch as item
+    MERGE (n:Organization {id: item.`ACCOUNT NUMBER`})
+    WITH n, item
+    MATCH (m:PersonRecord {employerId: item.`ACCOUNT NUMBER`})-[:RECORD_RESOLVED_TO]->(p:Person)
+    MERGE (p)-[r:BELONGS_TO_ORG]->(n)
+    SET r.roles = p.titles
+    """
+
+    # The per row stages in dependency order, used to import the file in a single pass. The other stages only need
+    # the distinct license types, addresses and accounts, aggregated during the same pass.
+    STAGES = [("import_license_records", IMPORT_LICENSES_QUERY),
+              ("connect_license_to_type", CONNECT_LICENSE_TO_TYPE_QUERY),
+              ("connect_org_to_license", CONNECT_LICENSE_TO_ORG_QUERY)]
+
+    # The Organization list properties, collected from all the licenses of an account
+    ORGANIZATION_SETS = {"names": lambda licenses: licenses['LEGAL NAME'].fillna(licenses['DOING BUSINESS AS NAME']),
+                         "otherNames": "DOING BUSINESS AS NAME",
+                         "addresses": "ADDRESS",
+                         "addressPostalCodes": "ZIP CODE",
+                         "addressStates": "STATE",
+                         "addressCities": "CITY"}
+
+    # Declared column types, e.g. postal codes must be strings and not floats
+    DTYPES = {"ZIP CODE": str}
+
     def __init__(self, argv):
         super().__init__(command=__file__, argv=argv)
+        # the distinct accounts of every file imported, for connect_people_to_org
+        self.accounts = {}
+
+    def get_csv_size(self, licenses_file, encoding="utf-8"):
+        return len(self.get_source(licenses_file))
 
     @staticmethod
-    def get_csv_size(licenses_file, encoding="utf-8"):
-        return sum(1 for row in ChicagoLicensesImporter.get_rows(licenses_file))
-    
-    @staticmethod
-    def get_rows(licenses_file):
-        licenses = pd.read_csv(licenses_file)
+    def prepare_licenses(licenses, first_row=0):
         licenses['DATA_SOURCE'] = "LICENSES"
         licenses['RECORD_TYPE'] = "LICENSE"
         if 'RECORD_ID' not in licenses:
-            licenses.insert(0, 'RECORD_ID', range(1000000, 1000000 + len(licenses)))
-        licenses.replace({np.nan: None}, inplace=True)
-        for _, row in licenses.iterrows():
-            yield row.to_dict()
+            first_id = 1000000 + first_row
+            licenses.insert(0, 'RECORD_ID', range(first_id, first_id + len(licenses)))
+        return licenses
+
+    def get_source(self, licenses_file):
+        return CsvRowSource(licenses_file, self.DTYPES, self.prepare_licenses, self.chunk_rows)
+
+    def get_rows(self, licenses_file):
+        yield from self.get_source(licenses_file)
     
     def set_constraints(self):
-        queries = ["CREATE CONSTRAINT license_record_pk IF NOT EXISTS FOR (node:LicenseRecord) REQUIRE node.pk IS UNIQUE",
-                   "CREATE CONSTRAINT license_type_id IF NOT EXISTS FOR (node:LicenseType) REQUIRE node.id IS UNIQUE",
-                   "CREATE CONSTRAINT organization_id IF NOT EXISTS FOR (node:Organization) REQUIRE node.id IS UNIQUE",
-                   "CREATE CONSTRAINT address_id IF NOT EXISTS FOR (node:Address) REQUIRE node.id IS UNIQUE",
-                   "CREATE FULLTEXT INDEX organization_name IF NOT EXISTS FOR (node:Organization) ON EACH [node.name]",
-                   "CREATE INDEX organization_component_id IF NOT EXISTS FOR (node:Organization) ON (node.componentId)",
-                   "CREATE INDEX organization_group_cluster_id IF NOT EXISTS FOR (node:OrganizationGroup) ON (node.clusterId)"]
-        for q in queries:
-            with self._driver.session(database=self.database) as session:
-                session.run(q)
+        self.apply_schema(SCHEMA)
     
     def import_license_records(self, licenses_file):
-        import_licenses_query = """
-        UNWIND $batch as item
-        MERGE (n:LicenseRecord {pk: item.RECORD_ID})
-        SET n.id = item.`LICENSE ID`
-        SET n.name = coalesce(item.`LEGAL NAME`, item.`DOING BUSINESS AS NAME`)
-        SET n.businessName = coalesce(item.`DOING BUSINESS AS NAME`, '-')
-        SET n.businessId = item.`ACCOUNT NUMBER`
-        SET n.address = item.ADDRESS
-        SET n.addressPostalCode = item.`ZIP CODE`
-        SET n.addressState = item.STATE
-        SET n.addressCity = item.CITY
-        SET n.source = item.DATA_SOURCE
-        SET n.amount = item.`Award Amount`
-        SET n.date = item.`Approval Date`
-        SET n.startDate = item.`LICENSE TERM START DATE`
-        SET n.endDate = item.`LICENSE TERM EXPIRATION DATE`
-        SET n.status = item.`LICENSE STATUS`
-        SET n.code = item.`LICENSE CODE`
-        SET n.number = item.`LICENSE NUMBER`
-        SET n.siteNumber = item.`SITE NUMBER`
-        SET n.latitude = item.LATITUDE
-        SET n.longitude = item.LONGITUDE
-        """
         size = self.get_csv_size(licenses_file)
-        self.batch_store(import_licenses_query, self.get_rows(licenses_file), size=size)
+        self.batch_store(self.IMPORT_LICENSES_QUERY, self.get_rows(licenses_file), size=size, source=licenses_file,
+                         strategy="parallel", desc="import_license_records")
     
-    def import_license_type(self, licenses_file):
-        import_license_type_query = """
-        UNWIND $batch as item
-        MERGE (n:LicenseType {id: item.`LICENSE CODE`})
-        SET n.description = item.`LICENSE DESCRIPTION`
-        """
-        size = self.get_csv_size(licenses_file)
-        self.batch_store(import_license_type_query, self.get_rows(licenses_file), size=size)
+    def import_license_type(self, licenses_file, license_types: RowSource = None):
+        if license_types is None:
+            license_types = self.get_source(licenses_file).aggregate(self.license_types_fold())
+        self.batch_store(self.IMPORT_LICENSE_TYPE_QUERY, iter(license_types), size=len(license_types),
+                         source=licenses_file, desc="import_license_type")
     
     def connect_license_to_type(self, licenses_file):
-        connect_license_to_type_query = """
-        UNWIND $batch as item
-        MERGE (n:LicenseType {id: item.`LICENSE CODE`})
-        MERGE (m:LicenseRecord {pk: item.RECORD_ID})
-        MERGE (m)-[:HAS_LICENSE_TYPE]->(n)
-        """
         size = self.get_csv_size(licenses_file)
-        self.batch_store(connect_license_to_type_query, self.get_rows(licenses_file), size=size)
+        self.batch_store(self.CONNECT_LICENSE_TO_TYPE_QUERY, self.get_rows(licenses_file), size=size,
+                         source=licenses_file, strategy="parallel", partition_key="LICENSE CODE",
+                         desc="connect_license_to_type")
     
-    def import_organization(self, licenses_file):
-        import_organization_query = """
-        UNWIND $batch as item
-        MERGE (o:Organization {id: item.`ACCOUNT NUMBER`})
-        SET o.names = apoc.coll.toSet(coalesce(o.names, []) + coalesce(item.`LEGAL NAME`, item.`DOING BUSINESS AS NAME`, []))
-        SET o.otherNames = apoc.coll.toSet(coalesce(o.otherNames, []) + coalesce(item.`DOING BUSINESS AS NAME`, []))
-        SET o.source = item.DATA_SOURCE
-        SET o.addresses = apoc.coll.toSet(coalesce(o.addresses, []) + coalesce(item.ADDRESS, []))
-        SET o.addressPostalCodes = apoc.coll.toSet(coalesce(o.addressPostalCodes, []) + coalesce(toString(item.`ZIP CODE`), [])) // Need to have the same data type
-        SET o.addressStates = apoc.coll.toSet(coalesce(o.addressStates, []) + coalesce(item.STATE, []))
-        SET o.addressCities = apoc.coll.toSet(coalesce(o.addressCities, []) + coalesce(item.CITY, []))
-
-        MERGE (a:Address {id: item.ADDRESS})
-        SET a.addressPostalCode = toString(item.`ZIP CODE`)
-        SET a.addressState = item.STATE
-        SET a.addressCity = item.CITY
-        SET a.latitude = item.LATITUDE
-        SET a.longitude = item.LONGITUDE
-
-        MERGE (o)-[r:HAS_ADDRESS]->(a)
-        SET r.source = item.DATA_SOURCE
-        """
-        size = self.get_csv_size(licenses_file)
-        self.batch_store(import_organization_query, self.get_rows(licenses_file), size=size)
+    def import_organization(self, licenses_file, organizations: RowSource = None):
+        if organizations is None:
+            organizations = self.get_source(licenses_file).aggregate(self.organizations_fold())
+        self.batch_store(self.IMPORT_ORGANIZATION_QUERY, iter(organizations), size=len(organizations),
+                         source=licenses_file, desc="import_organization")
+
+    def import_address(self, licenses_file, addresses: RowSource = None):
+        if addresses is None:
+            addresses = self.get_source(licenses_file).aggregate(self.addresses_fold())
+        self.batch_store(self.IMPORT_ADDRESS_QUERY, iter(addresses), size=len(addresses), source=licenses_file,
+                         desc="import_address")
     
     def connect_org_to_license(self, licenses_file):
-        connect_license_to_org_query = """
-        UNWIND $batch as item
-        MERGE (n:Organization {id: item.`ACCOUNT NUMBER`})
-        SET n.name = trim(apoc.text.capitalize(reduce(shortest = head(n.names), name IN n.names | CASE WHEN size(name) < size(shortest) THEN name ELSE shortest END)))
-        MERGE (m:LicenseRecord {pk: item.RECORD_ID})
-        MERGE (n)-[:ORG_HAS_LICENSE]->(m)
-        """
         size = self.get_csv_size(licenses_file)
-        self.batch_store(connect_license_to_org_query, self.get_rows(licenses_file), size=size)
+        self.batch_store(self.CONNECT_LICENSE_TO_ORG_QUERY, self.get_rows(licenses_file), size=size,
+                         source=licenses_file, strategy="parallel", partition_key="ACCOUNT NUMBER",
+                         desc="connect_org_to_license")
     
-    def connect_people_to_org(self, licenses_file):
-        connect_people_to_org_query = """
-        UNWIND $batch as item
-        MERGE (n:Organization {id: item.`ACCOUNT NUMBER`})
-        WITH n, item
-        MATCH (m:PersonRecord {employerId: item.`ACCOUNT NUMBER`})-[:RECORD_RESOLVED_TO]->(p:Person)
-        MERGE (p)-[r:BELONGS_TO_ORG]->(n)
-        SET r.roles = p.titles
+    def connect_people_to_org(self, licenses_file, accounts: RowSource = None):
         """
-        size = self.get_csv_size(licenses_file)
-        self.batch_store(connect_people_to_org_query, self.get_rows(licenses_file), size=size)
+        :param accounts: optional distinct accounts, the ones kept by import_licenses for licenses_file by default
+        """
+        if accounts is None:
+            accounts = self.accounts.get(licenses_file)
+        if accounts is None:
+            accounts = self.get_source(licenses_file).aggregate(self.accounts_fold())
+        self.batch_store(self.CONNECT_PEOPLE_TO_ORG_QUERY, iter(accounts), size=len(accounts), source=licenses_file,
+                         desc="connect_people_to_org")
+
+    @staticmethod
+    def license_types_fold():
+        return Distinct(["LICENSE CODE"], ["LICENSE DESCRIPTION"])
+
+    @staticmethod
+    def addresses_fold():
+        return Distinct(["ADDRESS"], ["ZIP CODE", "STATE", "CITY", "LATITUDE", "LONGITUDE"])
+
+    def organizations_fold(self):
+        return Group(["ACCOUNT NUMBER"], self.ORGANIZATION_SETS, ["DATA_SOURCE"])
+
+    @staticmethod
+    def accounts_fold():
+        return Distinct(["ACCOUNT NUMBER"])
+
+    def import_licenses(self, licenses_file, connect_people=True):
+        """
+        Run all the STAGES parsing licenses_file only once, then the stages on distinct keys
+          The license types, addresses, organizations and accounts are aggregated from the frames read by the
+          same pass. The accounts are kept, so that connect_people_to_org doesn't parse the file again when the
+          people are connected later.
+        :param connect_people: also connect the people to their organizations, it needs the person clusters
+        """
+        licenses = self.get_source(licenses_file)
+        license_types, addresses = self.license_types_fold(), self.addresses_fold()
+        organizations, accounts = self.organizations_fold(), self.accounts_fold()
+        rows = licenses.rows([license_types, addresses, organizations, accounts])
+        self.fanout_batch_store(self.STAGES, rows, size=licenses.size_hint(), desc="import_licenses",
+                                source=licenses_file)
+        rows.finish()
+        self.accounts[licenses_file] = accounts.result()
+        self.import_license_type(licenses_file, license_types.result())
+        self.import_address(licenses_file, addresses.result())
+        self.import_organization(licenses_file, organizations.result())
+        if connect_people:
+            self.connect_people_to_org(licenses_file)
+
+    def export_licenses(self, licenses_file, bulk: BulkExport):
+        """
+        Add the nodes and relationships created by import_licenses to a neo4j-admin bulk export
+          The people are connected to the organizations later, by connect_people_to_org, once their clusters exist.
+        """
+        licenses = self.get_source(licenses_file)
+        license_types, addresses, organizations = (self.license_types_fold(), self.addresses_fold(),
+                                                   self.organizations_fold())
+        for frame in licenses.frames([license_types, addresses, organizations]):
+            bulk.add_nodes("LicenseRecord", "pk", BulkExport.select(frame, {
+                "pk": "RECORD_ID",
+                "id": "LICENSE ID",
+                "name": lambda f: f['LEGAL NAME'].fillna(f['DOING BUSINESS AS NAME']),
+                "businessName": lambda f: f['DOING BUSINESS AS NAME'].fillna('-'),
+                "businessId": "ACCOUNT NUMBER",
+                "address": "ADDRESS",
+                "addressPostalCode": "ZIP CODE",
+                "addressState": "STATE",
+                "addressCity": "CITY",
+                "source": "DATA_SOURCE",
+                "amount": "Award Amount",
+                "date": "Approval Date",
+                "startDate": "LICENSE TERM START DATE",
+                "endDate": "LICENSE TERM EXPIRATION DATE",
+                "status": "LICENSE STATUS",
+                "code": "LICENSE CODE",
+                "number": "LICENSE NUMBER",
+                "siteNumber": "SITE NUMBER",
+                "latitude": "LATITUDE",
+                "longitude": "LONGITUDE"}))
+            bulk.add_relationships("HAS_LICENSE_TYPE", "LicenseRecord", "LicenseType",
+                                   BulkExport.select(frame, {"start": "RECORD_ID", "end": "LICENSE CODE"}))
+            bulk.add_relationships("ORG_HAS_LICENSE", "Organization", "LicenseRecord",
+                                   BulkExport.select(frame, {"start": "ACCOUNT NUMBER", "end": "RECORD_ID"}))
+
+        license_types = license_types.result().frame
+        bulk.add_nodes("LicenseType", "id", BulkExport.select(license_types, {"id": "LICENSE CODE",
+                                                                              "description": "LICENSE DESCRIPTION"}),
+                       merge=True)
+        addresses = addresses.result().frame
+        bulk.add_nodes("Address", "id", BulkExport.select(addresses, {"id": "ADDRESS",
+                                                                      "addressPostalCode": "ZIP CODE",
+                                                                      "addressState": "STATE",
+                                                                      "addressCity": "CITY",
+                                                                      "latitude": "LATITUDE",
+                                                                      "longitude": "LONGITUDE"}), merge=True)
+
+        organizations = organizations.result().frame
+        bulk.add_nodes("Organization", "id",
+                       organizations.rename(columns={"ACCOUNT NUMBER": "id", "DATA_SOURCE": "source"}),
+                       merge=True, finalize=lambda nodes: nodes.assign(name=BulkExport.shortest(nodes["names"])))
+        has_address = organizations.explode("addresses").dropna(subset=["addresses"])
+        bulk.add_relationships("HAS_ADDRESS", "Organization", "Address",
+                               BulkExport.select(has_address, {"start": "ACCOUNT NUMBER", "end": "addresses",
+                                                               "source": "DATA_SOURCE"}), merge=True)
 
 if __name__ == '__main__':
     importing = ChicagoLicensesImporter(argv=sys.argv[1:])
@@ -152,7 +293,7 @@ if __name__ == '__main__':
         print(base_path, "isn't a directory")
         sys.exit(1)
 
-    licenses_dat = base_path / "Business_Licenses_20240103.csv"
+    licenses_dat = CsvRowSource.resolve(base_path / "Business_Licenses_20240103.csv")
 
     if not licenses_dat.is_file():
         print(licenses_dat, "doesn't exist in ", base_path)
@@ -160,16 +301,6 @@ if __name__ == '__main__':
 
     logging.info("Setting constraints...")
     importing.set_constraints()
-    logging.info("Importing license records...")
-    importing.import_license_records(licenses_dat)
-    logging.info("Importing license types...")
-    importing.import_license_type(licenses_dat)
-    logging.info("Connecting licenses to types...")
-    importing.connect_license_to_type(licenses_dat)
-    logging.info("Importing organizations...")
-    importing.import_organization(licenses_dat)
-    logging.info("Connecting organizations to licenses...")
-    importing.connect_org_to_license(licenses_dat)
-    logging.info("Connecting people to organizations...")
-    importing.connect_people_to_org(licenses_dat)
+    logging.info("Importing licenses, types, organizations and their connections...")
+    importing.import_licenses(licenses_dat)
     importing.close()
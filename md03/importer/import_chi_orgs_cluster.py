@@ -1,7 +1,9 @@
+import re
 import sys
 import logging
 
 from util.base_importer import BaseImporter
+from util.name_similarity import dice, fuzzy_match
 
 logging.basicConfig(
     level=logging.INFO,
@@ -9,11 +11,31 @@ logging.basicConfig(
     datefmt='%H:%M:%S'
 )
 
+# the cleaning of create_org_similarity_by_address: common suffixes like 'Co', 'Ltd', 'Inc', 'Corp' and Lucene keywords
+SUFFIXES = re.compile(r"(?i)\b(?:co|ltd|inc|corp|llc|llp|pvt|gmbh|s.a.|s.l.|and|not)\b")
+NON_ALPHANUMERIC = re.compile(r"[^a-zA-Z0-9\s]")
+# the words of a name as split by the fulltext index analyzer, lower-cased
+TOKENS = re.compile(r"\w+(?:[.'’]\w+)*")
+# the placeholder of the contracts without address, skipped along with the groups over --max-address-group
+UNKNOWN_ADDRESS = "Unknown)"
+
+
+def clean_org_name(name: str) -> str:
+    return SUFFIXES.sub("", name).strip()
+
+
+def org_query_words(clean_name: str) -> list:
+    return [word for word in NON_ALPHANUMERIC.sub("", clean_name).split()
+            if len(word.strip()) > 2 and word.lower() not in ("and", "not")]
+
+
 class ChicagoOrgsSimilarity(BaseImporter):
 
     def __init__(self, argv):
         super().__init__(command=__file__, argv=argv)
         self.batch_size = 500
+        # Fulltext lookups make the cost per row very uneven, let the batch size follow the observed latency
+        self.enable_adaptive_batching(target_time=2.0, max_size=5000)
     
     def get_record_rows(self, nodes=None):
         full_name_query = """
@@ -22,6 +44,7 @@ class ChicagoOrgsSimilarity(BaseImporter):
               NOT n:RecordProcessed AND
               ($nodes IS NULL OR elementId(n) in $nodes)
         RETURN n.id as id
+        ORDER BY id
         """
         with self._driver.session(database=self.database) as session:
             result = session.run(full_name_query, {"nodes": nodes})
@@ -55,7 +78,30 @@ class ChicagoOrgsSimilarity(BaseImporter):
         with self._driver.session(database=self.database) as session:
             return session.run(query=count_cluster_query).single()["rows"]
 
+    def get_address_groups(self, max_group=None):
+        """
+        :param max_group: optional size over which the organizations of an address, and the ones of the
+          placeholder address, are skipped
+        :return: (organizations ordered by id, skipped) for every address shared by several organizations, the
+          organizations of a skipped address aren't returned
+        """
+        address_query = """
+        MATCH (a:Address)<-[:HAS_ADDRESS]-(o:Organization)
+        WHERE o.name IS NOT NULL
+        WITH a, o ORDER BY o.id
+        WITH a, collect({id: o.id, name: o.name, processed: o:RecordProcessed}) AS orgs
+        WHERE size(orgs) > 1
+        WITH orgs, $max_group IS NOT NULL AND (size(orgs) > $max_group OR a.id = $unknown) AS skipped
+        RETURN CASE WHEN skipped THEN [] ELSE orgs END AS orgs, skipped
+        """
+        with self._driver.session(database=self.database) as session:
+            result = session.run(address_query, {"unknown": UNKNOWN_ADDRESS, "max_group": max_group})
+            for record in iter(result):
+                yield record["orgs"], record["skipped"]
+
     def create_org_similarity_by_address(self, nodes=None):
+        if self.similarity_engine == "python":
+            return self.create_org_similarity_by_address_in_client(nodes)
         # TODO: Check the "and" issue. 
         # Needed to add this here: [x IN name_words WHERE size(trim(x)) > 2 AND trim(x) IS NOT NULL AND toLower(x) <> 'and']
         # But it should be filtered here: trim(apoc.text.regreplace(o.name, '(?i)\\b(?:co|ltd|inc|corp|llc|llp|pvt|gmbh|s.a.|s.l.|and)\\b', ''))
@@ -93,33 +139,94 @@ class ChicagoOrgsSimilarity(BaseImporter):
         ON CREATE SET r.score = simil
         """
         size = self.count_record_rows()
-        self.batch_store(create_org_similarity_by_address_query, self.get_record_rows(nodes), size=size)
+        self.batch_store(create_org_similarity_by_address_query, self.get_record_rows(nodes), size=size,
+                         desc="create_org_similarity_by_address")
+
+    def create_org_similarity_by_address_in_client(self, nodes=None):
+        """
+        Create the same IS_SIMILAR_TO {method: "SIMILAR_NAME+SAME_ADDRESS"} relationships as
+        create_org_similarity_by_address, comparing only the organizations sharing an Address
+          The fulltext query is replaced by the fuzzy match of the words in the client, so only the pairs of an
+          address group are compared instead of every fuzzy hit. The organizations are processed in id order
+          as the Cypher version does: a pair found from both sides gets a single relationship, towards the
+          organization processed first. With --max-address-group the placeholder address of the contracts
+          without one and the addresses shared by more organizations (e.g. registered agents) are skipped: their
+          pairs grow with the square of the group and the shared address doesn't tell the organizations apart.
+          The relationships are then no longer the same as the Cypher version's, so it's off by default.
+        :param nodes: optional element ids of the organizations to process, all the unprocessed ones by default
+        """
+        similar_orgs_query = """
+        UNWIND $batch as item
+        MATCH (o:Organization {id: item.target})
+        MATCH (node:Organization {id: item.source})
+        WHERE NOT EXISTS ((node)-[:IS_SIMILAR_TO]-(o))
+        MERGE (node)-[r:IS_SIMILAR_TO {method: "SIMILAR_NAME+SAME_ADDRESS"}]->(o)
+        ON CREATE SET r.score = item.score
+        """
+        processed_query = """
+        UNWIND $batch as item
+        MATCH (o:Organization {id: item.id})
+        SET o:RecordProcessed
+        """
+        targets = {row["id"] for row in self.get_record_rows(nodes)}
+        orgs = {}
+        pairs = set()
+        skipped_groups = 0
+        for group, skipped in self.get_address_groups(self.max_address_group):
+            skipped_groups += skipped
+            for org in group:
+                if org["id"] not in orgs:
+                    clean_name = clean_org_name(org["name"])
+                    orgs[org["id"]] = {**org, "clean_name": clean_name, "words": org_query_words(clean_name),
+                                       "tokens": TOKENS.findall(org["name"].lower())}
+            # the group is in id order, the order the organizations are processed in
+            ids = [org["id"] for org in group]
+            for i, org_id in enumerate(ids):
+                for other in ids[i + 1:]:
+                    pairs.add((org_id, other))
+
+        def finds(org, node):
+            # the fulltext query of org: all its words, fuzzy, in the name of node
+            return org["id"] in targets and bool(org["words"]) and \
+                all(fuzzy_match(word, node["tokens"], 0.3) for word in org["words"])
+
+        similarities = []
+        for first, second in pairs:
+            first, second = orgs[first], orgs[second]
+            if first["id"] not in targets and second["id"] not in targets:
+                continue
+            score = dice(first["clean_name"], second["clean_name"])
+            if score <= 0.3:
+                continue
+            if finds(first, second):
+                similarities.append({"source": second["id"], "target": first["id"], "score": score})
+            elif finds(second, first):
+                similarities.append({"source": first["id"], "target": second["id"], "score": score})
+        logging.info(f"Compared {len(pairs)} pairs of organizations sharing an address")
+        if skipped_groups:
+            logging.warning(f"Skipped {skipped_groups} addresses shared by more than {self.max_address_group} "
+                            f"organizations or unknown")
+        self.batch_store(similar_orgs_query, iter(similarities), size=len(similarities),
+                         desc="create_org_similarity_by_address_in_client")
+        self.batch_store(processed_query, ({"id": org_id} for org_id in targets), size=len(targets),
+                         desc="Organization:RecordProcessed")
     
-    def project_graph(self, node_label='Organization'):
+    def run_wcc(self, node_label='Organization'):
+        if self.wcc_engine == "python":
+            self.write_connected_components(node_label, ["IS_SIMILAR_TO"], "componentId", key="id")
+            return
         project_query = """
         CALL gds.graph.project(
-            'organizationResolved',
+            $graph_name,
             [$node_label],
             ['IS_SIMILAR_TO']
         ) 
         YIELD graphName, nodeCount, relationshipCount
         RETURN graphName, nodeCount, relationshipCount
         """
-        with self._driver.session(database=self.database) as session:
-            session.run(project_query, {"node_label": node_label})
-    
-    def run_WCC(self):
-        wcc_query = """
-        CALL gds.wcc.write('organizationResolved', { writeProperty: 'componentId' })
-        YIELD nodePropertiesWritten, componentCount;
-        """
-        with self._driver.session(database=self.database) as session:
-            session.run(query=wcc_query)
-    
-    def delete_projection(self):
-        delete_query = """CALL gds.graph.drop('organizationResolved')"""
-        with self._driver.session(database=self.database) as session:
-            session.run(query=delete_query)
+        with self.gds_projection('organizationResolved', project_query, {"node_label": node_label}) as graph:
+            graph.mutate('wcc', 'componentId')
+            graph.write()
     
     def create_record_clusters(self, node_label = 'Organization'):
         # TODO: To be improved
@@ -129,7 +236,7 @@ class ChicagoOrgsSimilarity(BaseImporter):
         YIELD batches, total return batches, total
         """.format(node_label)
         with self._driver.session(database=self.database) as session:
-            session.run(organization_query, {"node_label": node_label})
+            session.run(organization_query, {"node_label": node_label}).consume()
     
     def create_connections_to_clusters(self):
         connections_to_clusters_query = """
@@ -142,7 +249,8 @@ class ChicagoOrgsSimilarity(BaseImporter):
         SET c.sources = apoc.coll.toSet(coalesce(c.sources, []) + coalesce(p.source, []))
         """
         size = self.count_cluster_rows()
-        self.batch_store(connections_to_clusters_query, self.get_cluster_rows(), size=size)
+        self.batch_store(connections_to_clusters_query, self.get_cluster_rows(), size=size,
+                         desc="create_connections_to_clusters")
     
     def create_final_names_of_clusters(self):
         final_name_to_clusters_query = """
@@ -152,23 +260,25 @@ class ChicagoOrgsSimilarity(BaseImporter):
         SET c.name = shortestName
         """
         size = self.count_cluster_rows()
-        self.batch_store(final_name_to_clusters_query, self.get_cluster_rows(), size=size)
+        self.batch_store(final_name_to_clusters_query, self.get_cluster_rows(), size=size,
+                         desc="create_final_names_of_clusters")
 
+    def resolve_organizations(self):
+        """
+        Cluster the organizations: similarity by address, WCC components and Organization groups
+        """
+        logging.info("Creating similarity IS_SIMILAR_TO relationships...")
+        self.create_org_similarity_by_address()
+        logging.info("Running WCC algorithm...")
+        self.run_wcc()
+        logging.info("Creating organization clusters...")
+        self.create_record_clusters()
+        logging.info("Creating connections to clusters...")
+        self.create_connections_to_clusters()
+        logging.info("Creating cluster names...")
+        self.create_final_names_of_clusters()
 
 if __name__ == '__main__':
     importing = ChicagoOrgsSimilarity(argv=sys.argv[1:])
-    logging.info("Creating similarity IS_SIMILAR_TO relationships...")
-    importing.create_org_similarity_by_address()
-    logging.info("Creating graph projection...")
-    importing.project_graph()
-    logging.info("Running WCC algorithm...")
-    importing.run_WCC()
-    logging.info("Deleting projection...")
-    importing.delete_projection()
-    logging.info("Creating organization clusters...")
-    importing.create_record_clusters()
-    logging.info("Creating connections to clusters...")
-    importing.create_connections_to_clusters()
-    logging.info("Creating cluster names...")
-    importing.create_final_names_of_clusters()
+    importing.resolve_organizations()
     importing.close()
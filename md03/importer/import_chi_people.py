@@ -2,10 +2,10 @@ import sys
 import logging
 from pathlib import Path
 
-import numpy as np
-import pandas as pd
-
 from util.base_importer import BaseImporter
+from util.bulk_export import BulkExport
+from util.row_source import CsvRowSource
+from chi_schema import SCHEMA
 
 logging.basicConfig(
     level=logging.INFO,
@@ -18,31 +18,26 @@ class ChicagoPeopleImporter(BaseImporter):
     def __init__(self, argv):
         super().__init__(command=__file__, argv=argv)    
     
+    def get_csv_size(self, owners_file, encoding="utf-8"):
+        return len(self.get_source(owners_file))
+
     @staticmethod
-    def get_csv_size(owners_file, encoding="utf-8"):
-        return sum(1 for row in ChicagoPeopleImporter.get_rows(owners_file))
-    
-    @staticmethod
-    def get_rows(owners_file):
-        owners = pd.read_csv(owners_file)
+    def prepare_owners(owners, first_row=0):
         owners['DATA_SOURCE'] = "OWNERS"
         owners['RECORD_TYPE'] = "PERSON"
         if 'RECORD_ID' not in owners:
-            owners.insert(0, 'RECORD_ID', range(3000000, 3000000 + len(owners)))
-        owners.replace({np.nan: None}, inplace=True)
-        for _, row in owners.iterrows():
-            yield row.to_dict()
+            first_id = 3000000 + first_row
+            owners.insert(0, 'RECORD_ID', range(first_id, first_id + len(owners)))
+        return owners
+
+    def get_source(self, owners_file):
+        return CsvRowSource(owners_file, prepare=self.prepare_owners, chunk_rows=self.chunk_rows)
+
+    def get_rows(self, owners_file):
+        yield from self.get_source(owners_file)
     
     def set_constraints(self):
-        queries = ["CREATE CONSTRAINT person_id IF NOT EXISTS FOR (node:Person) REQUIRE node.clusterId IS UNIQUE",
-                   "CREATE CONSTRAINT person_record_pk IF NOT EXISTS FOR (node:PersonRecord) REQUIRE node.pk IS UNIQUE",
-                   "CREATE INDEX person_record_component_id IF NOT EXISTS FOR (node:PersonRecord) ON (node.componentId)",
-                   "CREATE INDEX person_record_employer_id IF NOT EXISTS FOR (node:PersonRecord) ON (node.employerId)",
-                   "CREATE FULLTEXT INDEX person_record_fullName IF NOT EXISTS FOR (node:PersonRecord) ON EACH [node.fullName]"]
-
-        for q in queries:
-            with self._driver.session(database=self.database) as session:
-                session.run(q)
+        self.apply_schema(SCHEMA)
     
     def import_people_records(self, owners_file):
         import_people_records_query = """
@@ -67,7 +62,35 @@ class ChicagoPeopleImporter(BaseImporter):
         SET n.title = item.Title
         """
         size = self.get_csv_size(owners_file)
-        self.batch_store(import_people_records_query, self.get_rows(owners_file), size=size)
+        self.batch_store(import_people_records_query, self.get_rows(owners_file), size=size, source=owners_file,
+                         strategy="pipelined", desc="import_people_records")
+
+    def export_people_records(self, owners_file, bulk: BulkExport):
+        """
+        Add the nodes created by import_people_records to a neo4j-admin bulk export
+        """
+        for frame in self.get_source(owners_file).frames():
+            bulk.add_nodes("PersonRecord", "pk", BulkExport.select(frame, {
+                "pk": "RECORD_ID",
+                "firstName": "Owner First Name",
+                "lastName": "Owner Last Name",
+                "middleName": "Owner Middle Initial",
+                "fullName": self.full_names,
+                "source": "DATA_SOURCE",
+                "employerId": "Account Number",
+                "title": "Title"}))
+
+    @staticmethod
+    def full_names(owners):
+        """
+        Same as the fullName expression of import_people_records
+        """
+        names = (owners['Owner First Name'].fillna('').astype(str) + ' ' +
+                 owners['Owner Middle Initial'].fillna('').astype(str) + ' ' +
+                 owners['Owner Last Name'].fillna('').astype(str)).str.replace(r"\s+", " ", regex=True).str.strip()
+        names = names.str.lower().str.replace(r"(^| )(\S)", lambda match: match.group(1) + match.group(2).upper(),
+                                              regex=True)
+        return names.where(names != '')
 
 
 if __name__ == '__main__':
@@ -84,7 +107,7 @@ if __name__ == '__main__':
         print(base_path, "isn't a directory")
         sys.exit(1)
 
-    owners_dat = base_path / "Business_Owners_20240103.csv"
+    owners_dat = CsvRowSource.resolve(base_path / "Business_Owners_20240103.csv")
 
     if not owners_dat.is_file():
         print(owners_dat, "doesn't exist in ", base_path)
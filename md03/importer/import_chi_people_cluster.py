@@ -1,8 +1,8 @@
 import sys
 import logging
-import time
 
 from util.base_importer import BaseImporter
+from util.name_similarity import SimilarNames
 
 logging.basicConfig(
     level=logging.INFO,
@@ -15,6 +15,8 @@ class ChicagoPeopleSimilarity(BaseImporter):
     def __init__(self, argv):
         super().__init__(command=__file__, argv=argv)
         self.batch_size = 500
+        # Fulltext lookups make the cost per row very uneven, let the batch size follow the observed latency
+        self.enable_adaptive_batching(target_time=2.0, max_size=5000)
     
     def get_record_rows(self, nodes=None):
         full_name_query = """
@@ -56,7 +58,20 @@ class ChicagoPeopleSimilarity(BaseImporter):
         with self._driver.session(database=self.database) as session:
             return session.run(query=count_cluster_query).single()["rows"]
 
+    def get_name_rows(self):
+        name_query = """
+        MATCH (n:PersonRecord)
+        WHERE NOT (n.fullName IS NULL OR n.fullName = " " OR n.fullName = "?")
+        RETURN n.pk as pk, n.fullName as fullName, elementId(n) as id, n:RecordProcessed as processed
+        """
+        with self._driver.session(database=self.database) as session:
+            result = session.run(name_query)
+            for record in iter(result):
+                yield dict(record)
+
     def create_people_similarity(self, nodes=None):
+        if self.similarity_engine == "python":
+            return self.create_people_similarity_in_client(nodes)
         create_people_similarity_query = """
         UNWIND $batch as item
         MATCH (p:PersonRecord {pk: item.pk})
@@ -76,34 +91,50 @@ class ChicagoPeopleSimilarity(BaseImporter):
         ON CREATE SET r.score = simil
         """
         size = self.count_record_rows()
-        self.batch_store(create_people_similarity_query, self.get_record_rows(nodes), size=size)
-    
-    def project_wcc_graph(self, node_label='PersonRecord'):
-        project_query = """
-        CALL gds.graph.project(
-            'personWcc',
-            [$node_label],
-            ['IS_SIMILAR_TO']
-        ) 
-        YIELD graphName, nodeCount, relationshipCount
-        RETURN graphName, nodeCount, relationshipCount
+        self.batch_store(create_people_similarity_query, self.get_record_rows(nodes), size=size,
+                         desc="create_people_similarity")
+
+    def create_people_similarity_in_client(self, nodes=None):
         """
-        with self._driver.session(database=self.database) as session:
-            session.run(project_query, {"node_label": node_label})
-    
-    def run_wcc(self):
-        wcc_query = """
-        CALL gds.wcc.write('personWcc', { writeProperty: 'componentId' })
-        YIELD nodePropertiesWritten, componentCount;
+        Create the same IS_SIMILAR_TO {method: "SIMILAR_NAME"} relationships as create_people_similarity, scoring
+        the names in the client (see SimilarNames) instead of running a fulltext query per record
+          The names are read once. Every record to process gets a relationship from each other record whose
+          name is more similar than 0.695, without the fulltext fuzzy match of each word as a prefilter. When
+          nodes are given (e.g. a CDC batch) only the blocks of their names are scored.
+        :param nodes: optional element ids of the records to process, all the unprocessed ones by default
         """
-        with self._driver.session(database=self.database) as session:
-            session.run(query=wcc_query)
+        similar_names_query = """
+        UNWIND $batch as item
+        MATCH (node:PersonRecord {pk: item.source})
+        MATCH (p:PersonRecord {pk: item.target})
+        MERGE (node)-[r:IS_SIMILAR_TO {method: "SIMILAR_NAME"}]->(p)
+        ON CREATE SET r.score = item.score
+        """
+        processed_query = """
+        UNWIND $batch as item
+        MATCH (p:PersonRecord {pk: item.pk})
+        SET p:RecordProcessed
+        """
+        names = SimilarNames(0.695)
+        targets = set()
+        nodes = set(nodes) if nodes is not None else None
+        for row in self.get_name_rows():
+            names.add(row["pk"], row["fullName"])
+            if not row["processed"] and (nodes is None or row["id"] in nodes):
+                targets.add(row["pk"])
+        logging.info(f"Scoring {len(names)} distinct names")
+        similarities = []
+        pairs = names.pairs() if nodes is None else names.pairs_for(targets)
+        for pk, other, score in pairs:
+            if other in targets:
+                similarities.append({"source": pk, "target": other, "score": score})
+            if pk in targets:
+                similarities.append({"source": other, "target": pk, "score": score})
+        self.batch_store(similar_names_query, iter(similarities), size=len(similarities),
+                         desc="create_people_similarity_in_client")
+        self.batch_store(processed_query, ({"pk": pk} for pk in targets), size=len(targets),
+                         desc="PersonRecord:RecordProcessed")
     
-    def delete_wcc_projection(self):
-        delete_query = """CALL gds.graph.drop('personWcc')"""
-        with self._driver.session(database=self.database) as session:
-            session.run(query=delete_query)
-
     def create_record_clusters(self, node_label = 'PersonRecord'):
         # TODO: To be improved
         person_query = """
@@ -112,7 +143,7 @@ class ChicagoPeopleSimilarity(BaseImporter):
         YIELD batches, total return batches, total
         """.format(node_label)
         with self._driver.session(database=self.database) as session:
-            session.run(person_query, {"node_label": node_label})
+            session.run(person_query, {"node_label": node_label}).consume()
     
     def create_connections_to_clusters(self):
         connections_to_clusters_query = """
@@ -125,7 +156,8 @@ class ChicagoPeopleSimilarity(BaseImporter):
         SET c.titles = coalesce(c.titles, []) + p.title
         """
         size = self.count_cluster_rows()
-        self.batch_store(connections_to_clusters_query, self.get_cluster_rows(), size=size)
+        self.batch_store(connections_to_clusters_query, self.get_cluster_rows(), size=size,
+                         desc="create_connections_to_clusters")
     
     def create_final_names_of_clusters(self):
         final_name_to_clusters_query = """
@@ -135,36 +167,47 @@ class ChicagoPeopleSimilarity(BaseImporter):
         SET c.name = shortestName
         """
         size = self.count_cluster_rows()
-        self.batch_store(final_name_to_clusters_query, self.get_cluster_rows(), size=size)
+        self.batch_store(final_name_to_clusters_query, self.get_cluster_rows(), size=size,
+                         desc="create_final_names_of_clusters")
     
-    def project_louvain_graph(self):
-        louvain_project_query = """
-        MATCH (source:PersonRecord)-[r:IS_SIMILAR_TO]->(target)
-        WITH source, target, collect(r.score) as scores
-        WITH source, target, apoc.coll.sum(scores) as total_score
+    def run_clustering_algorithms(self):
+        """
+        Compute the WCC components (componentId) and the Louvain communities (louvainIntermediateCommunities) of
+        the person records on a single projection
+          Records without similar ones are projected too, so that every record gets its own component, while
+          Louvain runs on the sub-graph of the records with similar ones, filtered from the same projection. The
+          intermediate communities can't be mutated on every GDS version, Louvain writes them with gds.louvain.write
+          as before.
+          With --wcc-engine=python only the components are computed, in the client.
+        """
+        if self.wcc_engine == "python":
+            self.write_connected_components("PersonRecord", ["IS_SIMILAR_TO"], "componentId", key="pk")
+            logging.warning("Louvain needs GDS, the Louvain communities are not computed with --wcc-engine=python")
+            return
+        projection_query = """
+        MATCH (source:PersonRecord)
+        OPTIONAL MATCH (source)-[r:IS_SIMILAR_TO]->(target:PersonRecord)
+        WITH source, target, sum(r.score) as total_score
         WITH gds.graph.project(
-            'personLouvain',
+            $graph_name,
             source,
             target,
             {relationshipProperties: {total_score: total_score}}
         ) as g
         RETURN g.graphName AS graph, g.nodeCount AS nodes, g.relationshipCount AS rels
         """
-        with self._driver.session(database=self.database) as session:
-            session.run(query=louvain_project_query)
-    
-    def run_louvain(self):
-        louvain_query = """
-        CALL gds.louvain.write('personLouvain', {
-                relationshipWeightProperty: 'total_score',
-                writeProperty: 'louvainIntermediateCommunities',
-                includeIntermediateCommunities: true
-            }
-        )
-        YIELD communityCount, modularity, modularities
+        filter_query = """
+        CALL gds.graph.filter($graph_name, $from_graph, 'n.similarRecords > 0.0', '*')
+        YIELD graphName, nodeCount, relationshipCount
+        RETURN graphName, nodeCount, relationshipCount
         """
-        with self._driver.session(database=self.database) as session:
-            session.run(query=louvain_query)
+        with self.gds_projection('personClusters', projection_query) as graph:
+            graph.mutate('wcc', 'componentId')
+            graph.write(['componentId'])
+            graph.mutate('degree', 'similarRecords', orientation='UNDIRECTED')
+            with self.gds_projection('personLouvain', filter_query, {"from_graph": graph.graph_name}) as similar:
+                similar.write_algorithm('louvain', 'louvainIntermediateCommunities',
+                                        relationshipWeightProperty='total_score', includeIntermediateCommunities=True)
     
     def set_louvain_cluster(self):
         louvain_query = """
@@ -172,41 +215,27 @@ class ChicagoPeopleSimilarity(BaseImporter):
         SET p.louvain = toIntegerList(p.louvainIntermediateCommunities)[0]
         """
         with self._driver.session(database=self.database) as session:
-            session.run(query=louvain_query)
+            session.run(query=louvain_query).consume()
     
-    def delete_louvain_projection(self):
-        delete_query = """CALL gds.graph.drop('personLouvain')"""
-        with self._driver.session(database=self.database) as session:
-            session.run(query=delete_query)
+    def resolve_people(self):
+        """
+        Cluster the person records: similarity, WCC components, Person clusters and Louvain communities
+          Every step returns once its queries are consumed, so the next one sees its writes.
+        """
+        logging.info("Creating similarity IS_SIMILAR_TO relationships...")
+        self.create_people_similarity()
+        logging.info("Running WCC and Louvain...")
+        self.run_clustering_algorithms()
+        logging.info("Creating person clusters...")
+        self.create_record_clusters()
+        logging.info("Creating connections to clusters...")
+        self.create_connections_to_clusters()
+        logging.info("Creating cluster names...")
+        self.create_final_names_of_clusters()
+        logging.info("Set Louvain cluster...")
+        self.set_louvain_cluster()
 
 if __name__ == '__main__':
     importing = ChicagoPeopleSimilarity(argv=sys.argv[1:])
-    logging.info("Creating similarity IS_SIMILAR_TO relationships...")
-    importing.create_people_similarity()
-    logging.info("Creating WCC graph projection...")
-    importing.project_wcc_graph()
-    time.sleep(5)
-    logging.info("Running WCC algorithm...")
-    importing.run_wcc()
-    time.sleep(5)
-    logging.info("Deleting WCC projection...")
-    importing.delete_wcc_projection()
-    time.sleep(5)
-    logging.info("Creating person clusters...")
-    importing.create_record_clusters()
-    logging.info("Creating connections to clusters...")
-    importing.create_connections_to_clusters()
-    logging.info("Creating cluster names...")
-    importing.create_final_names_of_clusters()
-    logging.info("Creating Louvain projection....")
-    importing.project_louvain_graph()
-    time.sleep(5)
-    logging.info("Running Louvain algorithm...")
-    importing.run_louvain()
-    time.sleep(5)
-    logging.info("Set Louvain cluster...")
-    importing.set_louvain_cluster()
-    logging.info("Deleting Louvain projection...")
-    importing.delete_louvain_projection()
-    time.sleep(5)
+    importing.resolve_people()
     importing.close()
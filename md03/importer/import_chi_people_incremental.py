@@ -0,0 +1,162 @@
+import logging
+import time
+
+from util.base_importer import BaseImporter
+from util.connected_components import IncrementalComponents
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] %(levelname)s - %(message)s',
+    datefmt='%H:%M:%S'
+)
+
+
+class ChicagoIncrementalPeopleResolver(BaseImporter):
+    """
+    Resolve the person records of a CDC batch into the existing Person clusters without recomputing WCC
+      The component index is the graph itself: every resolved record points to its Person with
+      RECORD_RESOLVED_TO and Person.clusterId is unique. Only the clusters of the batch's records are read, the
+      new IS_SIMILAR_TO relationships are applied as unions (see IncrementalComponents) and, when a batch
+      connects several clusters, the smaller ones are merged into the largest. The Person nodes written are the
+      ones whose membership changed, so the cost follows the batch, not the size of the clusters it touches.
+    """
+
+    def __init__(self, argv):
+        super().__init__(command=__file__, argv=argv)
+
+    @staticmethod
+    def changed_records(changes):
+        """
+        :param changes: CDC change records, as returned by CDCService
+        :return: (records, relationships) the element ids of the PersonRecord nodes created and the
+          (start, end) element ids of the IS_SIMILAR_TO relationships created
+        """
+        records = set()
+        relationships = []
+        for change in changes:
+            event = change["event"]
+            if event.get("operation") != "c":
+                continue
+            if event.get("eventType") == "n" and "PersonRecord" in (event.get("labels") or []):
+                records.add(event["elementId"])
+            elif event.get("eventType") == "r" and event.get("type") == "IS_SIMILAR_TO":
+                relationships.append((event["start"]["elementId"], event["end"]["elementId"]))
+        return records, relationships
+
+    def unmatched_changes(self, changes) -> list:
+        """
+        :param changes: CDC change records
+        :return: the changes creating a PersonRecord not connected by any IS_SIMILAR_TO relationship, i.e. the
+          records that no relationship change will ever bring to resolve
+        """
+        unmatched_query = """
+        UNWIND $records AS id
+        MATCH (n:PersonRecord) WHERE elementId(n) = id AND NOT (n)-[:IS_SIMILAR_TO]-(:PersonRecord)
+        RETURN id
+        """
+        records, _ = self.changed_records(changes)
+        with self._driver.session(database=self.database) as session:
+            unmatched = {row["id"] for row in session.run(unmatched_query, {"records": list(records)}).data()}
+        return [change for change in changes if change["event"].get("elementId") in unmatched]
+
+    @staticmethod
+    def new_cluster_id(pk: int) -> int:
+        return -1 - pk
+
+    def lookup_clusters(self, session, records):
+        lookup_query = """
+        UNWIND $records AS id
+        MATCH (n:PersonRecord) WHERE elementId(n) = id
+        OPTIONAL MATCH (n)-[:RECORD_RESOLVED_TO]->(p:Person)
+        RETURN id, n.pk AS pk, p.clusterId AS cluster,
+               CASE WHEN p IS NULL THEN 0 ELSE COUNT { (p)<-[:RECORD_RESOLVED_TO]-(:PersonRecord) } END AS size
+        """
+        rows = session.run(lookup_query, {"records": list(records)}).data()
+        clusters = {row["id"]: row["cluster"] for row in rows}
+        sizes = {row["cluster"]: row["size"] for row in rows if row["cluster"] is not None}
+        pks = {row["id"]: row["pk"] for row in rows}
+        return clusters, sizes, pks
+
+    def merge_clusters(self, session, merged):
+        merge_query = """
+        UNWIND $merges AS merge
+        MATCH (source:Person {clusterId: merge.source})
+        MATCH (target:Person {clusterId: merge.target})
+        SET target.fullNames = coalesce(target.fullNames, []) + coalesce(source.fullNames, [])
+        SET target.employerIds = coalesce(target.employerIds, []) + coalesce(source.employerIds, [])
+        SET target.titles = coalesce(target.titles, []) + coalesce(source.titles, [])
+        SET target.newCluster = true
+        WITH source, target
+        CALL {
+            WITH source, target
+            MATCH (r:PersonRecord)-[:RECORD_RESOLVED_TO]->(source)
+            SET r.oldComponentId = coalesce(r.oldComponentId, r.componentId)
+            SET r.componentId = target.clusterId
+            MERGE (r)-[:RECORD_RESOLVED_TO]->(target)
+        }
+        DETACH DELETE source
+        """
+        merges = [{"source": source, "target": target} for source, target in merged.items()]
+        session.run(merge_query, {"merges": merges}).consume()
+
+    def assign_records(self, session, assigned):
+        assign_query = """
+        UNWIND $records AS item
+        MATCH (n:PersonRecord) WHERE elementId(n) = item.id
+        MERGE (p:Person {clusterId: item.cluster})
+        SET p.newCluster = true
+        SET n.componentId = item.cluster
+        MERGE (n)-[:RECORD_RESOLVED_TO]->(p)
+        SET p.fullNames = coalesce(p.fullNames, []) + n.fullName
+        SET p.employerIds = coalesce(p.employerIds, []) + n.employerId
+        SET p.titles = coalesce(p.titles, []) + n.title
+        """
+        records = [{"id": record, "cluster": cluster} for record, cluster in assigned.items()]
+        session.run(assign_query, {"records": records}).consume()
+
+    def update_clusters(self, session, clusters):
+        name_query = """
+        UNWIND $clusters AS cluster
+        MATCH (p:Person {clusterId: cluster})
+        SET p.name = reduce(shortest = head(p.fullNames), name IN p.fullNames | CASE WHEN size(name) < size(shortest) THEN name ELSE shortest END)
+        WITH p
+        UNWIND p.employerIds AS employerId
+        MATCH (o:Organization {id: employerId})
+        MERGE (p)-[r:BELONGS_TO_ORG]->(o)
+        SET r.roles = p.titles
+        """
+        session.run(name_query, {"clusters": list(clusters)}).consume()
+
+    def resolve(self, changes) -> dict:
+        """
+        Resolve the records created and connected by a batch of CDC changes
+        :param changes: CDC change records, the creations of PersonRecord nodes and IS_SIMILAR_TO relationships
+          are used, the others are ignored
+        :return: the number of clusters merged, records assigned and Person nodes updated
+        """
+        stage = "incremental_resolution"
+        self.metrics.start_stage(stage)
+        start = time.perf_counter()
+        records, relationships = self.changed_records(changes)
+        records.update(node for relationship in relationships for node in relationship)
+        with self._driver.session(database=self.database) as session:
+            clusters, sizes, pks = self.lookup_clusters(session, records)
+            components = IncrementalComponents(clusters, sizes)
+            for source, target in relationships:
+                components.add_relationship(source, target)
+            # a group of new records only is a new cluster, identified by one of its records: an integer as the
+            # WCC component ids, negative so that it never collides with one of them
+            merged, assigned = components.resolve(lambda record: self.new_cluster_id(pks[record]))
+            if merged:
+                logging.info(f"Merging {len(merged)} clusters")
+                self.merge_clusters(session, merged)
+            if assigned:
+                self.assign_records(session, assigned)
+            updated = set(merged.values()) | set(assigned.values())
+            if updated:
+                self.update_clusters(session, updated)
+        self.metrics.record_batch(stage, len(records), 0.0, time.perf_counter() - start, [])
+        stats = {"clustersMerged": len(merged), "recordsAssigned": len(assigned), "clustersUpdated": len(updated)}
+        self.metrics.finish_stage(stage, **stats)
+        logging.info(f"Resolved {len(records)} records: {stats}")
+        return stats
@@ -0,0 +1,110 @@
+import sys
+import logging
+from pathlib import Path
+
+from util.base_importer import BaseImporter
+from util.pipeline import Pipeline
+from util.row_source import CsvRowSource
+from chi_schema import SCHEMA
+from import_chi_people import ChicagoPeopleImporter
+from import_chi_people_cluster import ChicagoPeopleSimilarity
+from import_chi_licenses import ChicagoLicensesImporter
+from import_chi_contracts import ChicagoContractsImporter
+from import_chi_orgs_cluster import ChicagoOrgsSimilarity
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] %(levelname)s - %(message)s',
+    datefmt='%H:%M:%S'
+)
+
+PIPELINE_OPTIONS = ['pipeline-state=', 'stages=', 'force', 'metrics-dir=']
+# the importers write their metrics to --metrics-dir instead, and share the pipeline's checkpoint journal
+IMPORTER_OPTIONS = ['metrics-json=', 'metrics-prom=', 'checkpoint=', 'reject-file=']
+
+
+class ChicagoImportPipeline(BaseImporter):
+    """
+    Import the Chicago graph in a single process, running the importers' stages as a dependency graph
+      schema -> people -> people_cluster ----> connect_people
+             -> licenses ---------------------^
+                         -> contracts -> orgs_cluster
+      The people records load concurrently with the licenses and contracts. Contracts run after licenses, as
+      they SET the properties of the same Organization and Address nodes and the last writer must not depend
+      on the thread timing. With --pipeline-state the stages whose csv files didn't change since the last run
+      are skipped, --force runs them anyway and --stages runs only the given stages (and the ones they depend on).
+    """
+
+    def __init__(self, argv):
+        super().__init__(command=__file__, argv=argv, extended_long_options=PIPELINE_OPTIONS)
+        self.targets = [name for name in self.get_option(['--stages'], '').split(',') if name]
+        self.metrics_dir = self.get_option(['--metrics-dir'])
+        self.pipeline = Pipeline(self.get_option(['--pipeline-state']), workers=self.workers,
+                                 force=any(opt == '--force' for opt, _ in self.opts))
+        importer_argv = self.strip_options(argv, PIPELINE_OPTIONS + IMPORTER_OPTIONS)
+        self.people = ChicagoPeopleImporter(argv=importer_argv)
+        self.people_cluster = ChicagoPeopleSimilarity(argv=importer_argv)
+        self.licenses = ChicagoLicensesImporter(argv=importer_argv)
+        self.contracts = ChicagoContractsImporter(argv=importer_argv)
+        self.orgs_cluster = ChicagoOrgsSimilarity(argv=importer_argv)
+        # a single journal, its lock serializes the commits of the stages running concurrently
+        for importer in self.importers():
+            importer.checkpoint = self.checkpoint
+        if self.metrics_dir:
+            Path(self.metrics_dir).mkdir(parents=True, exist_ok=True)
+            for importer in self.importers():
+                importer.metrics_json = Path(self.metrics_dir) / f"{importer.metrics.run_name}.json"
+                importer.metrics_prom = Path(self.metrics_dir) / f"{importer.metrics.run_name}.prom"
+
+    def importers(self):
+        return [self.people, self.people_cluster, self.licenses, self.contracts, self.orgs_cluster]
+
+    def declare(self, owners_file, licenses_file, contracts_file):
+        self.pipeline \
+            .stage("schema", lambda: self.apply_schema(SCHEMA), cache=False) \
+            .stage("people", lambda: self.people.import_people_records(owners_file),
+                   depends=["schema"], inputs=[owners_file]) \
+            .stage("licenses", lambda: self.licenses.import_licenses(licenses_file, connect_people=False),
+                   depends=["schema"], inputs=[licenses_file]) \
+            .stage("contracts", lambda: self.contracts.import_contracts(contracts_file),
+                   depends=["licenses"], inputs=[contracts_file]) \
+            .stage("people_cluster", self.people_cluster.resolve_people, depends=["people"]) \
+            .stage("connect_people", lambda: self.licenses.connect_people_to_org(licenses_file),
+                   depends=["licenses", "people_cluster"], inputs=[licenses_file]) \
+            .stage("orgs_cluster", self.orgs_cluster.resolve_organizations, depends=["contracts"])
+
+    def run(self):
+        return self.pipeline.run(self.targets or None)
+
+    def close(self):
+        for importer in self.importers():
+            importer.close()
+        super().close()
+
+
+if __name__ == '__main__':
+    importing = ChicagoImportPipeline(argv=sys.argv[1:])
+    base_path = importing.source_dataset_path
+
+    if not base_path:
+        print("source path directory is mandatory. Setting it to default.")
+        base_path = "../dataset/chicago/"
+
+    base_path = Path(base_path)
+
+    if not base_path.is_dir():
+        print(base_path, "isn't a directory")
+        sys.exit(1)
+
+    owners_dat = CsvRowSource.resolve(base_path / "Business_Owners_20240103.csv")
+    licenses_dat = CsvRowSource.resolve(base_path / "Business_Licenses_20240103.csv")
+    contracts_dat = CsvRowSource.resolve(base_path / "Contracts_20240103.csv")
+
+    for dat in [owners_dat, licenses_dat, contracts_dat]:
+        if not dat.is_file():
+            print(dat, "doesn't exist in ", base_path)
+            sys.exit(1)
+
+    importing.declare(owners_dat, licenses_dat, contracts_dat)
+    importing.run()
+    importing.close()
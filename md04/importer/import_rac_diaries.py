@@ -4,7 +4,7 @@ import json
 from pathlib import Path
 
 from util.base_importer import BaseImporter
-from neo4j.exceptions import ClientError as Neo4jClientError
+from rac_schema import SCHEMA
 
 class RacDiariesImporter(BaseImporter):
     def __init__(self, argv):
@@ -12,27 +12,7 @@ class RacDiariesImporter(BaseImporter):
         self.set_constraints()
 
     def set_constraints(self):
-        with self._driver.session(database=self.database) as session:
-            query = """
-                CREATE CONSTRAINT IF NOT EXISTS FOR (n:File) REQUIRE n.name IS NODE KEY;
-                CREATE CONSTRAINT IF NOT EXISTS FOR (n:Page) REQUIRE n.id IS NODE KEY;
-                CREATE TEXT INDEX node_entity_name IF NOT EXISTS FOR (n:Entity) ON (n.name);
-                CREATE CONSTRAINT IF NOT EXISTS FOR (n:Person) REQUIRE n.name_normalized IS NODE KEY;
-                CREATE CONSTRAINT IF NOT EXISTS FOR (n:Organization) REQUIRE n.name_normalized IS NODE KEY;
-                CREATE CONSTRAINT IF NOT EXISTS FOR (n:Occupation) REQUIRE n.name_normalized IS NODE KEY;
-                CREATE CONSTRAINT IF NOT EXISTS FOR (n:Title) REQUIRE n.name_normalized IS NODE KEY;
-                CREATE TEXT INDEX IF NOT EXISTS FOR (n:Person) ON (n.name_normalized);
-                CREATE TEXT INDEX IF NOT EXISTS FOR (n:Organization) ON (n.name_normalized);
-                CREATE TEXT INDEX IF NOT EXISTS FOR (n:Occupation) ON (n.name_normalized);
-                CREATE TEXT INDEX IF NOT EXISTS FOR (n:Title) ON (n.name_normalized);
-                CREATE TEXT INDEX rel_text_entities IF NOT EXISTS FOR ()-[r:RELATED_TO_ENTITY]-() ON (r.type)"""
-            for q in query.split(";"):
-                try:
-                    session.run(q)
-                except Neo4jClientError as e:
-                    # ignore if we already have the rule in place
-                    if e.code != "Neo.ClientError.Schema.EquivalentSchemaRuleAlreadyExists":
-                        raise e
+        self.apply_schema(SCHEMA)
 
     @staticmethod
     def count_diaries(diaries_file):
@@ -56,7 +36,8 @@ class RacDiariesImporter(BaseImporter):
         MERGE (f)-[:CONTAINS_PAGE]->(p)
         """
         size = self.count_diaries(diaries_file)
-        self.batch_store(import_diaries_query, self.get_diaries(diaries_file), size=size)
+        self.batch_store(import_diaries_query, self.get_diaries(diaries_file), size=size, source=diaries_file,
+                         desc="import_diaries")
     
 if __name__ == '__main__':
     importing = RacDiariesImporter(argv=sys.argv[1:])
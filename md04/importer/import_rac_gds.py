@@ -17,7 +17,7 @@ class RacGds(BaseImporter):
         QUERY_GRAPH_PROJECTION = """
         MATCH (e1:Person)-[r:TALKED_ABOUT|TALKED_WITH|WORKS_WITH]->(e2:Person)
         WHERE e1.name <> "WW" AND e2.name <> "WW" AND e1.name <> "Warren Weaver" AND e2.name <> "Warren Weaver" // WW is Warren Weaver, the author of these diaries
-        WITH gds.graph.project('graph', e1, e2,
+        WITH gds.graph.project($graph_name, e1, e2,
           {
             sourceNodeLabels: labels(e1),
             targetNodeLabels: labels(e2),
@@ -28,85 +28,47 @@ class RacGds(BaseImporter):
         RETURN g.graphName AS graph, g.nodeCount AS nodes, g.relationshipCount AS rels
         """
 
-        QUERY_DROP_PROJECTION = "CALL gds.graph.drop('graph') YIELD graphName"
-
-        QUERY_WCC = """
-        CALL gds.wcc.write('graph', { writeProperty: 'wcc' })
-        YIELD nodePropertiesWritten, componentCount
-        """
-
-        # run WCC to identify the largest connected component
-        print("Running WCC to identify isolated sub-graphs")
-        with self._driver.session(database=self.database) as session:
-            session.run(QUERY_GRAPH_PROJECTION)
-            session.run(QUERY_WCC)
-            session.run(QUERY_DROP_PROJECTION)
-
-        QUERY_GRAPH_PROJECTION_SELECTED = """
+        QUERY_LARGEST_WCC = """
         MATCH (p:Person)
         WHERE p.wcc is not Null
         WITH p.wcc AS component, count(*) AS num
         ORDER BY num DESC
         LIMIT 1
-    
-        WITH component AS largest_wcc
-    
-        MATCH (e1:Person)-[r:TALKED_ABOUT|TALKED_WITH|WORKS_WITH]->(e2:Person)
-        WHERE e1.name <> "WW" AND e2.name <> "WW" AND e1.name <> "Warren Weaver" AND e2.name <> "Warren Weaver" AND e1.wcc = largest_wcc AND e2.wcc = largest_wcc
-        WITH gds.graph.project('graph', e1, e2,
-            {
-                sourceNodeLabels: labels(e1),
-                targetNodeLabels: labels(e2),
-                relationshipType: type(r)
-                //relationshipProperties: r { .count }
-            },
-            {undirectedRelationshipTypes: ['*']}
-        ) AS g
-        RETURN g.graphName AS graph, g.nodeCount AS nodes, g.relationshipCount AS rels
+        RETURN component AS largest_wcc
         """
 
-        QUERY_PAGERANK = """
-        CALL gds.pageRank.write('graph', {
-          maxIterations: 100,
-          dampingFactor: 0.85,
-          writeProperty: $property
-        })
-        YIELD nodePropertiesWritten, ranIterations
+        QUERY_FILTER_LARGEST_WCC = """
+        CALL gds.graph.filter($graph_name, $from_graph, 'n.wcc = $largest_wcc', '*', {parameters: {largest_wcc: $largest_wcc}})
+        YIELD graphName, nodeCount, relationshipCount
+        RETURN graphName, nodeCount, relationshipCount
         """
 
-        QUERY_EIGENVECTOR = """
-        CALL gds.eigenvector.write('graph', {
-          maxIterations: 100,
-          writeProperty: $property
-        })
-        YIELD nodePropertiesWritten, ranIterations
-        """
-
-        QUERY_BETWEENNESS = """
-        CALL gds.betweenness.write('graph', { 
-          writeProperty: 'betweenness'
-        })
-        YIELD centralityDistribution, nodePropertiesWritten
-        RETURN centralityDistribution.min AS minimumScore, centralityDistribution.mean AS meanScore, nodePropertiesWritten
-        """
-
-        QUERY_LOUVAIN = """
-        CALL gds.louvain.write('graph', { writeProperty: 'community' }) 
-        YIELD communityCount, modularity, modularities
-        """
+        # run WCC to identify the largest connected component, then the centrality algorithms on its sub-graph
+        # filtered from the same projection
+        print("Running WCC to identify isolated sub-graphs")
+        with self.gds_projection('graph', QUERY_GRAPH_PROJECTION) as graph:
+            graph.mutate('wcc', 'wcc')
+            graph.write()
+            with self._driver.session(database=self.database) as session:
+                record = session.run(QUERY_LARGEST_WCC).single()
+            if record is None:
+                # the centrality and influencers analyses both run on the largest component
+                print("No Person component, skipping the centrality algorithms")
+                return
+            largest_wcc = record["largest_wcc"]
 
-        print("Running centrality algorithms ...")
-        with self._driver.session(database=self.database) as session:
-            session.run(QUERY_GRAPH_PROJECTION_SELECTED)
-            print("\tPageRank")
-            session.run(QUERY_PAGERANK, property="pagerank")
-            print("\teigenvector centrality")
-            session.run(QUERY_EIGENVECTOR, property="eigenvector")
-            print("\tbetweenness centrality")
-            session.run(QUERY_BETWEENNESS)
-            print("\tLouvain community detection")
-            session.run(QUERY_LOUVAIN)
-            session.run(QUERY_DROP_PROJECTION)
+            print("Running centrality algorithms ...")
+            with self.gds_projection('largestWcc', QUERY_FILTER_LARGEST_WCC,
+                                     {"from_graph": graph.graph_name, "largest_wcc": largest_wcc}) as largest:
+                print("\tPageRank")
+                largest.mutate('pageRank', 'pagerank', maxIterations=100, dampingFactor=0.85)
+                print("\teigenvector centrality")
+                largest.mutate('eigenvector', 'eigenvector', maxIterations=100)
+                print("\tbetweenness centrality")
+                largest.mutate('betweenness', 'betweenness')
+                print("\tLouvain community detection")
+                largest.mutate('louvain', 'community')
+                largest.write()
 
         QUERY_PROJECTION_INFLUENCERS = """
         MATCH (p:Person)
@@ -119,7 +81,7 @@ class RacGds(BaseImporter):
     
         MATCH (e1:Person)-[r:TALKED_ABOUT|TALKED_WITH|WORKS_WITH]->(e2:Person)
         WHERE e1.name <> "WW" AND e2.name <> "WW" AND e1.name <> "Warren Weaver" AND e2.name <> "Warren Weaver" AND e1.wcc = largest_wcc AND e2.wcc = largest_wcc
-        WITH gds.graph.project('graph', e1, e2,
+        WITH gds.graph.project($graph_name, e1, e2,
             {
                 sourceNodeLabels: labels(e2), // we want to inverse the TALKED_ABOUT relations for influencer analysis
                 targetNodeLabels: labels(e1),
@@ -131,13 +93,12 @@ class RacGds(BaseImporter):
         """
 
         print("Running influencers analysis ...")
-        with self._driver.session(database=self.database) as session:
-            session.run(QUERY_PROJECTION_INFLUENCERS)
+        with self.gds_projection('graph', QUERY_PROJECTION_INFLUENCERS) as graph:
             print("\tPageRank")
-            session.run(QUERY_PAGERANK, property="pr_influencers")
+            graph.mutate('pageRank', 'pr_influencers', maxIterations=100, dampingFactor=0.85)
             print("\teigenvector centrality")
-            session.run(QUERY_EIGENVECTOR, property="eigen_influencers")
-            session.run(QUERY_DROP_PROJECTION)
+            graph.mutate('eigenvector', 'eigen_influencers', maxIterations=100)
+            graph.write()
 
 if __name__ == '__main__':
     importing = RacGds(argv=sys.argv[1:])
@@ -9,6 +9,7 @@ from pathlib import Path
 from openai import OpenAI
 
 from util.base_importer import BaseImporter
+from rac_person_resolver import resolve_person_names, surname_pairs
 
 logging.basicConfig(
     level=logging.INFO,
@@ -265,20 +266,12 @@ class RacFullKG(BaseImporter):
         #       and HAS_TITLE relation to "Associate Professor of Physics"
         #   - "D. H. Andrews" (page  67) - WORKS_ON -> "specific heats of organic compounds" <- WORKS_ON - "Andrews" (page 79)
 
-        QUERY_SIMILAR_OCC = """
-        MATCH (e1:Entity {label: "Occupation"}), (e2:Entity {label: "Occupation"})
-        WHERE e1 <> e2 AND e1.name_normalized CONTAINS e2.name_normalized AND NOT e2.name_normalized IN ["research"]
-        MERGE (e1)-[:META_SIMILAR]->(e2)
-        """
-        QUERY_SIMILAR_ORG = """
-        MATCH (e1:Entity {label: "Organization"}), (e2:Entity {label: "Organization"})
-        WHERE e1 <> e2 AND toLower(e1.name) CONTAINS toLower(e2.name) AND NOT toLower(e2.name) IN ["university", "foundation"]
-        MERGE (e1)-[:META_SIMILAR]->(e2)
-        """
-
-        with self._driver.session(database=self.database) as session:
-            session.run(QUERY_SIMILAR_OCC)
-            session.run(QUERY_SIMILAR_ORG)
+        # Occupations and organizations containing the name of another one, e.g. "physical chemistry" and "chemistry"
+        print("Linking similar Occupations and Organizations")
+        self.write_containment('(e:Entity {label: "Occupation"})', 'e.name_normalized', 'META_SIMILAR',
+                               excluded=["research"])
+        self.write_containment('(e:Entity {label: "Organization"})', 'toLower(e.name)', 'META_SIMILAR',
+                               excluded=["university", "foundation"])
 
         # Prepare for resolution of surnames - the same surname alone is not enough to resolve, we need additional evidence
         QUERY_RESOLVE_PER_SURNAMES = """
@@ -309,7 +302,7 @@ class RacFullKG(BaseImporter):
         MERGE (e1)-[:META_PERSONS_SIMILAR]-(e2)
         """
         QUERY_PER_SIM_GRAPH = """MATCH (e1:Entity {label: "Person"})-[r:META_PERSONS_SIMILAR]->(e2)
-        WITH gds.graph.project('graph', e1, e2,
+        WITH gds.graph.project($graph_name, e1, e2,
           {
             sourceNodeLabels: labels(e1),
             targetNodeLabels: labels(e2),
@@ -329,15 +322,63 @@ class RacFullKG(BaseImporter):
         SET p.name_normalized = wcc_name"""
 
         print("Resolving person names based on string similarity")
+        if self.similarity_engine == "python":
+            self.resolve_person_names()
+            return
         with self._driver.session(database=self.database) as session:
             session.run(QUERY_RESOLVE_PER_SURNAMES)
             session.run(QUERY_RESOLVE_PER_SIM)
-            session.run(QUERY_PER_SIM_GRAPH)
-            session.run(
-                "CALL gds.wcc.write('graph', { writeProperty: 'resolution_wcc' }) YIELD nodePropertiesWritten, componentCount")
-            session.run("CALL gds.graph.drop('graph') YIELD graphName")
+        if self.wcc_engine == "python":
+            self.write_connected_components("Entity", ["META_PERSONS_SIMILAR"], "resolution_wcc",
+                                            node_filter='n.label = "Person"', include_isolated=False)
+        else:
+            with self.gds_projection('graph', QUERY_PER_SIM_GRAPH) as graph:
+                graph.mutate('wcc', 'resolution_wcc')
+                graph.write()
+        with self._driver.session(database=self.database) as session:
             session.run(QUERY_RESOLVE_PER)
 
+    def resolve_person_names(self):
+        """
+        Resolve the person names as QUERY_RESOLVE_PER_SURNAMES, QUERY_RESOLVE_PER_SIM, WCC and QUERY_RESOLVE_PER do,
+        comparing only the names with the same last word (see rac_person_resolver)
+          The evidence of the surname pairs is still checked in the graph. The groups are written back with their
+          longest name in a single batched pass, without META_PERSONS_SIMILAR relationships nor GDS projection.
+        """
+        QUERY_PERSON_NAMES = """
+        MATCH (e:Entity {label: "Person"})
+        WHERE e.name_normalized IS NOT NULL
+        RETURN elementId(e) AS id, e.name_normalized AS name_normalized, e.name AS name
+        """
+        QUERY_RESOLVE_PER_SURNAMES = """
+        UNWIND $batch AS item
+        MATCH (e1) WHERE elementId(e1) = item.entity
+        MATCH (e2) WHERE elementId(e2) = item.surname
+        WITH e1, e2, ["WORKS_FOR", "WORKS_ON", "HAS_TITLE"] AS er_relations
+        WHERE EXISTS {
+            MATCH (e1)-[r1:RELATED_TO_ENTITY]->()-[:META_SIMILAR]-()<-[r2:RELATED_TO_ENTITY]-(e2)
+            WHERE r1.type IN er_relations AND r2.type IN er_relations
+        }
+        MERGE (e1)-[:META_RESOLVED_PER]-(e2)
+        """
+        QUERY_RESOLVE_PER = """
+        UNWIND $batch AS item
+        MATCH (p) WHERE elementId(p) = item.id
+        SET p.resolution_wcc = item.component, p.name_normalized = item.name
+        """
+
+        with self._driver.session(database=self.database) as session:
+            rows = session.run(QUERY_PERSON_NAMES).data()
+        names = {row["id"]: row["name_normalized"] for row in rows}
+        full_names = {row["id"]: row["name"] for row in rows}
+
+        pairs = [{"entity": entity, "surname": surname} for entity, surname in surname_pairs(names, full_names)]
+        self.batch_store(QUERY_RESOLVE_PER_SURNAMES, iter(pairs), size=len(pairs), desc="resolve_person_surnames")
+        resolved = [{"id": entity, "component": component, "name": name}
+                    for entity, (component, name) in resolve_person_names(names).items()]
+        print(f"Resolved {len(resolved)} person entities into {len({row['component'] for row in resolved})} persons")
+        self.batch_store(QUERY_RESOLVE_PER, iter(resolved), size=len(resolved), desc="resolve_person_names")
+
     def create_kg(self):
         # Reset the KG
         QUERY_DELETE_KG = """MATCH (n) 
@@ -407,23 +448,11 @@ class RacFullKG(BaseImporter):
             print(f"Created {res.data()[0]['n_rels']} KG relations")
 
         # create similarities
-        QUERY_SIM_ORG = """
-        MATCH (e1:Organization), (e2:Organization)
-        WHERE e1<>e2 AND e1.name_normalized CONTAINS e2.name_normalized AND NOT e2.name_normalized IN ["university", "foundation"]
-        MERGE (e1)-[:SIMILAR_ORGANIZATION]->(e2)
-        """
-
-        QUERY_SIM_OCC = """
-        MATCH (e1:Occupation), (e2:Occupation)
-        WHERE e1<>e2 AND e1.name_normalized CONTAINS e2.name_normalized AND NOT e2.name_normalized IN ["research"]
-        MERGE (e1)-[:SIMILAR_OCCUPATION]->(e2)
-        """
-
-        with self._driver.session(database=self.database) as session:
-            print("Creating Organization similarities")
-            session.run(QUERY_SIM_ORG)
-            print("Creating Occupation similarities")
-            session.run(QUERY_SIM_OCC)
+        print("Creating Organization similarities")
+        self.write_containment('(e:Organization)', 'e.name_normalized', 'SIMILAR_ORGANIZATION',
+                               excluded=["university", "foundation"])
+        print("Creating Occupation similarities")
+        self.write_containment('(e:Occupation)', 'e.name_normalized', 'SIMILAR_OCCUPATION', excluded=["research"])
 
 if __name__ == '__main__':
     importing = RacFullKG(argv=sys.argv[1:])
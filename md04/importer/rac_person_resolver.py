@@ -0,0 +1,87 @@
+"""
+Person name resolution of the RAC entities in the client
+  Two person names can only be similar if they end with the same word, so the names are blocked on the last
+  word of name_normalized and compared inside their block only, instead of every Person Entity against every
+  other one. similar_names is the condition of QUERY_RESOLVE_PER_SIM ("James T. Kirk" <=> "J. T. Kirk" <=>
+  "James Kirk" <=> "J. Kirk") and the similar pairs are merged with a union-find: the groups are the connected
+  components of META_PERSONS_SIMILAR that gds.wcc writes as resolution_wcc, without projecting them.
+"""
+from util.connected_components import UnionFind
+
+
+def initial_compatible(first: str, second: str) -> bool:
+    """
+    If two first (or middle) names can be the same: same initial and one of them is an initial ("J" or "J.")
+    """
+    return first[:1] == second[:1] and (len(first) == 1 or len(second) == 1 or
+                                        (len(first) == 2 and first[-1] == ".") or
+                                        (len(second) == 2 and second[-1] == "."))
+
+
+def similar_names(first: list, second: list) -> bool:
+    """
+    :param first: the words of a name with the same last word as second, at least two
+    :param second: the words of the other name
+    """
+    firsts1, firsts2 = first[:-1], second[:-1]
+    if len(firsts1) == len(firsts2):
+        return all(initial_compatible(a, b) for a, b in zip(firsts1, firsts2))
+    # when the middle name is skipped for one person
+    if {len(firsts1), len(firsts2)} == {1, 2}:
+        return initial_compatible(firsts1[0], firsts2[0])
+    return False
+
+
+def surname_blocks(names: dict) -> dict:
+    """
+    :param names: entity -> name_normalized
+    :return: last word -> the entities whose name ends with it
+    """
+    blocks = {}
+    for entity, name in names.items():
+        blocks.setdefault(name.split(" ")[-1], []).append(entity)
+    return blocks
+
+
+def surname_pairs(names: dict, full_names: dict) -> list:
+    """
+    The candidate pairs of QUERY_RESOLVE_PER_SURNAMES: a name and a longer name ending with it
+    :param names: entity -> name_normalized
+    :param full_names: entity -> name, both names must be longer than 2 characters
+    :return: the (full name entity, surname entity) pairs
+    """
+    pairs = []
+    for block in surname_blocks(names).values():
+        for entity in block:
+            for other in block:
+                if entity != other and names[entity].endswith(" " + names[other]) and \
+                        len(full_names.get(entity) or "") > 2 and len(full_names.get(other) or "") > 2:
+                    pairs.append((entity, other))
+    return pairs
+
+
+def resolve_person_names(names: dict) -> dict:
+    """
+    :param names: entity -> name_normalized
+    :return: entity -> (component, longest name of the component) for the entities similar to another one
+    """
+    words = {entity: name.split(" ") for entity, name in names.items()}
+    union_find = UnionFind()
+    nodes = {}
+    for block in surname_blocks({entity: name for entity, name in names.items() if len(words[entity]) > 1}).values():
+        for i, entity in enumerate(block):
+            for other in block[i + 1:]:
+                if similar_names(words[entity], words[other]):
+                    for node in (entity, other):
+                        if node not in nodes:
+                            nodes[node] = union_find.add()
+                    union_find.union(nodes[entity], nodes[other])
+
+    members = {}
+    for entity, node in nodes.items():
+        members.setdefault(union_find.find(node), []).append(entity)
+    resolved = {}
+    for component, entities in enumerate(members.values()):
+        longest = max((names[entity] for entity in entities), key=len)
+        resolved.update({entity: (component, longest) for entity in entities})
+    return resolved
@@ -0,0 +1,15 @@
+from util.schema_manager import node_key, text_index
+
+# constraints and indexes of the RAC diaries graph
+SCHEMA = [node_key("File", "name"),
+          node_key("Page", "id"),
+          text_index("Entity", "name", name="node_entity_name"),
+          node_key("Person", "name_normalized"),
+          node_key("Organization", "name_normalized"),
+          node_key("Occupation", "name_normalized"),
+          node_key("Title", "name_normalized"),
+          text_index("Person", "name_normalized"),
+          text_index("Organization", "name_normalized"),
+          text_index("Occupation", "name_normalized"),
+          text_index("Title", "name_normalized"),
+          text_index("RELATED_TO_ENTITY", "type", name="rel_text_entities", relationship=True)]
@@ -1,10 +1,10 @@
 import os
 import logging
-import configparser
 from typing import List
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.graphs import Neo4jGraph
 from langchain_community.vectorstores import Neo4jVector
+from util.driver_registry import read_config
 
 logging.basicConfig(
     level=logging.INFO,
@@ -15,8 +15,7 @@ logging.basicConfig(
 class LangchainStore:
     def __init__(self, config_path: str = "config.ini"):
         # Load configuration
-        config = configparser.ConfigParser()
-        config.read(config_path)
+        config = read_config(config_path)
 
         # Set Neo4j parameters
         self.neo4j_uri = config["neo4j"]["uri"]
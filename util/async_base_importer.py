@@ -0,0 +1,111 @@
+import asyncio
+import math
+from itertools import islice
+from typing import Iterable
+
+from tqdm import tqdm
+
+from util.async_graphdb_base import AsyncGraphDBBase
+
+
+class AsyncBaseImporter(AsyncGraphDBBase):
+    def __init__(self, command=None, argv=None, extended_options='', extended_long_options=None):
+        super().__init__(command, argv, extended_options, extended_long_options)
+        self.batch_size = 1000
+        self.concurrency = 8
+
+    async def run(self, query: str, parameters: dict = None):
+        """
+        Run a query in its own session and consume its result
+        :return: the result summary
+        """
+        async with self.get_session() as session:
+            result = await session.run(query, parameters)
+            return await result.consume()
+
+    async def stream_records(self, query: str, parameters: dict = None):
+        """
+        Stream the records of a read query as dicts, like the get_record_rows readers of the importers
+        :param query: the read query
+        :param parameters: optional query parameters
+        """
+        async with self.get_session() as session:
+            result = await session.run(query, parameters)
+            async for record in result:
+                yield dict(record)
+
+    async def gather(self, *coroutines, limit: int = None):
+        """
+        Await coroutines concurrently keeping at most `limit` of them in flight
+        :param coroutines: the coroutines to run
+        :param limit: optional maximum concurrency, defaults to self.concurrency
+        :return: the results in the same order of coroutines
+        """
+        semaphore = asyncio.Semaphore(limit or self.concurrency)
+
+        async def bounded(coroutine):
+            async with semaphore:
+                return await coroutine
+
+        return await asyncio.gather(*[bounded(coroutine) for coroutine in coroutines])
+
+    @staticmethod
+    async def get_batches(parameters_iterator, batch_size):
+        if hasattr(parameters_iterator, "__aiter__"):
+            batch = []
+            async for parameters in parameters_iterator:
+                batch.append(parameters)
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+            return
+
+        parameters_iterator = iter(parameters_iterator)
+        while True:
+            ret = list(islice(parameters_iterator, batch_size))
+            if ret:
+                yield ret
+            else:
+                return
+
+    async def batch_store(self, query: str, parameters_iterator: Iterable, size: int = None, desc="",
+                          concurrency: int = 1):
+        """
+        Ingest data in batches
+          It aggregates parameters_iteration in a list named $batch,
+          the query should contain `UNWIND $batch as item` as first statement.
+          With concurrency > 1 several batches are in flight at the same time, each in its own session:
+          use it only when batches don't MERGE the same nodes.
+        :param query: the parametrized insertion query
+        :param parameters_iterator: an iterator, or async iterator, of the data to ingest as parameters for query
+        :param size: optional parameters_iterator's length
+        :param desc: optional progress bar description
+        :param concurrency: the number of batches written at the same time
+        """
+        total = math.ceil(size / self.batch_size) if size is not None else None
+        progress = tqdm(total=total, desc=desc)
+        pending = set()
+        try:
+            async with self.get_session() as session:
+                async for batch in self.get_batches(parameters_iterator, self.batch_size):
+                    if concurrency <= 1:
+                        await (await session.run(query, {"batch": batch})).consume()
+                        progress.update(1)
+                        continue
+                    if len(pending) >= concurrency:
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            task.result()
+                    task = asyncio.ensure_future(self.run(query, {"batch": batch}))
+                    task.add_done_callback(lambda _: progress.update(1))
+                    pending.add(task)
+            if pending:
+                for task in asyncio.as_completed(pending):
+                    await task
+                pending = set()
+        finally:
+            for task in pending:
+                task.cancel()
+            progress.close()
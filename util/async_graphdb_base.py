@@ -0,0 +1,33 @@
+from neo4j import AsyncGraphDatabase
+
+from util.graphdb_base import GraphDBBase
+
+
+class AsyncGraphDBBase(GraphDBBase):
+    """
+    Same options and configuration of GraphDBBase on top of the neo4j async driver
+      Sessions, queries and close are coroutines, the class must be used from a running event loop.
+    """
+
+    def create_driver(self, uri, auth, params):
+        # async drivers are bound to the event loop they're used in, they aren't shared through DriverRegistry
+        return AsyncGraphDatabase.driver(uri, auth=auth, **params)
+
+    async def close(self):
+        await self._driver.close()
+
+    def get_session(self):
+        return self._driver.session(database=self.database)
+
+    async def execute_without_exception(self, query: str):
+        try:
+            async with self.get_session() as session:
+                await session.run(query)
+        except Exception as e:
+            pass
+
+    async def executeNoException(self, session, query: str):
+        try:
+            await session.run(query)
+        except Exception as e:
+            pass
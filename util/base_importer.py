@@ -1,56 +1,238 @@
+import logging
 import math
+import os
+import time
 from itertools import islice
+from queue import Queue
+from threading import Lock, Thread
 from typing import Iterable
 
+from neo4j.exceptions import Neo4jError, TransientError
+
+from util.batch_controller import AdaptiveBatchController
+from util.checkpoint import CheckpointJournal
+from util.connected_components import ConnectedComponents
+from util.containment import containment_pairs, containment_query
+from util.fake_driver import RecordingDriver
+from util.gds_projection import GdsProjection
 from util.graphdb_base import GraphDBBase
+from util.metrics import ImportMetrics
+from util.prefetch import BatchPrefetcher
+from util.schema_manager import SchemaManager
 from tqdm import tqdm
 
 
 class BaseImporter(GraphDBBase):
     def __init__(self, command=None, argv=None, extended_options='', extended_long_options=None):
+        extended_long_options = (extended_long_options or []) + ['checkpoint=', 'reject-file=', 'metrics-json=',
+                                                                 'metrics-prom=', 'record-queries=', 'chunk-rows=',
+                                                                 'wcc-engine=', 'similarity-engine=',
+                                                                 'max-address-group=']
         super().__init__(command, argv, extended_options, extended_long_options)
         self.batch_size = 1000
+        self.workers = 4
+        self.batch_controller = None
+        self.checkpoint = None
+        # with chunk_rows, csv sources are streamed reading chunk_rows rows at a time
+        self.chunk_rows = int(self.get_option(['--chunk-rows'], 0)) or None
+        # "gds" or "python": the connected components of the entity resolution computed in the client
+        self.wcc_engine = self.get_option(['--wcc-engine'], 'gds')
+        # "cypher" or "python": the name similarities of the entity resolution scored in the client
+        self.similarity_engine = self.get_option(['--similarity-engine'], 'cypher')
+        # opt-in: the organizations of larger address groups (and of the placeholder address) aren't compared
+        max_address_group = self.get_option(['--max-address-group'])
+        self.max_address_group = int(max_address_group) if max_address_group else None
+        self.metrics = ImportMetrics(os.path.splitext(os.path.basename(command))[0] if command else "import")
+        self.metrics_json = self.get_option(['--metrics-json'])
+        self.metrics_prom = self.get_option(['--metrics-prom'])
+
+        record_file = self.get_option(['--record-queries'])
+        if record_file:
+            self._driver = RecordingDriver(self._driver, record_file)
+
+        checkpoint_file = self.get_option(['--checkpoint'])
+        if checkpoint_file:
+            self.enable_checkpoints(checkpoint_file, self.get_option(['--reject-file']))
+
+    def close(self):
+        self.export_metrics()
+        super().close()
+
+    def export_metrics(self, json_file=None, prometheus_file=None):
+        """
+        Write the per stage metrics collected by batch_store
+        :param json_file: optional JSON run report path, defaults to --metrics-json
+        :param prometheus_file: optional Prometheus text format path, defaults to --metrics-prom
+        """
+        json_file = json_file or self.metrics_json
+        prometheus_file = prometheus_file or self.metrics_prom
+        if json_file:
+            self.metrics.write_json(json_file)
+        if prometheus_file:
+            self.metrics.write_prometheus(prometheus_file)
+
+    def apply_schema(self, schema: list, timeout: int = 3600):
+        """
+        Create the missing constraints and indexes of schema and wait for the indexes to be online
+        :param schema: the module's list of SchemaRule
+        :param timeout: seconds to wait for the index population
+        """
+        SchemaManager(self._driver, self.database, self.metrics, timeout).apply(schema)
+
+    def gds_projection(self, graph_name: str, projection_query: str, parameters: dict = None) -> GdsProjection:
+        """
+        :return: a context manager projecting graph_name once for several algorithms, dropped when leaving it
+        """
+        return GdsProjection(self._driver, self.database, graph_name, projection_query, parameters)
+
+    def write_connected_components(self, label: str, relationship_types: list, write_property: str, key: str = None,
+                                   node_filter: str = None, include_isolated: bool = True) -> dict:
+        """
+        Compute the weakly connected components in the client and write them, see ConnectedComponents
+        :return: nodePropertiesWritten and componentCount, as yielded by gds.wcc.write
+        """
+        components = ConnectedComponents(self._driver, self.database, label, relationship_types, key, node_filter,
+                                         include_isolated).compute()
+        rows = ({"id": element_id, "componentId": component} for element_id, component in components.items())
+        self.batch_store(ConnectedComponents.write_query(write_property), rows, size=len(components),
+                         desc=f"{label}.{write_property}")
+        return {"nodePropertiesWritten": len(components), "componentCount": len(set(components.values()))}
+
+    def write_containment(self, node_pattern: str, name_expression: str, relationship_type: str,
+                          excluded=()) -> int:
+        """
+        Link every node to the nodes whose name it contains, see containment_pairs, as
+          MATCH {node_pattern as e1}, {node_pattern as e2}
+          WHERE e1 <> e2 AND {name of e1} CONTAINS {name of e2} AND NOT {name of e2} IN excluded
+          MERGE (e1)-[:relationship_type]->(e2)
+          without the Cartesian product: the names are read once and matched in the client.
+        :param node_pattern: the pattern of the nodes binding `e`, e.g. (e:Entity {label: "Occupation"})
+        :param name_expression: the name of `e`, e.g. toLower(e.name)
+        :param relationship_type: the type of the relationships created
+        :param excluded: the names that are never the contained one
+        :return: the number of pairs found
+        """
+        names_query = f"""
+        MATCH {node_pattern}
+        WITH e, {name_expression} AS name
+        WHERE name IS NOT NULL
+        RETURN elementId(e) AS id, name
+        """
+        with self._driver.session(database=self.database) as session:
+            names = {row["id"]: row["name"] for row in session.run(names_query) if isinstance(row["name"], str)}
+        pairs = [{"container": container, "contained": contained}
+                 for container, contained in containment_pairs(names, excluded)]
+        self.batch_store(containment_query(relationship_type), iter(pairs), size=len(pairs),
+                         desc=relationship_type)
+        return len(pairs)
+
+    def enable_checkpoints(self, journal_file, reject_file=None):
+        """
+        Make the aggregate and transaction strategies resumable
+          Stages called with a `source` commit their progress to the journal after every batch and a rerun
+          skips the rows that were already written. Batches run in managed write transactions retried on
+          transient errors; when reject_file is set a failing batch is bisected and its bad rows are
+          written there instead of aborting the load.
+        :param journal_file: path of the JSON checkpoint journal
+        :param reject_file: optional path of the JSON lines file collecting the rejected rows
+        """
+        self.checkpoint = CheckpointJournal(journal_file, reject_file)
+
+    def enable_adaptive_batching(self, target_time=2.0, min_size=50, max_size=20000, max_rows_per_second=None):
+        """
+        Let aggregate_batch_store size the batches from the measured latency instead of using batch_size
+        :param target_time: desired duration in seconds of a single batch transaction
+        :param min_size: lower bound for the batch size
+        :param max_size: upper bound for the batch size
+        :param max_rows_per_second: optional write rate cap, useful not to starve other workloads
+        """
+        self.batch_controller = AdaptiveBatchController(batch_size=self.batch_size, target_time=target_time,
+                                                        min_size=min_size, max_size=max_size,
+                                                        max_rows_per_second=max_rows_per_second)
 
     def batch_store(self, query: str, parameters_iterator: Iterable, size: int = None, strategy: str = "aggregate",
-                    desc=""):
+                    desc="", **kwargs):
         """
         Ingest data in batches
         :seeAlso transaction_batch_store
         :seeAlso aggregate_batch_store
+        :seeAlso parallel_batch_store
+        :seeAlso pipelined_batch_store
 
         :param query: the parametrized insertion query
         :param parameters_iterator: an iterator of the data to ingest as parameters for query
         :param size: optional parameters_iterator's length
-        :param strategy: "aggregate" or "transaction"
-        :param desc: optional progress bar description
+        :param strategy: "aggregate", "transaction", "parallel" or "pipelined"
+        :param desc: the stage name, used by the progress bar and the metrics
+        :param kwargs: strategy specific options (e.g. source for checkpoints, partition_key for "parallel")
         """
         method = getattr(self, f"{strategy}_batch_store", None)
         if method is None:
             raise ValueError(f"Unknown strategy {strategy}")
-        method(query, parameters_iterator, size, desc)
+        return method(query, parameters_iterator, size, desc, **kwargs)
 
-    def transaction_batch_store(self, query, parameters_iterator, size=None, desc=""):
+    def transaction_batch_store(self, query, parameters_iterator, size=None, desc="", source=None):
         """
         Ingest data submitting a query for every item in parameters_iterator and commit every 1000 iterations
         :param query: the parametrized insertion query
         :param parameters_iterator: an iterator of the data to ingest as parameters for query
         :param size:optional parameters_iterator's length
         :param desc: optional progress bar description
+        :param source: optional source identifier (e.g. the csv file) used to checkpoint the progress
         """
-        parameters_iterator = tqdm(parameters_iterator, total=size, desc=desc)
+        stage = self.stage_name(query, desc)
+        offset = self.resume_offset(query, source)
+        if offset is None:
+            return
+        self.metrics.start_stage(stage)
+        parameters_iterator = tqdm(islice(parameters_iterator, offset, None), total=size, initial=offset, desc=desc)
+
+        if self.is_checkpointed(source):
+            with self._driver.session(database=self.database) as session:
+                for batch, prep_time in self.timed(self.get_batches(parameters_iterator, self.batch_size)):
+                    self.store_batch(session, query, batch, stage, source, prep_time, per_row=True)
+                    offset += len(batch)
+                    self.commit_checkpoint(query, source, offset)
+            self.commit_checkpoint(query, source, offset, done=True)
+            self.metrics.finish_stage(stage)
+            return
+
         with self._driver.session(database=self.database) as session:
             tx = session.begin_transaction()
+            summaries = []
+            start = time.perf_counter()
             for item_count, parameters in enumerate(parameters_iterator, start=1):
-                tx.run(query, parameters)
+                summaries.append(tx.run(query, parameters).consume())
                 if item_count % self.batch_size == 0:
                     tx.commit()
+                    self.metrics.record_batch(stage, len(summaries), 0.0, time.perf_counter() - start, summaries)
                     tx = session.begin_transaction()
+                    summaries = []
+                    start = time.perf_counter()
             tx.commit()
+            self.metrics.record_batch(stage, len(summaries), 0.0, time.perf_counter() - start, summaries)
+        self.metrics.finish_stage(stage)
 
     @staticmethod
     def get_csv_size(HMDD_file, encoding="utf-8"):
         return sum(1 for i in HMDD_file.open("r", encoding=encoding))
 
+    @staticmethod
+    def strip_options(argv, long_options):
+        """
+        :return: argv without the given long options, given as `--option=value`, `--option value` or `--flag`
+        """
+        takes_value = {'--' + option.rstrip('='): option.endswith('=') for option in long_options}
+        stripped = []
+        args = iter(argv)
+        for arg in args:
+            name = arg.split('=', 1)[0]
+            if name not in takes_value:
+                stripped.append(arg)
+            elif takes_value[name] and '=' not in arg:
+                next(args, None)
+        return stripped
+
     @staticmethod
     def get_batches(parameters_iterator, batch_size):
         while True:
@@ -60,7 +242,25 @@ class BaseImporter(GraphDBBase):
             else:
                 return
 
-    def aggregate_batch_store(self, query, parameters_iterator, size=None, desc=""):
+    @staticmethod
+    def timed(batches):
+        """
+        Yield every batch with the seconds spent producing it
+        """
+        batches = iter(batches)
+        while True:
+            start = time.perf_counter()
+            try:
+                batch = next(batches)
+            except StopIteration:
+                return
+            yield batch, time.perf_counter() - start
+
+    @staticmethod
+    def stage_name(query, desc):
+        return desc or CheckpointJournal.query_id(query)
+
+    def aggregate_batch_store(self, query, parameters_iterator, size=None, desc="", source=None):
         """
         Ingest data in batches
           It aggregates parameters_iteration in a list named $batch,
@@ -69,9 +269,332 @@ class BaseImporter(GraphDBBase):
         :param parameters_iterator: an iterator of the data to ingest as parameters for query
         :param size:optional parameters_iterator's length
         :param desc: optional progress bar description
+        :param source: optional source identifier (e.g. the csv file) used to checkpoint the progress
         """
-        parameters_batches = self.get_batches(parameters_iterator, self.batch_size)
-        parameters_batches = tqdm(parameters_batches, total=math.ceil(size / self.batch_size), desc=desc)
+        if self.batch_controller is not None:
+            return self.adaptive_batch_store(query, parameters_iterator, size, desc, source=source)
+        stage = self.stage_name(query, desc)
+        offset = self.resume_offset(query, source)
+        if offset is None:
+            return
+        self.metrics.start_stage(stage)
+        parameters_batches = self.get_batches(islice(parameters_iterator, offset, None), self.batch_size)
+        parameters_batches = tqdm(parameters_batches, total=math.ceil(size / self.batch_size),
+                                  initial=offset // self.batch_size, desc=desc)
         with self._driver.session(database=self.database) as session:
-            for batch in parameters_batches:
-                session.run(query, {"batch": batch})
+            for batch, prep_time in self.timed(parameters_batches):
+                self.store_batch(session, query, batch, stage, source, prep_time)
+                offset += len(batch)
+                self.commit_checkpoint(query, source, offset)
+        self.commit_checkpoint(query, source, offset, done=True)
+        self.metrics.finish_stage(stage)
+
+    def adaptive_batch_store(self, query, parameters_iterator, size=None, desc="", source=None):
+        """
+        Ingest data in batches whose size is driven by self.batch_controller
+          Every batch is timed until its result is consumed, the controller then picks the next size
+          and, if a rate cap is set, pauses before the next batch.
+          The query should contain `UNWIND $batch as item` as first statement
+        :param query: the parametrized insertion query
+        :param parameters_iterator: an iterator of the data to ingest as parameters for query
+        :param size: optional parameters_iterator's length
+        :param desc: optional progress bar description
+        :param source: optional source identifier (e.g. the csv file) used to checkpoint the progress
+        """
+        controller = self.batch_controller
+        if controller is None:
+            controller = self.batch_controller = AdaptiveBatchController(batch_size=self.batch_size)
+        controller.reset()
+        stage = self.stage_name(query, desc)
+        offset = self.resume_offset(query, source)
+        if offset is None:
+            return
+        self.metrics.start_stage(stage)
+        parameters_iterator = islice(parameters_iterator, offset, None)
+        with tqdm(total=size, initial=offset, desc=desc) as progress, \
+                self._driver.session(database=self.database) as session:
+            while True:
+                start = time.perf_counter()
+                batch = list(islice(parameters_iterator, controller.batch_size))
+                if not batch:
+                    break
+                elapsed = self.store_batch(session, query, batch, stage, source, time.perf_counter() - start)
+                offset += len(batch)
+                self.commit_checkpoint(query, source, offset)
+                controller.update(len(batch), elapsed)
+                progress.update(len(batch))
+                progress.set_postfix(batch_size=controller.batch_size,
+                                     rows_s=int(controller.last_rows_per_second))
+                controller.throttle(len(batch), elapsed)
+        self.commit_checkpoint(query, source, offset, done=True)
+        self.metrics.finish_stage(stage, throttled_time=controller.throttled_time)
+
+    def parallel_batch_store(self, query, parameters_iterator, size=None, desc="", source=None, partition_key=None,
+                             workers=None):
+        """
+        Ingest data in batches over a pool of worker sessions
+          Like aggregate_batch_store the query should contain `UNWIND $batch as item` as first statement.
+          Rows are routed to a worker by hashing partition_key, so all the rows sharing a MERGE key are written
+          by the same session in their input order and two workers never lock the same node for that key.
+          Without partition_key whole batches are dealt round-robin, use it only for stages whose rows don't
+          share nodes (e.g. one record node per row).
+          With checkpoints the committed offset is the first row not written yet by any worker, so a resumed
+          stage writes again at most the rows that were buffered or in flight.
+        :param query: the parametrized insertion query
+        :param parameters_iterator: an iterator of the data to ingest as parameters for query
+        :param size: optional parameters_iterator's length
+        :param desc: optional progress bar description
+        :param source: optional source identifier (e.g. the csv file) used to checkpoint the progress
+        :param partition_key: optional column name, or callable returning the key of a row
+        :param workers: optional number of worker sessions, defaults to self.workers
+        """
+        workers = max(1, workers or self.workers)
+        stage = self.stage_name(query, desc)
+        offset = self.resume_offset(query, source)
+        if offset is None:
+            return
+        self.metrics.start_stage(stage)
+        if partition_key is not None and not callable(partition_key):
+            column = partition_key
+            partition_key = lambda row: row.get(column)
+
+        # A small bounded queue per worker keeps memory flat and preserves per-partition ordering
+        queues = [Queue(maxsize=2) for _ in range(workers)]
+        errors = []
+        # the first row of every batch queued or being written, of every partition buffer, and the next row to read
+        state = {"in_flight": {}, "buffered": [None] * workers, "read": offset, "committed": offset, "batches": 0}
+        state_lock = Lock()
+        progress = tqdm(total=size, initial=offset, desc=desc)
+
+        def written(batch_id, rows):
+            with state_lock:
+                del state["in_flight"][batch_id]
+                low = min([*state["in_flight"].values(), *(first for first in state["buffered"] if first is not None),
+                           state["read"]])
+                if low > state["committed"]:
+                    state["committed"] = low
+                    self.commit_checkpoint(query, source, low)
+                progress.update(rows)
+
+        def write(batches):
+            with self._driver.session(database=self.database) as session:
+                while True:
+                    item = batches.get()
+                    if item is None:
+                        return
+                    # keep draining after a failure so that the producer is never blocked
+                    if errors:
+                        continue
+                    batch_id, batch, prep_time = item
+                    try:
+                        self.store_batch(session, query, batch, stage, source, prep_time)
+                    except Exception as e:
+                        errors.append(e)
+                        continue
+                    written(batch_id, len(batch))
+
+        def submit(worker, batch, prep_time, partitioned):
+            # the batch is registered in flight along with the rows it takes, so the checkpoint never passes it
+            with state_lock:
+                batch_id = state["batches"]
+                state["batches"] += 1
+                if partitioned:
+                    first = state["buffered"][worker]
+                    state["buffered"][worker] = None
+                else:
+                    first = state["read"]
+                    state["read"] += len(batch)
+                state["in_flight"][batch_id] = first
+            queues[worker].put((batch_id, batch, prep_time))
+
+        threads = [Thread(target=write, args=(q,), daemon=True) for q in queues]
+        for thread in threads:
+            thread.start()
+
+        try:
+            rows = islice(parameters_iterator, offset, None)
+            if partition_key is None:
+                for batch_count, (batch, prep_time) in enumerate(self.timed(self.get_batches(rows, self.batch_size))):
+                    if errors:
+                        break
+                    submit(batch_count % workers, batch, prep_time, partitioned=False)
+            else:
+                buffers = [[] for _ in range(workers)]
+                # the time spent reading and routing the rows of each buffer, not waiting on the queues
+                prep_times = [0.0] * workers
+                for parameters, read_time in self.timed(rows):
+                    if errors:
+                        break
+                    start = time.perf_counter()
+                    worker = hash(partition_key(parameters)) % workers
+                    buffers[worker].append(parameters)
+                    with state_lock:
+                        if state["buffered"][worker] is None:
+                            state["buffered"][worker] = state["read"]
+                        state["read"] += 1
+                    prep_times[worker] += read_time + time.perf_counter() - start
+                    if len(buffers[worker]) >= self.batch_size:
+                        submit(worker, buffers[worker], prep_times[worker], partitioned=True)
+                        buffers[worker], prep_times[worker] = [], 0.0
+                for worker, buffer in enumerate(buffers):
+                    if buffer and not errors:
+                        submit(worker, buffer, prep_times[worker], partitioned=True)
+        finally:
+            for q in queues:
+                q.put(None)
+            for thread in threads:
+                thread.join()
+            progress.close()
+            self.metrics.finish_stage(stage)
+
+        if errors:
+            raise errors[0]
+        self.commit_checkpoint(query, source, state["read"], done=True)
+
+    def pipelined_batch_store(self, query, parameters_iterator, size=None, desc="", source=None, depth=4):
+        """
+        Ingest data in batches preparing the next batches in a background thread
+          Row preparation (e.g. csv parsing and dict conversion) overlaps with the Neo4j round-trips, at most
+          `depth` batches are buffered. The query should contain `UNWIND $batch as item` as first statement
+        :param query: the parametrized insertion query
+        :param parameters_iterator: an iterator of the data to ingest as parameters for query
+        :param size: optional parameters_iterator's length
+        :param desc: optional progress bar description
+        :param source: optional source identifier (e.g. the csv file) used to checkpoint the progress
+        :param depth: the maximum number of prepared batches waiting to be written
+        :return: the seconds spent by the producer working/blocked and by the writer blocked
+        """
+        stage = self.stage_name(query, desc)
+        offset = self.resume_offset(query, source)
+        if offset is None:
+            return None
+        self.metrics.start_stage(stage)
+        prefetcher = BatchPrefetcher(islice(parameters_iterator, offset, None), self.batch_size, depth)
+        with tqdm(total=size, initial=offset, desc=desc) as progress, \
+                self._driver.session(database=self.database) as session:
+            for batch, wait_time in self.timed(prefetcher):
+                self.store_batch(session, query, batch, stage, source, wait_time)
+                offset += len(batch)
+                self.commit_checkpoint(query, source, offset)
+                progress.update(len(batch))
+        self.commit_checkpoint(query, source, offset, done=True)
+
+        stats = prefetcher.stats()
+        self.metrics.finish_stage(stage, **stats)
+        logging.info(f"Pipeline {stage}: "
+                     f"producer busy {stats['producer_busy']:.1f}s, blocked {stats['producer_blocked']:.1f}s; "
+                     f"writer blocked {stats['consumer_blocked']:.1f}s")
+        return stats
+
+    def fanout_batch_store(self, stages, parameters_iterator, size=None, desc="", source=None, depth=4):
+        """
+        Ingest data with several queries reading parameters_iterator only once
+          Every batch is prepared once (in a background thread, as in pipelined_batch_store) and written by
+          each stage query in the given order before the next batch, so a stage always sees the rows of
+          the same batch already written by the stages listed before it.
+          Each query should contain `UNWIND $batch as item` as first statement
+        :param stages: a list of (stage name, query) in dependency order
+        :param parameters_iterator: an iterator of the data to ingest as parameters for the queries
+        :param size: optional parameters_iterator's length
+        :param desc: optional progress bar description
+        :param source: optional source identifier (e.g. the csv file) used to checkpoint the progress
+        :param depth: the maximum number of prepared batches waiting to be written
+        """
+        # with checkpoints, each stage resumes after its last committed batch
+        offsets = {name: self.resume_offset(query, source) for name, query in stages}
+        stages = [(name, query) for name, query in stages if offsets[name] is not None]
+        if not stages:
+            return
+        offset = min(offsets[name] for name, _ in stages)
+        for name, _ in stages:
+            self.metrics.start_stage(name)
+
+        prefetcher = BatchPrefetcher(islice(parameters_iterator, offset, None), self.batch_size, depth)
+        with tqdm(total=size, initial=offset, desc=desc) as progress, \
+                self._driver.session(database=self.database) as session:
+            for batch, prep_time in self.timed(prefetcher):
+                end = offset + len(batch)
+                for name, query in stages:
+                    if offsets[name] >= end:
+                        continue
+                    self.store_batch(session, query, batch, name, source, prep_time)
+                    self.commit_checkpoint(query, source, end)
+                    prep_time = 0.0
+                offset = end
+                progress.update(len(batch))
+        for name, query in stages:
+            self.commit_checkpoint(query, source, offset, done=True)
+            self.metrics.finish_stage(name)
+
+    def store_batch(self, session, query, batch, stage, source=None, prep_time=0.0, per_row=False):
+        """
+        Write a batch, through a managed transaction when the stage is checkpointed, and record its metrics
+        :param session: the session to use
+        :param query: the parametrized insertion query
+        :param batch: the list of parameters to write
+        :param stage: the stage name used for the metrics
+        :param source: optional source identifier (e.g. the csv file) used to checkpoint the progress
+        :param prep_time: seconds spent on the client preparing the batch
+        :param per_row: run the query once per row (transaction strategy) instead of with `$batch`
+        :return: the seconds spent writing the batch
+        """
+        start = time.perf_counter()
+        if self.is_checkpointed(source):
+            summaries = self.write_batch(session, query, batch, source, per_row)
+        else:
+            summaries = [session.run(query, {"batch": batch}).consume()]
+        elapsed = time.perf_counter() - start
+        self.metrics.record_batch(stage, len(batch), prep_time, elapsed, summaries)
+        return elapsed
+
+    def is_checkpointed(self, source):
+        return self.checkpoint is not None and source is not None
+
+    def resume_offset(self, query, source):
+        """
+        :return: the number of rows of source already written by query, None if the stage is complete
+        """
+        if not self.is_checkpointed(source):
+            return 0
+        query_id = CheckpointJournal.query_id(query)
+        if self.checkpoint.is_done(source, query_id):
+            logging.info(f"Skipping query {query_id} on {source}, already completed")
+            return None
+        offset = self.checkpoint.get_offset(source, query_id)
+        if offset:
+            logging.info(f"Resuming query {query_id} on {source} from row {offset}")
+        return offset
+
+    def commit_checkpoint(self, query, source, offset, done=False):
+        if self.is_checkpointed(source):
+            self.checkpoint.commit(source, CheckpointJournal.query_id(query), offset, done=done)
+
+    def write_batch(self, session, query, batch, source=None, per_row=False):
+        """
+        Write a batch in a managed transaction, retried by the driver on transient errors
+          If the batch still fails and a reject file is configured, the batch is split in half recursively
+          until the failing rows are isolated: they are appended to the reject file, the others are committed.
+        :param session: the session to use
+        :param query: the parametrized insertion query
+        :param batch: the list of parameters to write
+        :param source: optional source identifier, reported with the rejected rows
+        :param per_row: run the query once per row (transaction strategy) instead of with `$batch`
+        :return: the result summaries of the committed queries
+        """
+        def work(tx, rows):
+            if per_row:
+                return [tx.run(query, parameters).consume() for parameters in rows]
+            return [tx.run(query, {"batch": rows}).consume()]
+
+        try:
+            return session.execute_write(work, batch)
+        except Neo4jError as e:
+            if isinstance(e, TransientError) or e.code == "Neo.ClientError.Statement.SyntaxError" or \
+                    self.checkpoint is None or self.checkpoint.reject_file is None:
+                raise
+            if len(batch) == 1:
+                self.checkpoint.reject(source, CheckpointJournal.query_id(query), batch[0], e)
+                return []
+            middle = len(batch) // 2
+            return self.write_batch(session, query, batch[:middle], source, per_row) + \
+                self.write_batch(session, query, batch[middle:], source, per_row)
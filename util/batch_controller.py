@@ -0,0 +1,81 @@
+import time
+
+
+class AdaptiveBatchController:
+    """
+    Tune the size of the next batch from the latency of the previous ones
+      The per-row cost is tracked as an exponential moving average and the batch size is moved toward
+      target_time / row cost, never growing or shrinking by more than max_step per batch.
+      Optionally the write rate is capped to max_rows_per_second by sleeping after fast batches.
+    """
+
+    def __init__(self, batch_size=1000, target_time=2.0, min_size=50, max_size=20000, max_step=2.0,
+                 max_rows_per_second=None, smoothing=0.3):
+        """
+        :param batch_size: initial batch size
+        :param target_time: desired duration in seconds of a single batch transaction
+        :param min_size: lower bound for the batch size
+        :param max_size: upper bound for the batch size
+        :param max_step: maximum growth (or shrink) factor between two consecutive batches
+        :param max_rows_per_second: optional write rate cap
+        :param smoothing: weight of the last batch in the moving average of the per-row cost
+        """
+        self.initial_size = batch_size
+        self.batch_size = max(min_size, min(max_size, batch_size))
+        self.target_time = target_time
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_step = max_step
+        self.max_rows_per_second = max_rows_per_second
+        self.smoothing = smoothing
+        self.row_time = None
+        self.last_latency = None
+        self.last_rows_per_second = None
+        self.throttled_time = 0.0
+
+    def reset(self):
+        """
+        Forget the measured cost, each query has its own so the tuning starts over for every stage
+        """
+        self.batch_size = max(self.min_size, min(self.max_size, self.initial_size))
+        self.row_time = None
+        self.last_latency = None
+        self.last_rows_per_second = None
+
+    def update(self, rows, elapsed):
+        """
+        Record a committed batch and compute the size of the next one
+        :param rows: number of rows in the batch
+        :param elapsed: batch duration in seconds
+        :return: the next batch size
+        """
+        if rows == 0:
+            return self.batch_size
+        elapsed = max(elapsed, 1e-6)
+        self.last_latency = elapsed
+        self.last_rows_per_second = rows / elapsed
+
+        row_time = elapsed / rows
+        if self.row_time is None:
+            self.row_time = row_time
+        else:
+            self.row_time = self.smoothing * row_time + (1 - self.smoothing) * self.row_time
+
+        wanted = self.target_time / self.row_time
+        wanted = min(wanted, self.batch_size * self.max_step)
+        wanted = max(wanted, self.batch_size / self.max_step)
+        self.batch_size = int(max(self.min_size, min(self.max_size, wanted)))
+        return self.batch_size
+
+    def throttle(self, rows, elapsed):
+        """
+        Sleep long enough to keep the write rate under max_rows_per_second
+        :param rows: number of rows in the batch
+        :param elapsed: batch duration in seconds
+        """
+        if not self.max_rows_per_second:
+            return
+        pause = rows / self.max_rows_per_second - elapsed
+        if pause > 0:
+            self.throttled_time += pause
+            time.sleep(pause)
@@ -0,0 +1,178 @@
+"""
+Node and relationship csv files for `neo4j-admin database import full`
+  Each node label is an id space whose ids are the string values of the property the importers MERGE on (the
+  property itself is stored typed, the ids are not). Nodes and relationships that only one row creates are
+  appended to their files as they come, so streamed sources stay in bounded memory. The ones MERGEd by many
+  rows or by several importers are added with merge=True: they are kept until close() and written once,
+  uniting their list properties and keeping the last value of the others, as sequential MERGE and SET would.
+"""
+import csv
+from pathlib import Path
+
+import pandas as pd
+
+ARRAY_DELIMITER = "\x1f"
+
+
+class BulkExport:
+    def __init__(self, output_dir):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        # (option, name, header) -> data files; option is "nodes" or "relationships"
+        self.groups = {}
+        self.pending_nodes = {}
+        self.pending_relationships = {}
+
+    def add_nodes(self, label: str, key: str, nodes: pd.DataFrame, merge: bool = False, finalize=None):
+        """
+        :param label: the node label, also used as id space
+        :param key: the column of nodes with the MERGE key
+        :param nodes: a column per property, rows with a missing key are skipped like a failing MERGE
+        :param merge: when the same node can be added more than once
+        :param finalize: optional callable(nodes) -> nodes applied after merging, e.g. for derived properties
+        """
+        nodes = nodes[nodes[key].notna()]
+        if not merge:
+            self.write("nodes", label, self.node_columns(label, key, nodes))
+            return
+        pending = self.pending_nodes.setdefault(label, {"key": key, "frames": [], "finalize": None})
+        pending["frames"].append(nodes)
+        pending["finalize"] = finalize or pending["finalize"]
+
+    def add_relationships(self, rel_type: str, start_label: str, end_label: str, relationships: pd.DataFrame,
+                          merge: bool = False):
+        """
+        :param rel_type: the relationship type
+        :param start_label: the id space of the `start` column
+        :param end_label: the id space of the `end` column
+        :param relationships: `start` and `end` MERGE keys, and a column per property
+        :param merge: when the same relationship can be added more than once
+        """
+        relationships = relationships.assign(start=self.ids(relationships["start"]),
+                                             end=self.ids(relationships["end"])).dropna(subset=["start", "end"])
+        columns = relationships.rename(columns={"start": f":START_ID({start_label})",
+                                                "end": f":END_ID({end_label})"})
+        if not merge:
+            self.write("relationships", rel_type, columns)
+            return
+        self.pending_relationships.setdefault(rel_type, []).append(columns)
+
+    def close(self, args_file="import.args") -> list:
+        """
+        Write the merged nodes and relationships and the headers
+        :param args_file: file name, in output_dir, of the neo4j-admin arguments (usable as @args_file)
+        :return: the neo4j-admin import arguments
+        """
+        for label, pending in self.pending_nodes.items():
+            nodes = self.merge_rows(pd.concat(pending["frames"], ignore_index=True), [pending["key"]])
+            if pending["finalize"]:
+                nodes = pending["finalize"](nodes)
+            self.write("nodes", label, self.node_columns(label, pending["key"], nodes))
+        for rel_type, frames in self.pending_relationships.items():
+            relationships = pd.concat(frames, ignore_index=True)
+            self.write("relationships", rel_type, self.merge_rows(relationships, list(relationships.columns[:2])))
+        self.pending_nodes = {}
+        self.pending_relationships = {}
+
+        args = [f"--array-delimiter=U+{ord(ARRAY_DELIMITER):04X}", "--multiline-fields=true"]
+        for number, ((option, name, header), files) in enumerate(self.groups.items()):
+            header_file = self.output_dir / f"{option}_{name}_{number}_header.csv"
+            with header_file.open("w", newline="", encoding="utf-8") as f:
+                csv.writer(f, lineterminator="\n").writerow(header)
+            args.append(f"--{option}={name}=" + ",".join(str(path.resolve()) for path in [header_file] + files))
+        (self.output_dir / args_file).write_text("\n".join(args) + "\n", encoding="utf-8")
+        return args
+
+    def write(self, option, name, frame: pd.DataFrame):
+        if frame.empty:
+            return
+        header = tuple(column if column.startswith(":") else f"{column}:{self.property_type(frame[column])}"
+                       for column in frame.columns)
+        files = self.groups.setdefault((option, name, header), [])
+        number = list(self.groups).index((option, name, header))
+        path = self.output_dir / f"{option}_{name}_{number}_{len(files)}.csv"
+        files.append(path)
+        frame = frame.assign(**{column: self.join_lists(frame[column]) for column, kind in zip(frame.columns, header)
+                                if kind.endswith("[]")})
+        frame.to_csv(path, header=False, index=False)
+
+    def node_columns(self, label, key, nodes: pd.DataFrame) -> pd.DataFrame:
+        return pd.concat([self.ids(nodes[key]).rename(f":ID({label})"), nodes], axis=1)
+
+    @staticmethod
+    def select(frame: pd.DataFrame, properties: dict) -> pd.DataFrame:
+        """
+        :param properties: property -> column of frame or callable(frame) returning a Series. Properties whose
+          column is missing are skipped, as a SET of a missing value
+        """
+        columns = {}
+        for name, column in properties.items():
+            if callable(column):
+                columns[name] = column(frame)
+            elif column in frame:
+                columns[name] = frame[column]
+        return pd.DataFrame(columns, index=frame.index)
+
+    @staticmethod
+    def ids(values: pd.Series) -> pd.Series:
+        """
+        :return: the node ids of MERGE keys, equal numbers give the same id (e.g. 12 and 12.0)
+        """
+        if pd.api.types.is_float_dtype(values) and (values.dropna() % 1 == 0).all():
+            values = values.astype("Int64")
+        return values.astype("string")
+
+    @staticmethod
+    def property_type(values: pd.Series) -> str:
+        if pd.api.types.is_bool_dtype(values):
+            return "boolean"
+        if pd.api.types.is_integer_dtype(values):
+            return "long"
+        if pd.api.types.is_float_dtype(values):
+            return "double"
+        types = set(values.dropna().map(type))
+        if types == {list}:
+            return "string[]"
+        if types and types <= {int, float}:
+            return "long" if types == {int} else "double"
+        return "string"
+
+    @staticmethod
+    def join_lists(values: pd.Series) -> pd.Series:
+        return values.map(lambda items: ARRAY_DELIMITER.join(str(item) for item in items)
+                          if isinstance(items, list) else items)
+
+    @staticmethod
+    def merge_rows(frame: pd.DataFrame, keys: list) -> pd.DataFrame:
+        """
+        Merge the rows with the same keys: lists are united in order, the other columns keep their last value
+        """
+        duplicated = frame.duplicated(keys, keep=False)
+        if not duplicated.any():
+            return frame
+        if len(keys) == len(frame.columns):
+            return frame.drop_duplicates(keys)
+        list_columns = [column for column in frame.columns
+                        if column not in keys and frame[column].map(lambda value: isinstance(value, list)).any()]
+
+        def unite(lists):
+            return list(dict.fromkeys(item for items in lists if isinstance(items, list) for item in items))
+
+        merged = frame[duplicated].groupby(keys, sort=False, dropna=False) \
+            .agg({column: unite if column in list_columns else "last"
+                  for column in frame.columns if column not in keys}) \
+            .reset_index()
+        return pd.concat([frame[~duplicated], merged[frame.columns]], ignore_index=True)
+
+    @staticmethod
+    def shortest(names: pd.Series) -> pd.Series:
+        """
+        Same as trim(apoc.text.capitalize(reduce(shortest = head(names), ...))): the first of the shortest names
+        """
+        def shortest_name(values):
+            if not isinstance(values, list) or not values:
+                return None
+            name = str(min(values, key=lambda value: len(str(value))))
+            return (name[:1].upper() + name[1:]).strip()
+
+        return names.map(shortest_name)
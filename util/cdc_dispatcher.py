@@ -0,0 +1,176 @@
+"""
+Dispatch CDC changes to handlers in micro-batches
+  The changes are read from a cursor-based source (e.g. CDCService) and grouped into a batch until it holds
+  batch_size changes or batch_window seconds passed since its first change. Every handler receives the changes
+  of the batch it accepts. Each handler runs on its own worker thread, so different handlers process batches
+  concurrently while a single handler sees its batches in commit order. At most max_pending batches are in
+  flight: when the handlers fall behind, the dispatcher stops reading and the changes wait in the change log.
+  The source cursor moves past a batch once every handler processed it and all the batches before it, so a
+  restarted dispatcher processes again the batches that were in flight (at-least-once).
+  The lag of a handler, now minus the txCommitTime of the last change it processed, is reported in its
+  metrics stage (lag_seconds, max_lag_seconds) along with the rows and the time spent.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from threading import Event, Lock, Semaphore
+
+from neo4j.exceptions import TransientError
+
+
+def commit_time(change) -> float:
+    """
+    :return: the txCommitTime of a change as a timestamp
+    """
+    value = change["metadata"]["txCommitTime"]
+    if hasattr(value, "to_native"):
+        value = value.to_native()
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return value.timestamp()
+
+
+class ChangeHandler:
+    def __init__(self, name, handle, accept=None, retries=2):
+        self.name = name
+        self.handle = handle
+        self.accept = accept
+        self.retries = retries
+        self.max_lag = 0.0
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+
+    def accepted(self, batch) -> list:
+        return [change for change in batch if self.accept is None or self.accept(change)]
+
+
+class ChangeDispatcher:
+    def __init__(self, source, metrics=None, batch_size: int = 500, batch_window: float = 1.0,
+                 max_pending: int = 4, poll_interval: float = 1.0, on_commit=None):
+        """
+        :param source: the change source, with a cursor, a page_size, fetch_page(cursor) and commit(cursor)
+        :param metrics: optional ImportMetrics, every handler reports to the stage named after it
+        :param batch_size: the maximum number of changes of a batch
+        :param batch_window: the maximum seconds a change waits for its batch to fill
+        :param max_pending: the maximum number of batches dispatched and not yet processed by every handler
+        :param poll_interval: seconds waited before reading again when the change log is exhausted
+        :param on_commit: optional callable run with the cursor after it moved, e.g. to export the metrics
+        """
+        self.source = source
+        self.metrics = metrics
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.poll_interval = poll_interval
+        self.on_commit = on_commit
+        self.handlers = []
+        self.slots = Semaphore(max_pending)
+        self.in_flight = []
+        self.throttled_time = 0.0
+        self.error = None
+        self._lock = Lock()
+
+    def register(self, name: str, handle, accept=None, retries: int = 2):
+        """
+        Add a handler
+        :param name: the handler name, also its metrics stage
+        :param handle: callable processing a list of changes
+        :param accept: optional predicate selecting the changes the handler receives, all of them by default
+        :param retries: times a batch is handled again after a transient error (e.g. a deadlock with
+          another handler)
+        """
+        self.handlers.append(ChangeHandler(name, handle, accept, retries))
+        if self.metrics:
+            self.metrics.start_stage(name)
+        return self
+
+    def run(self, stop: Event = None):
+        """
+        Read and dispatch the changes until stop is set or a handler fails
+        :param stop: optional event ending the dispatch, the changes read are dispatched and processed first
+        """
+        stop = stop or Event()
+        cursor = self.source.cursor
+        batch = []
+        deadline = None
+        try:
+            while not stop.is_set() and self.error is None:
+                page = self.source.fetch_page(cursor)
+                for change in page:
+                    if not batch:
+                        deadline = time.monotonic() + self.batch_window
+                    batch.append(change)
+                    if len(batch) == self.batch_size:
+                        self.dispatch(batch)
+                        batch = []
+                if page:
+                    cursor = page[-1]["id"]
+                if batch and time.monotonic() >= deadline:
+                    self.dispatch(batch)
+                    batch = []
+                if len(page) < self.source.page_size:
+                    wait = self.poll_interval if not batch else max(0.0, min(self.poll_interval,
+                                                                             deadline - time.monotonic()))
+                    stop.wait(wait)
+            if batch and self.error is None:
+                self.dispatch(batch)
+        finally:
+            for handler in self.handlers:
+                handler.executor.shutdown(wait=True)
+        if self.error is not None:
+            raise self.error
+
+    def dispatch(self, batch):
+        if not self.slots.acquire(blocking=False):
+            logging.info("Handlers are behind, waiting before reading more changes")
+            start = time.perf_counter()
+            while not self.slots.acquire(timeout=self.poll_interval):
+                if self.error is not None:
+                    return
+            self.throttled_time += time.perf_counter() - start
+        routed = [(handler, handler.accepted(batch)) for handler in self.handlers]
+        routed = [(handler, changes) for handler, changes in routed if changes]
+        entry = {"cursor": batch[-1]["id"], "pending": len(routed)}
+        with self._lock:
+            self.in_flight.append(entry)
+        if not routed:
+            self.done(entry)
+        for handler, changes in routed:
+            handler.executor.submit(self.handle, handler, changes, entry)
+
+    def handle(self, handler: ChangeHandler, changes, entry):
+        if self.error is not None:
+            return
+        for attempt in range(handler.retries + 1):
+            start = time.perf_counter()
+            try:
+                handler.handle(changes)
+                break
+            except TransientError as e:
+                if attempt < handler.retries:
+                    logging.warning(f"Handler {handler.name} failed with {e.code}, handling the batch again")
+                    continue
+                self.error = e
+            except Exception as e:
+                self.error = e
+            logging.error(f"Handler {handler.name} failed, stopping the dispatch: {self.error}")
+            return
+        elapsed = time.perf_counter() - start
+        lag = time.time() - commit_time(changes[-1])
+        handler.max_lag = max(handler.max_lag, lag)
+        if self.metrics:
+            self.metrics.record_batch(handler.name, len(changes), 0.0, elapsed)
+            self.metrics.finish_stage(handler.name, lag_seconds=lag, max_lag_seconds=handler.max_lag,
+                                      throttled_time=self.throttled_time)
+        self.done(entry)
+
+    def done(self, entry):
+        with self._lock:
+            entry["pending"] -= 1
+            committed = None
+            while self.in_flight and self.in_flight[0]["pending"] <= 0:
+                committed = self.in_flight.pop(0)["cursor"]
+                self.slots.release()
+            if committed is not None:
+                self.source.commit(committed)
+        if committed is not None and self.on_commit:
+            self.on_commit(committed)
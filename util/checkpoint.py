@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from threading import Lock
+
+
+class CheckpointJournal:
+    """
+    Persist the progress of batch ingestions so that an interrupted load can be resumed
+      Every entry is identified by the source file and the query id and stores the offset of the
+      last committed row. The journal is rewritten atomically after every commit.
+    """
+
+    def __init__(self, journal_file, reject_file=None):
+        """
+        :param journal_file: path of the JSON journal
+        :param reject_file: optional path of the JSON lines file collecting the rows that can't be written
+        """
+        self.journal_file = Path(journal_file)
+        self.reject_file = Path(reject_file) if reject_file else None
+        self._lock = Lock()
+        self._entries = {}
+        if self.journal_file.is_file():
+            with self.journal_file.open("r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+
+    @staticmethod
+    def query_id(query: str):
+        return hashlib.sha1(" ".join(query.split()).encode("utf-8")).hexdigest()[:12]
+
+    @staticmethod
+    def _key(source, query_id):
+        return f"{source}|{query_id}"
+
+    def get_offset(self, source, query_id):
+        entry = self._entries.get(self._key(source, query_id))
+        return entry["offset"] if entry else 0
+
+    def is_done(self, source, query_id):
+        entry = self._entries.get(self._key(source, query_id))
+        return bool(entry and entry["done"])
+
+    def commit(self, source, query_id, offset, done=False):
+        with self._lock:
+            self._entries[self._key(source, query_id)] = {"source": str(source), "query_id": query_id,
+                                                         "offset": offset, "done": done}
+            self._save()
+
+    def clear(self, source=None, query_id=None):
+        """
+        Forget the progress of a query, of a whole source or, without arguments, of everything
+        """
+        with self._lock:
+            if source is None:
+                self._entries = {}
+            else:
+                self._entries = {key: entry for key, entry in self._entries.items()
+                                 if entry["source"] != str(source) or query_id not in (None, entry["query_id"])}
+            self._save()
+
+    def reject(self, source, query_id, row, error):
+        if self.reject_file is None:
+            raise error
+        with self._lock, self.reject_file.open("a", encoding="utf-8") as f:
+            f.write(json.dumps({"source": str(source), "query_id": query_id, "error": str(error), "row": row},
+                               default=str) + "\n")
+
+    def _save(self):
+        tmp_file = self.journal_file.with_name(self.journal_file.name + ".tmp")
+        with tmp_file.open("w", encoding="utf-8") as f:
+            json.dump(self._entries, f, indent=2)
+        os.replace(tmp_file, self.journal_file)
+
+
+class CursorCheckpoint:
+    """
+    Persist the cursor of a change feed (e.g. the id of the last CDC change processed) per database
+      The file is rewritten atomically, so a consumer killed while saving resumes from the previous cursor.
+    """
+
+    def __init__(self, checkpoint_file):
+        """
+        :param checkpoint_file: path of the JSON checkpoint
+        """
+        self.checkpoint_file = Path(checkpoint_file)
+        self._lock = Lock()
+        self._cursors = {}
+        if self.checkpoint_file.is_file():
+            with self.checkpoint_file.open("r", encoding="utf-8") as f:
+                self._cursors = json.load(f)
+
+    def load(self, database):
+        return self._cursors.get(database)
+
+    def save(self, database, cursor):
+        with self._lock:
+            self._cursors[database] = cursor
+            tmp_file = self.checkpoint_file.with_name(self.checkpoint_file.name + ".tmp")
+            with tmp_file.open("w", encoding="utf-8") as f:
+                json.dump(self._cursors, f, indent=2)
+            os.replace(tmp_file, self.checkpoint_file)
@@ -0,0 +1,185 @@
+"""
+Weakly connected components computed in the client, an alternative to gds.wcc.write without projection
+  The nodes and their outgoing relationships are read a page at a time with keyset pagination on an indexed
+  key (e.g. PersonRecord.pk), so every page is an index range seek whatever the offset. Element ids are mapped
+  to dense ints in the order they are read and merged in an array-backed union-find with path compression and
+  union by size. Like gds.wcc.write, every node gets an integer component id, here the dense int of the first
+  node read in its component, so the ids are stable as long as the keys don't change.
+  IncrementalComponents applies new relationships to components already written instead of recomputing them.
+"""
+import re
+
+PROPERTY = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent = []
+        self.size = []
+
+    def __len__(self):
+        return len(self.parent)
+
+    def add(self) -> int:
+        node = len(self.parent)
+        self.parent.append(node)
+        self.size.append(1)
+        return node
+
+    def find(self, node: int) -> int:
+        parent = self.parent
+        root = node
+        while parent[root] != root:
+            root = parent[root]
+        while parent[node] != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    def union(self, a: int, b: int):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+
+    def components(self) -> list:
+        """
+        :return: the component of every node, the smallest node of the component
+        """
+        first = {}
+        return [first.setdefault(self.find(node), node) for node in range(len(self.parent))]
+
+
+class ConnectedComponents:
+    def __init__(self, driver, database, label: str, relationship_types: list, key: str = None,
+                 node_filter: str = None, include_isolated: bool = True, page_size: int = 10000):
+        """
+        :param driver: the neo4j driver
+        :param database: the database to read
+        :param label: the label of the nodes, both ends of the relationships must have it
+        :param relationship_types: the relationship types connecting the nodes, their direction is ignored
+        :param key: a unique property the nodes are paginated on, preferably indexed; elementId(n) when missing
+        :param node_filter: optional Cypher predicate on `n` restricting the nodes, e.g. n.label = "Person"
+        :param include_isolated: give a component to the nodes without relationships, as a native projection
+          of the label does; otherwise only the nodes with relationships get one, as a Cypher projection
+        :param page_size: the number of nodes read per query
+        """
+        self._driver = driver
+        self.database = database
+        self.label = label
+        self.relationship_types = relationship_types
+        self.key = f"n.{key}" if key else "elementId(n)"
+        self.node_filter = node_filter
+        self.include_isolated = include_isolated
+        self.page_size = page_size
+        self.node_ids = {}
+        self.union_find = UnionFind()
+
+    def page_query(self, first: bool) -> str:
+        conditions = [f"{self.key} IS NOT NULL"] + ([] if first else [f"{self.key} > $after"]) + \
+            ([f"({self.node_filter})"] if self.node_filter else [])
+        return f"""
+        MATCH (n:{self.label})
+        WHERE {" AND ".join(conditions)}
+        WITH n ORDER BY {self.key} LIMIT $page_size
+        OPTIONAL MATCH (n)-[:{"|".join(self.relationship_types)}]->(m:{self.label})
+        RETURN {self.key} AS key, elementId(n) AS id, collect(elementId(m)) AS targets
+        ORDER BY key
+        """
+
+    def node(self, element_id: str) -> int:
+        node = self.node_ids.get(element_id)
+        if node is None:
+            node = self.node_ids[element_id] = self.union_find.add()
+        return node
+
+    def compute(self) -> dict:
+        """
+        Read the nodes and relationships and merge their components
+        :return: element id -> component id
+        """
+        connected = set()
+        after = None
+        with self._driver.session(database=self.database) as session:
+            while True:
+                rows = session.run(self.page_query(after is None),
+                                   {"after": after, "page_size": self.page_size}).data()
+                for row in rows:
+                    node = self.node(row["id"])
+                    for target in row["targets"]:
+                        other = self.node(target)
+                        self.union_find.union(node, other)
+                        connected.update((node, other))
+                if len(rows) < self.page_size:
+                    break
+                after = rows[-1]["key"]
+
+        components = self.union_find.components()
+        return {element_id: components[node] for element_id, node in self.node_ids.items()
+                if self.include_isolated or node in connected}
+
+    @staticmethod
+    def write_query(write_property: str) -> str:
+        if not PROPERTY.match(write_property):
+            raise ValueError(f"Invalid property name {write_property}")
+        return f"""
+        UNWIND $batch AS item
+        MATCH (n) WHERE elementId(n) = item.id
+        SET n.{write_property} = item.componentId
+        """
+
+
+class IncrementalComponents:
+    """
+    Apply a batch of new relationships to existing components
+      The union-find items are the components touched by the batch, not their nodes, plus the new nodes without
+      a component yet, so the work grows with the batch whatever the size of the components. Every group of
+      merged items keeps the id of its largest component: only the nodes of the smaller components have to be
+      relabeled. A group made of new nodes only gets the id new_component returns.
+    """
+
+    def __init__(self, components: dict, sizes: dict):
+        """
+        :param components: node -> its current component, None for a new node
+        :param sizes: component -> its number of nodes
+        """
+        self.components = components
+        self.sizes = sizes
+        self.items = {}
+        self.keys = []
+        self.union_find = UnionFind()
+        for node in components:
+            self.item(node)
+
+    def item(self, node) -> int:
+        component = self.components.get(node)
+        key = ("component", component) if component is not None else ("node", node)
+        item = self.items.get(key)
+        if item is None:
+            item = self.items[key] = self.union_find.add()
+            self.keys.append(key)
+        return item
+
+    def add_relationship(self, source, target):
+        self.union_find.union(self.item(source), self.item(target))
+
+    def resolve(self, new_component) -> tuple:
+        """
+        :param new_component: callable giving the component id of a group of new nodes from its first node
+        :return: (merged, assigned) where merged maps every absorbed component to the component it merges into
+          and assigned maps every new node to its component
+        """
+        groups = {}
+        for item, key in enumerate(self.keys):
+            groups.setdefault(self.union_find.find(item), []).append(key)
+        merged = {}
+        assigned = {}
+        for keys in groups.values():
+            components = [value for kind, value in keys if kind == "component"]
+            nodes = [value for kind, value in keys if kind == "node"]
+            target = max(components, key=lambda c: self.sizes.get(c, 0)) if components else new_component(nodes[0])
+            merged.update({component: target for component in components if component != target})
+            assigned.update({node: target for node in nodes})
+        return merged, assigned
@@ -0,0 +1,103 @@
+"""
+Process-wide registry of neo4j drivers
+  A driver owns a connection pool, so the importers and services of a process that connect to the same database
+  with the same credentials and options share one driver instead of opening a pool each. Drivers are keyed by
+  (uri, digest of the credentials, database, options) and reference counted: release() only closes a driver
+  when its last user releases it, the remaining ones are closed at exit.
+"""
+import atexit
+import configparser
+import hashlib
+import os
+from functools import lru_cache
+from threading import Lock
+
+from neo4j import GraphDatabase
+
+CONFIG_FILE = os.path.join(os.path.dirname(__file__), '..', 'config.ini')
+
+# config.ini [neo4j] options that aren't driver options
+IGNORED_PARAMS = {'uri', 'user', 'password', 'database'}
+PARAM_CONVERTERS = {'encrypted': lambda x: int(x),
+                    'max_transaction_retry_time': lambda x: float(x),
+                    'max_connection_pool_size': lambda x: int(x),
+                    'max_connection_lifetime': lambda x: float(x),
+                    'connection_acquisition_timeout': lambda x: float(x),
+                    'connection_timeout': lambda x: float(x),
+                    'fetch_size': lambda x: int(x)}
+
+
+@lru_cache(maxsize=None)
+def read_config(config_file: str = CONFIG_FILE) -> configparser.ConfigParser:
+    """
+    :return: the parsed config_file, read once per process
+    """
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    return config
+
+
+def driver_params(neo4j_params) -> dict:
+    """
+    :param neo4j_params: the [neo4j] section of a config file
+    :return: the driver options of the section, converted to their types
+    """
+    return dict((key, PARAM_CONVERTERS[key](value) if key in PARAM_CONVERTERS else value)
+                for key, value in neo4j_params.items() if key not in IGNORED_PARAMS)
+
+
+class DriverRegistry:
+    _lock = Lock()
+    # key -> [driver, references]
+    _drivers = {}
+
+    @classmethod
+    def acquire(cls, uri: str, auth: tuple, params: dict = None, database: str = None, factory=None):
+        """
+        :param uri: the bolt or neo4j uri
+        :param auth: the (user, password) tuple
+        :param params: the other driver options, e.g. max_connection_pool_size or fetch_size
+        :param database: the database the driver is used for, drivers aren't shared across databases
+        :param factory: optional callable(uri, auth=auth, **params) creating the driver, GraphDatabase.driver by
+          default; it's part of the key so that drivers of different kinds aren't mixed
+        :return: the shared driver, to be given back with release()
+        """
+        factory = factory or GraphDatabase.driver
+        params = params or {}
+        # a different password never reuses a driver, the credentials are hashed to keep them out of the key
+        credentials = hashlib.sha256(repr(tuple(auth)).encode("utf-8")).hexdigest()
+        key = (uri, credentials, database, tuple(sorted((name, str(value)) for name, value in params.items())),
+               factory)
+        with cls._lock:
+            entry = cls._drivers.get(key)
+            if entry is None:
+                entry = cls._drivers[key] = [factory(uri, auth=auth, **params), 0]
+            entry[1] += 1
+            return entry[0]
+
+    @classmethod
+    def release(cls, driver):
+        """
+        Give back a driver returned by acquire(), it's closed when no one else uses it
+          Drivers that weren't acquired here (e.g. fakes) are closed right away.
+        """
+        with cls._lock:
+            for key, entry in cls._drivers.items():
+                if entry[0] is driver:
+                    entry[1] -= 1
+                    if entry[1] > 0:
+                        return
+                    del cls._drivers[key]
+                    break
+        driver.close()
+
+    @classmethod
+    def close_all(cls):
+        with cls._lock:
+            drivers = [entry[0] for entry in cls._drivers.values()]
+            cls._drivers.clear()
+        for driver in drivers:
+            driver.close()
+
+
+atexit.register(DriverRegistry.close_all)
@@ -0,0 +1,254 @@
+"""
+Drivers with the subset of the neo4j driver API used by GraphDBBase and BaseImporter
+  - RecordingDriver wraps a real driver and logs every query (text, parameter sizes, returned records and
+    counters) to a JSON lines file
+  - FakeDriver never touches the network: it answers from a recording, from responder callables or with
+    empty results, so the Python side of the importers can be measured offline
+"""
+import json
+import re
+import time
+from collections import defaultdict
+from pathlib import Path
+from threading import Lock
+from types import SimpleNamespace
+
+from util.checkpoint import CheckpointJournal
+from util.driver_registry import DriverRegistry
+from util.metrics import COUNTERS
+
+
+def parameter_sizes(parameters):
+    """
+    :return: the number of $batch rows and the approximate serialized size of the parameters
+    """
+    parameters = parameters or {}
+    batch = parameters.get("batch")
+    rows = len(batch) if isinstance(batch, list) else 1
+    return rows, len(json.dumps(parameters, default=str))
+
+
+class FakeRecord(dict):
+    def data(self):
+        return dict(self)
+
+    def value(self, key=0):
+        return list(self.values())[key] if isinstance(key, int) else self[key]
+
+
+class FakeSummary:
+    def __init__(self, counters=None, result_available_after=0, result_consumed_after=0):
+        counters = counters or {}
+        self.counters = SimpleNamespace(**{counter: counters.get(counter, 0) for counter in COUNTERS})
+        self.result_available_after = result_available_after
+        self.result_consumed_after = result_consumed_after
+
+
+class FakeResult:
+    def __init__(self, records=(), summary=None):
+        self._records = [FakeRecord(record) for record in records]
+        self._summary = summary or FakeSummary()
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def single(self):
+        return self._records[0] if self._records else None
+
+    def data(self):
+        return [record.data() for record in self._records]
+
+    def consume(self):
+        return self._summary
+
+
+class FakeTransaction:
+    def __init__(self, session):
+        self._session = session
+
+    def run(self, query, parameters=None, **kwargs):
+        return self._session.run(query, parameters, **kwargs)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    def __init__(self, driver):
+        self._driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        pass
+
+    def run(self, query, parameters=None, **kwargs):
+        return self._driver.answer(query, {**(parameters or {}), **kwargs})
+
+    def begin_transaction(self):
+        return FakeTransaction(self)
+
+    def execute_write(self, work, *args, **kwargs):
+        return work(FakeTransaction(self), *args, **kwargs)
+
+    def execute_read(self, work, *args, **kwargs):
+        return work(FakeTransaction(self), *args, **kwargs)
+
+    write_transaction = execute_write
+    read_transaction = execute_read
+
+
+class FakeDriver:
+    """
+    Offline driver answering queries from a recording and/or from responders
+      Responders are (pattern, callable) pairs: the first pattern found (regex search) in the query text
+      answers with callable(parameters) -> list of dicts. Recorded answers are replayed in order for every
+      query id, cycling when a query runs more times than it was recorded.
+    """
+
+    def __init__(self, replay_file=None, responders=None):
+        self.responders = [(re.compile(pattern), answer) for pattern, answer in (responders or [])]
+        self.recording = defaultdict(list)
+        self.replayed = defaultdict(int)
+        self.queries = defaultdict(lambda: {"runs": 0, "rows": 0, "parameter_bytes": 0})
+        self._lock = Lock()
+        if replay_file:
+            with Path(replay_file).open("r", encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.recording[entry["query_id"]].append(entry)
+
+    def session(self, **kwargs):
+        return FakeSession(self)
+
+    def close(self):
+        pass
+
+    def verify_connectivity(self):
+        pass
+
+    def answer(self, query, parameters):
+        query_id = CheckpointJournal.query_id(query)
+        rows, parameter_bytes = parameter_sizes(parameters)
+        with self._lock:
+            stats = self.queries[query_id]
+            stats["runs"] += 1
+            stats["rows"] += rows
+            stats["parameter_bytes"] += parameter_bytes
+            entries = self.recording.get(query_id)
+            if entries:
+                entry = entries[self.replayed[query_id] % len(entries)]
+                self.replayed[query_id] += 1
+                return FakeResult(entry.get("records", []),
+                                  FakeSummary(entry.get("counters"), entry.get("result_available_after", 0),
+                                              entry.get("result_consumed_after", 0)))
+        for pattern, respond in self.responders:
+            if pattern.search(query):
+                return FakeResult(respond(parameters))
+        return FakeResult()
+
+    def total_rows(self):
+        return sum(stats["rows"] for stats in self.queries.values())
+
+    def reset_stats(self):
+        self.queries.clear()
+
+
+class RecordingSession:
+    def __init__(self, driver, session):
+        self._driver = driver
+        self._session = session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._session.close()
+
+    def run(self, query, parameters=None, **kwargs):
+        return self._driver.record(self._session.run, query, {**(parameters or {}), **kwargs})
+
+    def begin_transaction(self):
+        return RecordingTransaction(self._driver, self._session.begin_transaction())
+
+    def execute_write(self, work, *args, **kwargs):
+        return self._session.execute_write(
+            lambda tx, *a, **kw: work(RecordingTransaction(self._driver, tx), *a, **kw), *args, **kwargs)
+
+    def execute_read(self, work, *args, **kwargs):
+        return self._session.execute_read(
+            lambda tx, *a, **kw: work(RecordingTransaction(self._driver, tx), *a, **kw), *args, **kwargs)
+
+
+class RecordingTransaction:
+    def __init__(self, driver, tx):
+        self._driver = driver
+        self._tx = tx
+
+    def run(self, query, parameters=None, **kwargs):
+        return self._driver.record(self._tx.run, query, {**(parameters or {}), **kwargs})
+
+    def commit(self):
+        self._tx.commit()
+
+    def rollback(self):
+        self._tx.rollback()
+
+    def close(self):
+        self._tx.close()
+
+
+class RecordingDriver:
+    """
+    Wrap a real driver and append every query to log_file
+      Results are fully fetched to be logged, at most record_limit records are kept per query run.
+    """
+
+    def __init__(self, driver, log_file, record_limit=100000):
+        self._driver = driver
+        self.log_file = Path(log_file)
+        self.record_limit = record_limit
+        self._lock = Lock()
+
+    def session(self, **kwargs):
+        return RecordingSession(self, self._driver.session(**kwargs))
+
+    def close(self):
+        DriverRegistry.release(self._driver)
+
+    def verify_connectivity(self):
+        self._driver.verify_connectivity()
+
+    def record(self, run, query, parameters):
+        start = time.perf_counter()
+        result = run(query, parameters)
+        records = [dict(record) for record in result]
+        summary = result.consume()
+        rows, parameter_bytes = parameter_sizes(parameters)
+        entry = {"query_id": CheckpointJournal.query_id(query),
+                 "query": query,
+                 "rows": rows,
+                 "parameter_bytes": parameter_bytes,
+                 "parameters": {key: len(value) if isinstance(value, (list, dict, str)) else None
+                                for key, value in parameters.items()},
+                 "elapsed": time.perf_counter() - start,
+                 "records": records[:self.record_limit],
+                 "counters": {counter: getattr(summary.counters, counter, 0) for counter in COUNTERS},
+                 "result_available_after": summary.result_available_after,
+                 "result_consumed_after": summary.result_consumed_after}
+        with self._lock, self.log_file.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, default=str) + "\n")
+        return FakeResult(records, summary)
@@ -0,0 +1,95 @@
+"""
+A GDS in-memory graph shared by several algorithms
+  The graph is projected once when entering the context, the algorithms run in mutate mode adding their results
+  to the in-memory graph, and write() stores all of them with a single gds.graph.nodeProperties.write. Algorithms
+  whose results can't be mutated on every GDS version, like the intermediate Louvain communities, run in write
+  mode with write_algorithm() instead. The graph
+  is dropped when leaving the context, also on errors, and a graph with the same name left over by an
+  interrupted run is dropped before projecting.
+"""
+import logging
+import re
+
+ALGORITHM = re.compile(r"^[A-Za-z][A-Za-z0-9.]*$")
+
+
+class GdsProjection:
+    def __init__(self, driver, database, graph_name: str, projection_query: str, parameters: dict = None):
+        """
+        :param driver: the neo4j driver
+        :param database: the database to project
+        :param graph_name: the in-memory graph name, passed to projection_query as $graph_name
+        :param projection_query: a native or Cypher projection returning a single row
+        :param parameters: optional other parameters of projection_query
+        """
+        self._driver = driver
+        self.database = database
+        self.graph_name = graph_name
+        self.projection_query = projection_query
+        self.parameters = parameters or {}
+        self.mutated = []
+        self.projection = None
+
+    def __enter__(self):
+        self.drop()
+        logging.info(f"Projecting {self.graph_name}")
+        self.projection = self.run(self.projection_query, {**self.parameters, "graph_name": self.graph_name})
+        return self
+
+    def __exit__(self, *args):
+        self.drop()
+        return False
+
+    def run(self, query, parameters=None) -> dict:
+        with self._driver.session(database=self.database) as session:
+            record = session.run(query, parameters or {}).single()
+            return record.data() if record else {}
+
+    def drop(self):
+        self.run("CALL gds.graph.drop($graph_name, false) YIELD graphName RETURN graphName",
+                 {"graph_name": self.graph_name})
+
+    def mutate(self, algorithm: str, mutate_property: str, **config) -> dict:
+        """
+        Run an algorithm in mutate mode
+        :param algorithm: the algorithm procedure name, e.g. wcc, louvain or pageRank
+        :param mutate_property: the node property added to the in-memory graph
+        :param config: the other algorithm configuration, e.g. relationshipWeightProperty
+        :return: nodePropertiesWritten and mutateMillis
+        """
+        if not ALGORITHM.match(algorithm):
+            raise ValueError(f"Invalid algorithm name {algorithm}")
+        logging.info(f"Running {algorithm} on {self.graph_name}")
+        result = self.run(f"CALL gds.{algorithm}.mutate($graph_name, $config) "
+                          "YIELD nodePropertiesWritten, mutateMillis RETURN nodePropertiesWritten, mutateMillis",
+                          {"graph_name": self.graph_name, "config": {**config, "mutateProperty": mutate_property}})
+        self.mutated.append(mutate_property)
+        return result
+
+    def write_algorithm(self, algorithm: str, write_property: str, **config) -> dict:
+        """
+        Run an algorithm in write mode, storing its result directly in the database
+        :param algorithm: the algorithm procedure name, e.g. louvain
+        :param write_property: the node property written to the database
+        :param config: the other algorithm configuration, e.g. relationshipWeightProperty
+        :return: nodePropertiesWritten and writeMillis
+        """
+        if not ALGORITHM.match(algorithm):
+            raise ValueError(f"Invalid algorithm name {algorithm}")
+        logging.info(f"Running {algorithm} on {self.graph_name}, writing {write_property}")
+        return self.run(f"CALL gds.{algorithm}.write($graph_name, $config) "
+                        "YIELD nodePropertiesWritten, writeMillis RETURN nodePropertiesWritten, writeMillis",
+                        {"graph_name": self.graph_name, "config": {**config, "writeProperty": write_property}})
+
+    def write(self, properties: list = None, node_labels: list = None) -> dict:
+        """
+        Write node properties of the in-memory graph to the database in one pass
+        :param properties: the properties to write, all the mutated ones by default
+        :param node_labels: optional labels of the nodes to write, all by default
+        :return: propertiesWritten and writeMillis
+        """
+        logging.info(f"Writing {', '.join(properties or self.mutated)} from {self.graph_name}")
+        return self.run("CALL gds.graph.nodeProperties.write($graph_name, $properties, $node_labels) "
+                        "YIELD propertiesWritten, writeMillis RETURN propertiesWritten, writeMillis",
+                        {"graph_name": self.graph_name, "properties": properties or self.mutated,
+                         "node_labels": node_labels or ["*"]})
@@ -1,9 +1,9 @@
-from neo4j import GraphDatabase
-import configparser
 import os
 import sys
 import getopt
 
+from util.driver_registry import DriverRegistry, driver_params, read_config
+
 help_message = '-u <neo4j username> -p <password> -s <source directory> -b <bolt uri>'
 
 neo4j_user = 'neo4j'
@@ -28,28 +28,25 @@ class GraphDBBase:
             self.__get_main_parameters__(command=command, argv=argv, extended_options=extended_options,
                                          extended_long_options=extended_long_options)
 
-        config = configparser.ConfigParser()
-        config_file = os.path.join(os.path.dirname(__file__), '..', 'config.ini')
-        config.read(config_file)
-        neo4j_params = config['neo4j']
+        self._driver = self.create_driver(*self.get_driver_settings())
+        self._session = None
+
+    def get_driver_settings(self):
+        """
+        Resolve the connection settings from command line, environment and config.ini (in this order)
+        :return: the uri, the auth tuple and the other driver options
+        """
+        neo4j_params = read_config()['neo4j']
 
         uri = self.uri or os.getenv('NEO4J_URI') or neo4j_params.get('uri', 'bolt://localhost:7687')
         user = self.neo4j_user or os.getenv('NEO4J_USER') or neo4j_params.get('user', 'neo4j')
         password = self.neo4j_password or os.getenv('NEO4J_PASSWORD') or neo4j_params.get('password', 'password')
         self.database = self.database or os.getenv('NEO4J_DATABASE') or neo4j_params.get('database', 'neo4j')
-        ignored_params = {'uri', 'user', 'password'}
-        param_converters = {'encrypted': lambda x: int(x)}
+        other_params = driver_params(neo4j_params)
+        return uri, (user, password), other_params
 
-        def maybe_convert(key: str, value: str):
-            if key in param_converters:
-                return param_converters[key](value)
-            return value
-
-        other_params = dict([(key, maybe_convert(key, value)) for key, value in neo4j_params.items()
-                             if key not in ignored_params])
-
-        self._driver = GraphDatabase.driver(uri, auth=(user, password), **other_params)
-        self._session = None
+    def create_driver(self, uri, auth, params):
+        return DriverRegistry.acquire(uri, auth, params, self.database)
 
     def get_opts(self):
         return self.opts
@@ -62,7 +59,7 @@ class GraphDBBase:
         return default
 
     def close(self):
-        self._driver.close()
+        DriverRegistry.release(self._driver)
 
     def get_session(self):
         return self._driver.session(database=self.database)
@@ -0,0 +1,140 @@
+import json
+import time
+from pathlib import Path
+from threading import Lock
+
+COUNTERS = ["nodes_created", "nodes_deleted", "relationships_created", "relationships_deleted",
+            "properties_set", "labels_added", "labels_removed", "indexes_added", "constraints_added"]
+
+
+class StageMetrics:
+    """
+    Totals of the batches written by a single importer stage
+      Server times (result_available_after, result_consumed_after) are in milliseconds as reported by
+      the result summaries, client times are in seconds.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.finished = None
+        self.batches = 0
+        self.rows = 0
+        self.prep_time = 0.0
+        self.write_time = 0.0
+        self.batch_times = []
+        self.counters = {counter: 0 for counter in COUNTERS}
+        self.result_available_after = 0
+        self.result_consumed_after = 0
+        self.extra = {}
+
+    def add_summary(self, summary):
+        if summary is None:
+            return
+        for counter in COUNTERS:
+            self.counters[counter] += getattr(summary.counters, counter, 0) or 0
+        self.result_available_after += summary.result_available_after or 0
+        self.result_consumed_after += summary.result_consumed_after or 0
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+    def percentile(self, p):
+        if not self.batch_times:
+            return 0.0
+        times = sorted(self.batch_times)
+        return times[min(len(times) - 1, int(round(p * (len(times) - 1))))]
+
+    def as_dict(self):
+        return {"stage": self.name,
+                "batches": self.batches,
+                "rows": self.rows,
+                "elapsed": self.elapsed,
+                "rows_per_second": self.rows_per_second,
+                "prep_time": self.prep_time,
+                "write_time": self.write_time,
+                "batch_time_p50": self.percentile(0.5),
+                "batch_time_p95": self.percentile(0.95),
+                "batch_time_max": max(self.batch_times, default=0.0),
+                "result_available_after_ms": self.result_available_after,
+                "result_consumed_after_ms": self.result_consumed_after,
+                **self.counters,
+                **self.extra}
+
+
+class ImportMetrics:
+    """
+    Collect per stage metrics of an importer run and export them as JSON or Prometheus text format
+    """
+
+    def __init__(self, run_name="import"):
+        self.run_name = run_name
+        self.started = time.time()
+        self.stages = {}
+        self._lock = Lock()
+
+    def stage(self, name) -> StageMetrics:
+        with self._lock:
+            if name not in self.stages:
+                self.stages[name] = StageMetrics(name)
+            return self.stages[name]
+
+    def start_stage(self, name):
+        stage = self.stage(name)
+        stage.finished = None
+        return stage
+
+    def finish_stage(self, name, **extra):
+        stage = self.stage(name)
+        stage.finished = time.time()
+        stage.extra.update(extra)
+        return stage
+
+    def record_batch(self, name, rows, prep_time, write_time, summaries=()):
+        """
+        :param name: the stage name
+        :param rows: the number of rows in the batch
+        :param prep_time: seconds spent on the client preparing the batch
+        :param write_time: seconds spent writing the batch (round-trip included)
+        :param summaries: the result summaries of the queries run for the batch
+        """
+        stage = self.stage(name)
+        with self._lock:
+            stage.batches += 1
+            stage.rows += rows
+            stage.prep_time += prep_time
+            stage.write_time += write_time
+            stage.batch_times.append(write_time)
+            for summary in summaries:
+                stage.add_summary(summary)
+
+    def report(self):
+        return {"run": self.run_name,
+                "started": self.started,
+                "elapsed": time.time() - self.started,
+                "stages": [stage.as_dict() for stage in self.stages.values()]}
+
+    def write_json(self, path):
+        with Path(path).open("w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def write_prometheus(self, path):
+        lines = []
+        stages = [stage.as_dict() for stage in self.stages.values()]
+        metric_names = []
+        for stage in stages:
+            metric_names += [key for key in stage if key != "stage" and key not in metric_names]
+        for key in metric_names:
+            metric = f"kg_import_{key}"
+            lines.append(f"# TYPE {metric} gauge")
+            for stage in stages:
+                value = stage.get(key)
+                if isinstance(value, (int, float)):
+                    lines.append(f'{metric}{{run="{self.run_name}",stage="{stage["stage"]}"}} {value}')
+        with Path(path).open("w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
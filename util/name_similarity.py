@@ -0,0 +1,193 @@
+"""
+Sørensen-Dice similarity of names computed in the client, an alternative to a fulltext lookup per record
+  As apoc.text.sorensenDiceSimilarity, a name is compared through the set of the letter pairs of its upper-cased
+  words and the similarity of two names is 2 |A ∩ B| / (|A| + |B|). Names with the same set of pairs (e.g. the
+  same words in another order) are collapsed into a single entry, similar to each other with a score of 1.
+  Candidate entries are blocked with a prefix filter: the pairs of every entry are sorted from the rarest one and
+  only its first |A| - ceil(t |A| / (2 - t)) + 1 pairs are indexed, so that two entries scoring more than the
+  threshold t always share an indexed pair and the blocking loses nothing. Each block is scored at once in NumPy
+  as the product of its incidence matrix with its transpose.
+  fuzzy_match mirrors the fuzzy terms of a fulltext query (word~0.3), to keep a fulltext prefilter in the client.
+"""
+import math
+from collections import Counter
+
+import numpy as np
+
+
+def bigrams(name: str) -> frozenset:
+    return frozenset(word[i:i + 2] for word in name.upper().split() for i in range(len(word) - 1))
+
+
+def dice(first: str, second: str) -> float:
+    """
+    :return: the Sørensen-Dice similarity of two names, one by one
+    """
+    if first.upper() == second.upper():
+        return 1.0
+    a, b = bigrams(first), bigrams(second)
+    return 2 * len(a & b) / (len(a) + len(b)) if a or b else 0.0
+
+
+def edit_distance(first: str, second: str, limit: int) -> int:
+    """
+    :return: the optimal string alignment distance (adjacent transpositions count as one edit), or limit + 1
+      when it's over limit
+    """
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    previous, current = None, list(range(len(second) + 1))
+    for i in range(1, len(first) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(second)
+        for j in range(1, len(second) + 1):
+            cost = first[i - 1] != second[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and first[i - 1] == second[j - 2] and first[i - 2] == second[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+    return current[-1]
+
+
+def fuzzy_match(word: str, tokens, similarity: float) -> bool:
+    """
+    If a word matches one of tokens as a Lucene fuzzy term word~similarity does: within
+    min(2, (1 - similarity) * len(word)) edits, case-insensitive
+    """
+    word = word.lower()
+    limit = min(2, int((1 - similarity) * len(word)))
+    return any(edit_distance(word, token, limit) <= limit for token in tokens)
+
+
+class SimilarNames:
+    def __init__(self, threshold: float, chunk_size: int = 512):
+        """
+        :param threshold: the similarity a pair of names must exceed
+        :param chunk_size: the rows of a block scored at once, bounding the size of the score matrix
+        """
+        self.threshold = threshold
+        self.chunk_size = chunk_size
+        self.keys = {}
+        self.sets = []
+        self.items = []
+
+    def __len__(self):
+        return len(self.sets)
+
+    def add(self, item, name: str):
+        """
+        :param item: the identifier returned in the pairs, e.g. the record key
+        :param name: the name of the item
+        """
+        grams = bigrams(name)
+        # names without letter pairs (e.g. initials) only match the same name
+        key = grams if grams else name.upper()
+        entry = self.keys.get(key)
+        if entry is None:
+            entry = self.keys[key] = len(self.sets)
+            self.sets.append(grams)
+            self.items.append([])
+        self.items[entry].append(item)
+
+    def prefixes(self) -> list:
+        """
+        :return: the indexed letter pairs of every entry, the rarest ones
+        """
+        frequency = Counter(gram for grams in self.sets for gram in grams)
+        overlap = self.threshold / (2 - self.threshold)
+        prefixes = []
+        for grams in self.sets:
+            ordered = sorted(grams, key=lambda gram: (frequency[gram], gram))
+            prefixes.append(ordered[:len(ordered) - math.ceil(overlap * len(ordered)) + 1])
+        return prefixes
+
+    @staticmethod
+    def index(prefixes: list) -> dict:
+        """
+        :return: letter pair -> the entries indexing it, ascending
+        """
+        index = {}
+        for entry, grams in enumerate(prefixes):
+            for gram in grams:
+                index.setdefault(gram, []).append(entry)
+        return index
+
+    def blocks(self) -> list:
+        """
+        :return: the lists of entries sharing an indexed letter pair, ascending
+        """
+        return [entries for entries in self.index(self.prefixes()).values() if len(entries) > 1]
+
+    def score_block(self, block: list, scores: dict):
+        grams = sorted(set().union(*(self.sets[entry] for entry in block)))
+        column = {gram: i for i, gram in enumerate(grams)}
+        matrix = np.zeros((len(block), len(grams)), dtype=np.float32)
+        for row, entry in enumerate(block):
+            matrix[row, [column[gram] for gram in self.sets[entry]]] = 1.0
+        sizes = matrix.sum(axis=1, dtype=np.float64)
+        for start in range(0, len(block), self.chunk_size):
+            # the intersections are small integers, exact in float32
+            intersections = (matrix[start:start + self.chunk_size] @ matrix.T).astype(np.float64)
+            similarity = 2 * intersections / (sizes[start:start + self.chunk_size, None] + sizes[None, :])
+            rows, columns = np.nonzero(similarity > self.threshold)
+            upper = rows + start < columns
+            for row, col in zip(rows[upper], columns[upper]):
+                scores[(block[row + start], block[col])] = float(similarity[row, col])
+
+    def entry_pairs(self) -> dict:
+        """
+        :return: (entry, other entry) -> similarity for the distinct entries over the threshold
+        """
+        scores = {}
+        for block in self.blocks():
+            self.score_block(block, scores)
+        return scores
+
+    def pairs(self):
+        """
+        The pairs of items whose names are more similar than the threshold, each pair once
+        :return: a generator of (item, other item, similarity)
+        """
+        for items in self.items:
+            for i, item in enumerate(items):
+                for other in items[i + 1:]:
+                    yield item, other, 1.0
+        for (entry, other_entry), score in self.entry_pairs().items():
+            for item in self.items[entry]:
+                for other in self.items[other_entry]:
+                    yield item, other, score
+
+    def pairs_for(self, items):
+        """
+        The pairs of pairs() with at least one of items, scoring only the blocks of their names
+          Meant for a few items among many, e.g. the records of a CDC batch: the cost follows the candidates
+          sharing an indexed letter pair with them instead of every block.
+        :return: a generator of (item, other item, similarity)
+        """
+        items = set(items)
+        targets = [entry for entry, entry_items in enumerate(self.items) if not items.isdisjoint(entry_items)]
+        prefixes = self.prefixes()
+        index = self.index(prefixes)
+        scores = {}
+        for entry in targets:
+            grams = self.sets[entry]
+            for other_entry in {other for gram in prefixes[entry] for other in index[gram]}:
+                pair = (min(entry, other_entry), max(entry, other_entry))
+                if other_entry == entry or pair in scores:
+                    continue
+                other_grams = self.sets[other_entry]
+                similarity = 2 * len(grams & other_grams) / (len(grams) + len(other_grams))
+                if similarity > self.threshold:
+                    scores[pair] = similarity
+
+        for entry in targets:
+            entry_items = self.items[entry]
+            for i, item in enumerate(entry_items):
+                for other in entry_items[i + 1:]:
+                    if item in items or other in items:
+                        yield item, other, 1.0
+        for (entry, other_entry), score in scores.items():
+            for item in self.items[entry]:
+                for other in self.items[other_entry]:
+                    if item in items or other in items:
+                        yield item, other, score
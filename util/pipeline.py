@@ -0,0 +1,170 @@
+"""
+Run importer stages as a dependency graph in a single process
+  Every stage declares the stages it depends on and the input files it reads. A stage starts as soon as its
+  dependencies completed, so independent stages (e.g. people and licenses records) run concurrently on
+  worker threads; since the importers of a process share their driver (see DriverRegistry) they also share
+  the connection pool. A stage is complete when its callable returns, i.e. when its queries are consumed.
+  The fingerprint of a stage hashes its name, the path, size and modification time of its inputs and the
+  fingerprints of its dependencies. Completed fingerprints are kept in a JSON state file and a rerun skips the
+  stages whose fingerprint didn't change, while a stage whose inputs changed reruns along with everything
+  downstream of it.
+"""
+import hashlib
+import json
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from threading import Lock
+
+from neo4j.exceptions import TransientError
+
+
+class PipelineStage:
+    def __init__(self, name, run, depends=(), inputs=(), cache=True, retries=2):
+        self.name = name
+        self.run = run
+        self.depends = list(depends)
+        self.inputs = list(inputs)
+        self.cache = cache
+        self.retries = retries
+
+
+class Pipeline:
+    def __init__(self, state_file=None, workers: int = 4, force: bool = False):
+        """
+        :param state_file: optional JSON file with the fingerprints of the completed stages, nothing is skipped
+          without it
+        :param workers: the maximum number of stages running at the same time
+        :param force: run every stage even when its fingerprint didn't change
+        """
+        self.state_file = Path(state_file) if state_file else None
+        self.workers = workers
+        self.force = force
+        self.stages = {}
+        self._lock = Lock()
+        self.state = {}
+        if self.state_file and self.state_file.is_file():
+            self.state = json.loads(self.state_file.read_text(encoding="utf-8"))
+
+    def stage(self, name: str, run, depends=(), inputs=(), cache: bool = True, retries: int = 2):
+        """
+        Declare a stage
+        :param name: unique stage name
+        :param run: callable without arguments running the stage, it must return once its writes are complete
+        :param depends: the names of the stages to complete first
+        :param inputs: the files the stage reads, part of its fingerprint
+        :param cache: skip the stage when its fingerprint didn't change, False for cheap idempotent stages
+          (e.g. the schema) that should always run
+        :param retries: times the stage is rerun after a transient error (e.g. a deadlock with a concurrent
+          stage), the stages MERGE so running them again is safe
+        """
+        if name in self.stages:
+            raise ValueError(f"Stage {name} is already declared")
+        self.stages[name] = PipelineStage(name, run, depends, inputs, cache, retries)
+        return self
+
+    def fingerprint(self, name: str, fingerprints: dict) -> str:
+        stage = self.stages[name]
+        digest = hashlib.sha1(name.encode("utf-8"))
+        for path in map(Path, stage.inputs):
+            stat = path.stat() if path.exists() else None
+            digest.update(f"{path.resolve()}:{stat.st_size if stat else -1}:{stat.st_mtime_ns if stat else -1}"
+                          .encode("utf-8"))
+        for dependency in sorted(stage.depends):
+            digest.update(fingerprints[dependency].encode("utf-8"))
+        return digest.hexdigest()
+
+    def order(self, targets=None) -> list:
+        """
+        :param targets: optional stage names, only they and their dependencies are returned
+        :return: the stage names in a dependency order
+        """
+        ordered = []
+        visiting = set()
+
+        def visit(name):
+            if name in ordered:
+                return
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage {name}")
+            if name in visiting:
+                raise ValueError(f"Dependency cycle through stage {name}")
+            visiting.add(name)
+            for dependency in self.stages[name].depends:
+                visit(dependency)
+            visiting.discard(name)
+            ordered.append(name)
+
+        for name in targets or self.stages:
+            visit(name)
+        return ordered
+
+    def run(self, targets=None) -> dict:
+        """
+        Run the stages, each one as soon as its dependencies are complete
+        :param targets: optional stage names to run along with their dependencies, all the stages by default
+        :return: stage name -> "done" or "skipped"
+        """
+        names = self.order(targets)
+        fingerprints = {}
+        for name in names:
+            fingerprints[name] = self.fingerprint(name, fingerprints)
+
+        outcome = {}
+        pending = list(names)
+        running = {}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while pending or running:
+                for name in [name for name in pending if all(d in outcome for d in self.stages[name].depends)]:
+                    pending.remove(name)
+                    stage = self.stages[name]
+                    if stage.cache and not self.force and self.state.get(name) == fingerprints[name]:
+                        logging.info(f"Skipping stage {name}, its inputs didn't change")
+                        outcome[name] = "skipped"
+                    else:
+                        # a stage interrupted while running must not look complete on the next run
+                        self.save(name, None)
+                        running[executor.submit(self.run_stage, stage)] = name
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    if future.exception():
+                        # let the running stages complete, don't start new ones
+                        pending = []
+                        wait(running)
+                        raise future.exception()
+                    outcome[name] = "done"
+                    self.save(name, fingerprints[name])
+        logging.info(f"Pipeline completed in {time.perf_counter() - start:.1f}s")
+        return outcome
+
+    def run_stage(self, stage: PipelineStage):
+        for attempt in range(stage.retries + 1):
+            logging.info(f"Starting stage {stage.name}")
+            start = time.perf_counter()
+            try:
+                stage.run()
+            except TransientError as e:
+                if attempt == stage.retries:
+                    raise
+                logging.warning(f"Stage {stage.name} failed with {e.code}, running it again")
+                continue
+            logging.info(f"Stage {stage.name} completed in {time.perf_counter() - start:.1f}s")
+            return
+
+    def save(self, name: str, fingerprint):
+        """
+        Record the fingerprint of a completed stage, None forgets it
+        """
+        if not self.state_file:
+            return
+        with self._lock:
+            if fingerprint is None:
+                self.state.pop(name, None)
+            else:
+                self.state[name] = fingerprint
+            self.state_file.write_text(json.dumps(self.state, indent=2), encoding="utf-8")
@@ -0,0 +1,85 @@
+import time
+from itertools import islice
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+
+_END = object()
+
+
+class BatchPrefetcher:
+    """
+    Build batches from an iterator in a background thread while the caller consumes them
+      Batches are handed over through a bounded queue, so at most `depth` prepared batches are kept in memory
+      and the producer waits when the consumer falls behind. The time each side spent waiting for the other
+      is tracked in producer_blocked and consumer_blocked (seconds).
+    """
+
+    def __init__(self, parameters_iterator, batch_size, depth=4):
+        """
+        :param parameters_iterator: an iterator of the data to split in batches
+        :param batch_size: the number of items per batch
+        :param depth: the maximum number of prepared batches waiting to be consumed
+        """
+        self.parameters_iterator = iter(parameters_iterator)
+        self.batch_size = batch_size
+        self.queue = Queue(maxsize=max(1, depth))
+        self.producer_blocked = 0.0
+        self.consumer_blocked = 0.0
+        self.producer_busy = 0.0
+        self._stop = Event()
+        self._error = None
+        self._thread = Thread(target=self._produce, daemon=True)
+
+    def _put(self, item):
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                break
+            except Full:
+                continue
+        self.producer_blocked += time.perf_counter() - start
+
+    def _produce(self):
+        try:
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                batch = list(islice(self.parameters_iterator, self.batch_size))
+                self.producer_busy += time.perf_counter() - start
+                if not batch:
+                    break
+                self._put(batch)
+        except Exception as e:
+            self._error = e
+        finally:
+            self._put(_END)
+
+    def __iter__(self):
+        self._thread.start()
+        try:
+            while True:
+                start = time.perf_counter()
+                batch = self.queue.get()
+                self.consumer_blocked += time.perf_counter() - start
+                if batch is _END:
+                    break
+                yield batch
+        finally:
+            self.close()
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        self._stop.set()
+        # unblock a producer waiting on a full queue
+        try:
+            while True:
+                self.queue.get_nowait()
+        except Empty:
+            pass
+        self._thread.join()
+
+    def stats(self):
+        return {"producer_busy": self.producer_busy,
+                "producer_blocked": self.producer_blocked,
+                "consumer_blocked": self.consumer_blocked}
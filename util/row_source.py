@@ -0,0 +1,306 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+class RowSource:
+    """
+    Iterate a DataFrame as query parameter dicts
+      Rows are converted one chunk at a time: each column becomes a numpy object array with the missing
+      values (NaN, NaT, NA) replaced by None, then the arrays are zipped into dicts. This avoids the
+      Series built for every row by DataFrame.iterrows and yields plain Python scalars.
+      dtypes declares the type of some columns, e.g. {"ZIP CODE": str} keeps postal codes as strings
+      instead of floats.
+    """
+
+    def __init__(self, frame: pd.DataFrame, dtypes: dict = None, chunk_size: int = 1000):
+        self.frame = self.enforce_dtypes(frame, dtypes)
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        return len(self.frame)
+
+    def __iter__(self):
+        for records in self.chunks():
+            yield from records
+
+    def chunks(self, chunk_size: int = None):
+        """
+        :param chunk_size: optional number of rows per chunk, defaults to self.chunk_size
+        :return: an iterator of lists of parameter dicts
+        """
+        chunk_size = chunk_size or self.chunk_size
+        for start in range(0, len(self.frame), chunk_size):
+            yield self.to_records(self.frame.iloc[start:start + chunk_size])
+
+    @staticmethod
+    def read_csv(csv_file, dtypes: dict = None, **kwargs) -> pd.DataFrame:
+        """
+        Read csv_file parsing the columns in dtypes with the declared types
+        """
+        return RowSource.enforce_dtypes(pd.read_csv(csv_file, dtype=dtypes, **kwargs), dtypes)
+
+    @staticmethod
+    def enforce_dtypes(frame: pd.DataFrame, dtypes: dict = None) -> pd.DataFrame:
+        """
+        Cast the columns of frame in dtypes, missing values are kept as missing
+          Columns parsed as floats because of missing values (e.g. 60601.0) become integer strings when
+          declared as str.
+        """
+        for column, dtype in (dtypes or {}).items():
+            if column not in frame:
+                continue
+            values = frame[column]
+            if dtype is str:
+                if pd.api.types.is_float_dtype(values) and (values.dropna() % 1 == 0).all():
+                    values = values.astype("Int64")
+                frame[column] = values.astype("string")
+            else:
+                frame[column] = values.astype(dtype)
+        return frame
+
+    @staticmethod
+    def to_records(frame: pd.DataFrame) -> list:
+        columns = list(frame.columns)
+        values = []
+        for _, column in frame.items():
+            array = column.to_numpy(dtype=object, copy=True)
+            missing = column.isna().to_numpy()
+            if missing.any():
+                array[missing] = None
+            values.append(array)
+        return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+class CsvRowSource:
+    """
+    Iterate a csv file (plain or compressed, e.g. .csv.gz or .csv.zst) as query parameter dicts
+      With chunk_rows the file is streamed chunk_rows rows at a time, so memory stays flat whatever the
+      file size; otherwise it's read at once. prepare(frame, first_row) is applied to every chunk read,
+      first_row being the position of the chunk's first row in the file: values derived from it (e.g.
+      RECORD_IDs) are the same whether the file is streamed or not. The Distinct and Group aggregates can be
+      folded from the frames read for the rows, see rows(), so that a streamed file is parsed only once.
+    """
+
+    COMPRESSED_SUFFIXES = [".gz", ".zst", ".bz2", ".xz", ".zip"]
+
+    def __init__(self, csv_file, dtypes: dict = None, prepare=None, chunk_rows: int = None):
+        self.csv_file = csv_file
+        self.dtypes = dtypes
+        self.prepare = prepare or (lambda frame, first_row: frame)
+        self.chunk_rows = chunk_rows
+        self._frame = None
+        self._size = None
+
+    def __len__(self):
+        if self._size is None:
+            if self.chunk_rows:
+                with pd.read_csv(self.csv_file, usecols=[0], chunksize=self.chunk_rows) as reader:
+                    self._size = sum(len(chunk) for chunk in reader)
+            else:
+                self._size = len(next(self.frames()))
+        return self._size
+
+    def __iter__(self):
+        for frame in self.frames():
+            yield from RowSource(frame)
+
+    def frames(self, folds: list = ()):
+        """
+        :param folds: optional Distinct or Group aggregates, every frame is added to them before being yielded
+        :return: an iterator of the prepared DataFrames, a single one when not streaming
+        """
+        if not self.chunk_rows:
+            if self._frame is None:
+                self._frame = self.prepare(RowSource.read_csv(self.csv_file, self.dtypes), 0)
+            for fold in folds:
+                fold.add(self._frame)
+            yield self._frame
+            return
+
+        first_row = 0
+        with pd.read_csv(self.csv_file, dtype=self.dtypes, chunksize=self.chunk_rows) as reader:
+            for chunk in reader:
+                frame = self.prepare(RowSource.enforce_dtypes(chunk, self.dtypes), first_row)
+                for fold in folds:
+                    fold.add(frame)
+                yield frame
+                first_row += len(chunk)
+        self._size = first_row
+
+    def distinct(self, keys: list, attributes: list = None, keep="last") -> RowSource:
+        """
+        Pre-aggregate the rows to the distinct combinations of keys, see Distinct
+        """
+        return self.aggregate(Distinct(keys, attributes, keep))
+
+    def group(self, keys: list, sets: dict, attributes: list = None) -> RowSource:
+        """
+        Pre-aggregate the rows to one row per distinct keys with set-valued columns, see Group
+        """
+        return self.aggregate(Group(keys, sets, attributes))
+
+    def aggregate(self, fold) -> RowSource:
+        """
+        :return: the result of fold once all the frames are added to it
+        """
+        self.rows([fold]).finish()
+        return fold.result()
+
+    def rows(self, folds: list) -> "FoldingRows":
+        """
+        :return: an iterator of the rows, adding every frame read to folds, see FoldingRows
+        """
+        return FoldingRows(self, folds)
+
+    def size_hint(self):
+        """
+        :return: the number of rows when known without reading the file again, None otherwise
+        """
+        if self.chunk_rows and self._size is None:
+            return None
+        return len(self)
+
+    @staticmethod
+    def resolve(csv_file):
+        """
+        :return: csv_file, or its compressed version (e.g. csv_file.gz) when only that one exists
+        """
+        csv_file = Path(csv_file)
+        if csv_file.is_file():
+            return csv_file
+        for suffix in CsvRowSource.COMPRESSED_SUFFIXES:
+            compressed = csv_file.with_name(csv_file.name + suffix)
+            if compressed.is_file():
+                return compressed
+        return csv_file
+
+
+class FoldingRows:
+    """
+    Iterate the rows of a CsvRowSource while adding every frame read to folds
+      The per row stages and the pre-aggregated ones (Distinct, Group) then share a single parse of the file.
+      finish() reads the frames the row iteration didn't reach, e.g. when the per row stages were already
+      complete and skipped, so that the folds always cover the whole file.
+    """
+
+    def __init__(self, source: CsvRowSource, folds: list):
+        self._frames = source.frames(folds)
+        self._rows = iter(())
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while True:
+            row = next(self._rows, None)
+            if row is not None:
+                return row
+            self._rows = iter(RowSource(next(self._frames)))
+
+    def finish(self):
+        for _ in self._frames:
+            pass
+
+
+def fold(distinct, chunk: pd.DataFrame, subset: list = None, keep="first") -> pd.DataFrame:
+    """
+    :return: the rows of distinct and chunk without duplicates, in order of appearance
+    """
+    if distinct is None:
+        return chunk.reset_index(drop=True)
+    return pd.concat([distinct, chunk], ignore_index=True).drop_duplicates(subset, keep=keep)
+
+
+class Distinct:
+    """
+    Pre-aggregate rows to the distinct combinations of keys, frame by frame
+      Meant for dimension nodes (e.g. types, departments) MERGEd by many rows: shipping only the distinct
+      keys makes their writes scale with the cardinality instead of the number of rows. With keep="last"
+      the attributes are the ones of the last row with the same keys, as if every row were SET in order;
+      with keep="first" the rows also keep the order in which their keys first appear.
+    """
+
+    def __init__(self, keys: list, attributes: list = None, keep="last"):
+        """
+        :param keys: the columns identifying the dimension
+        :param attributes: optional columns to ship along with the keys
+        :param keep: "last" or "first", the row kept for each distinct keys
+        """
+        self.keys = keys
+        self.columns = keys + (attributes or [])
+        self.keep = keep
+        self.rows = None
+
+    def add(self, frame: pd.DataFrame):
+        self.rows = fold(self.rows, frame[self.columns].drop_duplicates(self.keys, keep=self.keep), self.keys,
+                         keep=self.keep)
+
+    def result(self) -> RowSource:
+        return RowSource(self.rows if self.rows is not None else pd.DataFrame(columns=self.columns))
+
+
+class Group:
+    """
+    Pre-aggregate rows to one row per distinct keys with set-valued columns, frame by frame
+      Instead of appending the values of every row to a list property, the final lists are computed
+      with a single group-by and each node is written once. Only the distinct (keys, value) pairs are kept
+      between frames, so memory follows the distinct pairs and not the file size.
+    """
+
+    def __init__(self, keys: list, sets: dict, attributes: list = None):
+        """
+        :param keys: the columns identifying the node
+        :param sets: output column -> column, list of columns or callable(frame) returning a Series. The non
+          missing values are collected in a list without duplicates, in order of appearance
+        :param attributes: optional columns to ship along with the keys, taken from the last row with the keys
+        """
+        self.keys = keys
+        self.sets = sets
+        self.attributes = Distinct(keys, attributes)
+        self.values = {name: None for name in sets}
+
+    def add(self, frame: pd.DataFrame):
+        self.attributes.add(frame)
+        for name, columns in self.sets.items():
+            self.values[name] = fold(self.values[name], self.set_values(frame, self.keys, columns).drop_duplicates())
+
+    def result(self) -> RowSource:
+        grouped = self.attributes.result().frame
+        for name, pairs in self.values.items():
+            if pairs is None:
+                grouped[name] = []
+                continue
+            lists = self.collect_lists(pairs, self.keys, name)
+            grouped = grouped.merge(lists, on=self.keys, how="left")
+            grouped[name] = [value if isinstance(value, list) else [] for value in grouped[name]]
+        return RowSource(grouped)
+
+    @staticmethod
+    def collect_lists(pairs: pd.DataFrame, keys: list, name: str) -> pd.DataFrame:
+        """
+        :return: one row per keys of pairs with the list of their values in the `name` column
+        """
+        if pairs.empty:
+            return pairs[keys].assign(**{name: []})
+        # a stable sort by group keeps the order of appearance, splitting avoids a Python call per group
+        codes = pairs.groupby(keys, sort=False, dropna=False).ngroup().to_numpy()
+        order = np.argsort(codes, kind="stable")
+        starts = np.flatnonzero(np.diff(codes[order])) + 1
+        lists = [values.tolist() for values in np.split(pairs["value"].to_numpy(dtype=object)[order], starts)]
+        return pairs[keys].iloc[order[np.r_[0, starts]]].assign(**{name: lists})
+
+    @staticmethod
+    def set_values(frame: pd.DataFrame, keys: list, columns) -> pd.DataFrame:
+        """
+        :return: the keys and the non missing values of columns in a `value` column, row by row
+        """
+        if callable(columns):
+            series = [columns(frame)]
+        elif isinstance(columns, str):
+            series = [frame[columns]]
+        else:
+            series = [frame[column] for column in columns]
+        parts = [frame[keys].assign(value=values) for values in series]
+        return pd.concat(parts).sort_index(kind="stable").dropna(subset=["value"])
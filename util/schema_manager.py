@@ -0,0 +1,144 @@
+"""
+Declarative constraints and indexes
+  Each module declares the constraints and indexes its importers rely on once, as a list of SchemaRule
+  (see unique, node_key, range_index, text_index and fulltext_index). SchemaManager.apply diffs the
+  declaration against SHOW CONSTRAINTS and SHOW INDEXES, creates only the missing rules in a single session,
+  then blocks until every index is online: MERGE stages started before would fall back to label scans.
+"""
+import logging
+import time
+
+
+class SchemaRule:
+    """
+    A constraint or an index as listed by SHOW CONSTRAINTS / SHOW INDEXES
+      Rules are matched on their definition (type, entity type, label and properties) and, when named, on
+      their name: an existing rule with the same name but another definition is reported and left untouched.
+    """
+
+    def __init__(self, category: str, rule_type: str, label: str, properties, name: str = None,
+                 relationship: bool = False):
+        """
+        :param category: CONSTRAINT or INDEX
+        :param rule_type: the type shown by SHOW CONSTRAINTS / SHOW INDEXES, e.g. UNIQUENESS, NODE_KEY, RANGE
+        :param label: the node label or relationship type
+        :param properties: the property names, in order
+        :param name: optional rule name, the server generates one otherwise
+        :param relationship: if the rule is on a relationship type
+        """
+        self.category = category
+        self.rule_type = rule_type
+        self.label = label
+        self.properties = tuple(properties)
+        self.name = name
+        self.entity_type = "RELATIONSHIP" if relationship else "NODE"
+
+    def __repr__(self):
+        return self.statement()
+
+    def pattern(self):
+        return f"()-[e:{self.label}]-()" if self.entity_type == "RELATIONSHIP" else f"(e:{self.label})"
+
+    def statement(self) -> str:
+        name = f"{self.name} " if self.name else ""
+        properties = ", ".join(f"e.{prop}" for prop in self.properties)
+        if self.category == "CONSTRAINT":
+            requirement = "IS NODE KEY" if self.rule_type == "NODE_KEY" else "IS UNIQUE"
+            return f"CREATE CONSTRAINT {name}IF NOT EXISTS FOR {self.pattern()} REQUIRE ({properties}) {requirement}"
+        if self.rule_type == "FULLTEXT":
+            return f"CREATE FULLTEXT INDEX {name}IF NOT EXISTS FOR {self.pattern()} ON EACH [{properties}]"
+        return f"CREATE {self.rule_type} INDEX {name}IF NOT EXISTS FOR {self.pattern()} ON ({properties})"
+
+    def same_definition(self, row: dict) -> bool:
+        # uniqueness constraints are shown as NODE_PROPERTY_UNIQUENESS from Neo4j 5.7
+        row_type = "UNIQUENESS" if row.get("type", "").endswith("UNIQUENESS") else row.get("type")
+        return (row_type == self.rule_type
+                and row.get("entityType") == self.entity_type
+                and list(row.get("labelsOrTypes") or []) == [self.label]
+                and tuple(row.get("properties") or []) == self.properties)
+
+
+def unique(label, *properties, name=None) -> SchemaRule:
+    return SchemaRule("CONSTRAINT", "UNIQUENESS", label, properties, name)
+
+
+def node_key(label, *properties, name=None) -> SchemaRule:
+    return SchemaRule("CONSTRAINT", "NODE_KEY", label, properties, name)
+
+
+def range_index(label, *properties, name=None, relationship=False) -> SchemaRule:
+    return SchemaRule("INDEX", "RANGE", label, properties, name, relationship)
+
+
+def text_index(label, prop, name=None, relationship=False) -> SchemaRule:
+    return SchemaRule("INDEX", "TEXT", label, [prop], name, relationship)
+
+
+def fulltext_index(label, *properties, name=None, relationship=False) -> SchemaRule:
+    return SchemaRule("INDEX", "FULLTEXT", label, properties, name, relationship)
+
+
+class SchemaManager:
+    def __init__(self, driver, database, metrics=None, timeout: int = 3600):
+        """
+        :param driver: the neo4j driver
+        :param database: the database to apply the schema to
+        :param metrics: optional ImportMetrics, the schema stage reports the rules created and the seconds
+          spent waiting for the indexes to populate (index_population_time)
+        :param timeout: seconds to wait for the indexes to come online
+        """
+        self._driver = driver
+        self.database = database
+        self.metrics = metrics
+        self.timeout = timeout
+
+    def apply(self, schema: list, stage: str = "schema") -> list:
+        """
+        Create the rules of schema that don't exist yet and wait for all the indexes to be online
+        :param schema: a list of SchemaRule
+        :param stage: the metrics stage name
+        :return: the rules created
+        """
+        if self.metrics:
+            self.metrics.start_stage(stage)
+        with self._driver.session(database=self.database) as session:
+            missing = self.missing(session, schema)
+            for rule in missing:
+                logging.info(rule.statement())
+                start = time.perf_counter()
+                summary = session.run(rule.statement()).consume()
+                if self.metrics:
+                    self.metrics.record_batch(stage, 1, 0.0, time.perf_counter() - start, [summary])
+            population_time = self.await_indexes(session)
+        if self.metrics:
+            self.metrics.finish_stage(stage, rules_created=len(missing), index_population_time=population_time)
+        return missing
+
+    def missing(self, session, schema: list) -> list:
+        existing = {"CONSTRAINT": session.run("SHOW CONSTRAINTS").data(),
+                    "INDEX": session.run("SHOW INDEXES").data()}
+        missing = []
+        for rule in schema:
+            rows = existing[rule.category]
+            named = [row for row in rows if rule.name and row.get("name") == rule.name]
+            if named and not rule.same_definition(named[0]):
+                logging.warning(f"{rule.category.lower()} {rule.name} exists with another definition, skipping "
+                                f"{rule.statement()}")
+            elif not named and not any(rule.same_definition(row) for row in rows):
+                missing.append(rule)
+        return missing
+
+    def await_indexes(self, session) -> float:
+        """
+        Block until every index is online
+        :return: the seconds waited
+        """
+        start = time.perf_counter()
+        session.run("CALL db.awaitIndexes($timeout)", timeout=self.timeout).consume()
+        failed = session.run("SHOW INDEXES YIELD name, state, failureMessage WHERE state = 'FAILED' "
+                             "RETURN name, failureMessage").data()
+        if failed:
+            raise RuntimeError(f"Index population failed: {failed}")
+        population_time = time.perf_counter() - start
+        logging.info(f"Indexes online after {population_time:.2f}s")
+        return population_time